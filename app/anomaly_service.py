@@ -1,177 +1,436 @@
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
+import asyncio
+import logging
+import os
+import time
 import numpy as np
-from sklearn.ensemble import IsolationForest
-from sklearn.preprocessing import StandardScaler
 from datetime import datetime, timedelta
 import pandas as pd
-from app.config import supabase
+from sklearn.base import clone
+from sklearn.preprocessing import StandardScaler
+from app.config import db, settings
+from app.baseline import (
+    Baseline, get_baseline, get_baseline_sync, refresh_baseline, set_baseline, set_read_only
+)
+from app.coordination import BASELINE_KEY, TrainerLock, TrainingRequests
+from app.category_aggregates import HORIZON, AggregateCache, CategoryAggregates
+from app.category_stats import CategoryStats
+from app.features import fill_zscores, fit_model, new_isolation_forest
+from app.model_registry import ModelRegistry
+from app.model_store import ModelStore
+from app.scoring import FlatForest, ScoringBatch, get_scorer, robust_zscores
+from app.transaction_columns import TransactionColumns
+from app.training import TrainingScheduler
+from app.metrics import SCORED_ROWS, TRAINING_RUNS, register_collector, stage
+from app.log import get_logger, log_event
+
+logger = get_logger(__name__)
 
 class AnomalyDetector:
     def __init__(self):
-        self.isolation_forest = IsolationForest(
-            contamination=0.1,  # Expected proportion of anomalies
-            random_state=42,
-            n_estimators=100
-        )
+        self.isolation_forest = new_isolation_forest()
         self.scaler = StandardScaler()
         self.category_averages = {}
         self.category_std = {}  # Added to store standard deviation
+        # Per-category median and MAD of the training amounts, for robust z-scores
+        self.category_median = {}
+        self.category_mad = {}
         self.trained = False
+        self.user_id = None
+        # Shared detectors (the baseline view) serve many users and are never updated
+        self.shared = False
+        self.trained_at = None
+        self.training_rows = 0
+
+        # Incremental state: running stats split by source, the training
+        # rows in compact columns (features are rebuilt from them on refit)
+        # and rows observed since the last fit
+        self.default_stats = CategoryStats()
+        self.user_stats = CategoryStats()
+        self._history = TransactionColumns.empty()
+        # Shared features of the baseline rows _history starts with, when known
+        self._baseline_features = None
+        self._pending_rows = []
+        self._fit_averages = {}
+        self._fit_std = {}
+        self.rows_since_fit = 0
+        self.stale = False
+        # mtime of the store snapshot this detector was loaded from, and when
+        # a read-only worker last checked it for a newer one
+        self.snapshot_mtime = None
+        self.checked_at = 0.0
+        self._refitting = False
+        # Which aggregate cache entry, at which version, user_stats came from
+        self._aggregates_key = None
+        # Flat-array copy of the forest, rebuilt whenever the forest is replaced
+        self._flat_forest = None
+        self._flat_source = None
         
-    def _fetch_user_data(self, user_id: str) -> pd.DataFrame:
+    def _fetch_user_data(self, user_id: str) -> TransactionColumns:
         """Fetch historical transaction data for specific user"""
         try:
             six_months_ago = (datetime.now() - timedelta(days=180)).isoformat()
             
-            response = supabase.table('transactions')\
-                .select('*')\
+            response = db.client.table('transactions')\
+                .select('amount, category, date')\
                 .eq('user_id', user_id)\
                 .gte('date', six_months_ago)\
                 .execute()
                 
-            if not response.data:
-                return pd.DataFrame()
-                
-            return pd.DataFrame(response.data)
-        except Exception as e:
-            print(f"Error fetching user data: {str(e)}")
-            return pd.DataFrame()
-    
-    def _fetch_default_data(self) -> pd.DataFrame:
-        """Fetch default transaction data from Supabase"""
-        try:
-            response = supabase.table('default_transactions')\
-                .select('*')\
-                .execute()
-                
-            if not response.data:
-                return pd.DataFrame()
-                
-            return pd.DataFrame(response.data)
+            return TransactionColumns.from_rows(response.data or [])
         except Exception as e:
-            print(f"Error fetching default data: {str(e)}")
-            return pd.DataFrame()
-        
-    def _prepare_features(self, df: pd.DataFrame) -> np.ndarray:
-        """Prepare features for anomaly detection"""
-        if df.empty:
-            return np.array([])
-            
-        # Calculate category statistics
-        category_stats = df.groupby('category')['amount'].agg(['mean', 'std']).to_dict('index')
-        self.category_averages = {k: v['mean'] for k, v in category_stats.items()}
-        self.category_std = {k: v['std'] for k, v in category_stats.items()}
-        
-        # Create features
-        features = []
-        for _, row in df.iterrows():
-            category_avg = self.category_averages.get(row['category'], row['amount'])
-            category_std = self.category_std.get(row['category'], row['amount'] * 0.1)  # Default 10% if no std
-            
-            # Calculate z-score
-            z_score = (row['amount'] - category_avg) / category_std if category_std > 0 else 0
-            
-            date = pd.to_datetime(row['date'])
-            day_of_week = date.dayofweek
-            day_of_month = date.day
-            
-            feature_vector = [
-                z_score,
-                row['amount'],
-                day_of_week / 7,
-                day_of_month / 31
-            ]
-            features.append(feature_vector)
-            
-        return np.array(features)
+            log_event(logger, "user_data_fetch_failed", level=logging.ERROR, user_id=user_id, error=str(e))
+            return TransactionColumns.empty()
         
+    def _prepare_training(self, baseline: Baseline, user_rows: TransactionColumns) -> bool:
+        """Combine the shared baseline with the user's history into the training rows and statistics"""
+        self._history = baseline.columns.concat(user_rows)
+        # The history starts with the baseline rows, whose features are cached
+        self._baseline_features = baseline.features()
+        self._pending_rows = []
+
+        if len(self._history) == 0:
+            log_event(logger, "no_training_data", level=logging.WARNING, user_id=self.user_id)
+            return False
+
+        # Calculate category statistics over default and user data combined
+        self.default_stats = baseline.stats
+        self.user_stats = user_rows.stats()
+        combined = self.default_stats.merged(self.user_stats)
+        self.category_averages = combined.means()
+        self.category_std = combined.stds()
+        return True
+
+    def _fit_args(self, scaler: StandardScaler, isolation_forest, averages: Dict[str, float], stds: Dict[str, float]) -> tuple:
+        """Arguments of :func:`fit_detector` for the current training rows"""
+        return (
+            scaler, isolation_forest, self._history, averages, stds, self._baseline_features,
+            settings.SCORING_FLAT_FOREST
+        )
+
+    def _mark_fitted(self, fitted: tuple, averages: Dict[str, float], stds: Dict[str, float], pending: int = 0):
+        """Swap in a :func:`fit_detector` result and record the statistics it was fitted with"""
+        self.scaler, self.isolation_forest, self.category_median, self.category_mad, flat_forest = fitted
+        if flat_forest is not None:
+            self._flat_forest, self._flat_source = flat_forest, self.isolation_forest
+        self._fit_averages = averages
+        self._fit_std = stds
+        self.rows_since_fit = pending
+        self.stale = pending >= settings.REFIT_ROW_THRESHOLD
+        self.trained = True
+        self.trained_at = datetime.utcnow()
+        self.training_rows = len(self._history)
+
+    def to_snapshot(self) -> Dict[str, Any]:
+        """Fitted state for the model store"""
+        return {
+            'user_id': self.user_id,
+            'isolation_forest': self.isolation_forest,
+            'scaler': self.scaler,
+            'category_averages': self.category_averages,
+            'category_std': self.category_std,
+            'category_median': self.category_median,
+            'category_mad': self.category_mad,
+            'training_rows': self.training_rows,
+            'trained_at': self.trained_at.isoformat(),
+            'default_stats': self.default_stats,
+            'user_stats': self.user_stats,
+            'history': self._history,
+            'pending_rows': list(self._pending_rows),
+            'fit_averages': self._fit_averages,
+            'fit_std': self._fit_std
+        }
+
+    @classmethod
+    def from_baseline(cls, baseline: Baseline) -> 'AnomalyDetector':
+        """Read-only detector over the baseline, for users without a model yet.
+
+        Without a baseline forest (``isolation_forest`` is None) it scores
+        with the baseline's category statistics alone.
+        """
+        detector = cls()
+        detector.scaler = baseline.scaler
+        detector.isolation_forest = baseline.isolation_forest
+        detector.category_averages = baseline.category_averages
+        detector.category_std = baseline.category_std
+        detector.category_median, detector.category_mad = baseline.columns.robust_stats()
+        detector.shared = True
+        detector.trained = True
+        detector.trained_at = baseline.loaded_at
+        detector.training_rows = baseline.rows
+        return detector
+
+    @classmethod
+    def from_snapshot(cls, state: Dict[str, Any]) -> 'AnomalyDetector':
+        """Rebuild a fitted detector from :meth:`to_snapshot` output"""
+        detector = cls()
+        detector.user_id = state['user_id']
+        detector.isolation_forest = state['isolation_forest']
+        detector.scaler = state['scaler']
+        detector.category_averages = state['category_averages']
+        detector.category_std = state['category_std']
+        detector.default_stats = state['default_stats']
+        detector.user_stats = state['user_stats']
+        # May hold read-only memory maps; refits only ever build new arrays from them
+        detector._history = state['history']
+        if 'category_median' in state:
+            detector.category_median = state['category_median']
+            detector.category_mad = state['category_mad']
+        else:
+            detector.category_median, detector.category_mad = detector._history.robust_stats()
+        detector._prepare_scoring()
+        detector._pending_rows = state['pending_rows']
+        detector._fit_averages = state['fit_averages']
+        detector._fit_std = state['fit_std']
+        detector.rows_since_fit = len(detector._pending_rows)
+        detector.stale = detector.rows_since_fit >= settings.REFIT_ROW_THRESHOLD
+        detector.trained = True
+        detector.trained_at = datetime.fromisoformat(state['trained_at'])
+        detector.training_rows = state['training_rows']
+        return detector
+
     def train(self, user_id: str):
         """Train the anomaly detector on combined default and historical data"""
-        # Fetch both default and user-specific data
-        default_df = self._fetch_default_data()
-        user_df = self._fetch_user_data(user_id)
-        
-        # Combine the datasets
-        combined_df = pd.concat([default_df, user_df], ignore_index=True)
-        
-        if combined_df.empty:
-            print("No training data available")
-            return False
-            
-        # Prepare features from combined data
-        features = self._prepare_features(combined_df)
-        if len(features) == 0:
+        self.user_id = user_id
+
+        # Shared default baseline plus user-specific data
+        baseline = get_baseline_sync()
+        user_rows = self._fetch_user_data(user_id)
+
+        if not self._prepare_training(baseline, user_rows):
             return False
-            
+
         # Fit scaler and model
-        self.scaler.fit(features)
-        normalized_features = self.scaler.transform(features)
-        self.isolation_forest.fit(normalized_features)
-        self.trained = True
-        
+        averages, stds = dict(self.category_averages), dict(self.category_std)
+        self._mark_fitted(fit_detector(*self._fit_args(self.scaler, self.isolation_forest, averages, stds)), averages, stds)
+
         return True
-        
+
+    async def train_async(self, user_id: str) -> bool:
+        """Train without blocking the event loop.
+
+        The user's history is fetched and combined with the baseline on the
+        database thread pool while the shared baseline loads (first use
+        only); featurizing, the model fit and the scoring state are built
+        on the training pool.
+        """
+        self.user_id = user_id
+        baseline, user_rows = await asyncio.gather(
+            get_baseline(),
+            db.run_blocking(self._fetch_user_data, user_id)
+        )
+
+        if not await db.run_blocking(self._prepare_training, baseline, user_rows):
+            return False
+
+        averages, stds = dict(self.category_averages), dict(self.category_std)
+        fitted = await db.run_cpu_bound(fit_detector, *self._fit_args(self.scaler, self.isolation_forest, averages, stds))
+        self._mark_fitted(fitted, averages, stds)
+
+        return True
+
+    def sync_statistics(self, aggregates: CategoryAggregates):
+        """Take the user's category statistics from their rolling 180-day aggregates.
+
+        A no-op while the aggregates are unchanged; otherwise O(categories).
+        """
+        if not self.trained or self.shared:
+            return
+        key = (id(aggregates), aggregates.version)
+        if key == self._aggregates_key:
+            return
+        self.user_stats = aggregates.stats()
+        combined = self.default_stats.merged(self.user_stats)
+        self.category_averages = combined.means()
+        self.category_std = combined.stds()
+        self._aggregates_key = key
+
+    def observe(self, transaction: Dict[str, Any], aggregates: CategoryAggregates):
+        """Fold a newly stored transaction into the category statistics.
+
+        The statistics are re-read from the user's ``aggregates``, which
+        already hold the transaction. Flags the detector as ``stale`` once
+        enough rows have arrived since the last fit or the category mean has
+        drifted from the fitted one.
+        """
+        if not self.trained or self.shared:
+            return
+
+        category = transaction['category']
+        self.sync_statistics(aggregates)
+
+        self._pending_rows.append({
+            'amount': float(transaction['amount']), 'category': category, 'date': transaction['date']
+        })
+        self.rows_since_fit += 1
+        if self.rows_since_fit >= settings.REFIT_ROW_THRESHOLD or self._drifted(category):
+            self.stale = True
+
+    def _drifted(self, category: str) -> bool:
+        """Whether a category mean moved too far from the one the model saw"""
+        fit_avg = self._fit_averages.get(category)
+        if fit_avg is None:
+            return True
+        fit_std = self._fit_std.get(category)
+        current = self.category_averages.get(category)
+        # No rows left in the window to compare with
+        if current is None or not fit_std > 0:
+            return False
+        drift = abs(current - fit_avg) / fit_std
+        return drift > settings.REFIT_DRIFT_THRESHOLD
+
+    def _append_pending(self, pending: List[Dict[str, Any]]) -> TransactionColumns:
+        """The cached training rows plus rows observed since the last fit (blocking)"""
+        if not pending:
+            return self._history
+        return self._history.concat(TransactionColumns.from_rows(pending))
+
+    async def refit_async(self) -> bool:
+        """Refit from the cached training matrix plus observed rows.
+
+        Runs without touching Supabase. The current model keeps serving
+        until the new one is swapped in.
+        """
+        if self._refitting or not self.trained or self.shared:
+            return False
+
+        self._refitting = True
+        try:
+            averages = dict(self.category_averages)
+            stds = dict(self.category_std)
+            pending, self._pending_rows = self._pending_rows, []
+            self._history = await db.run_blocking(self._append_pending, pending)
+            with stage('refit'):
+                fitted = await db.run_cpu_bound(
+                    fit_detector, *self._fit_args(clone(self.scaler), clone(self.isolation_forest), averages, stds)
+                )
+            self._mark_fitted(fitted, averages, stds, pending=len(self._pending_rows))
+        except Exception:
+            TRAINING_RUNS.inc(kind='refit', outcome='error')
+            raise
+        finally:
+            self._refitting = False
+
+        TRAINING_RUNS.inc(kind='refit', outcome='ok')
+
+        await save_detector(self)
+        return True
+
     def analyze_transaction(self, transaction: Dict[str, Any]) -> Dict[str, Any]:
         """Analyze a single transaction for anomalies"""
-        user_id = transaction['user_id']
-        
-        # Train model if not already trained
+        return self.analyze_transactions([transaction])[0]
+
+    def analyze_transactions(self, transactions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Analyze a batch of one user's transactions with a single model pass"""
+        if not transactions:
+            return []
+
+        # Training happens in the background scheduler, never on the request path
         if not self.trained:
-            self.train(user_id)
-            
-        # Get category statistics
-        category_avg = self.category_averages.get(transaction['category'], transaction['amount'])
-        category_std = self.category_std.get(transaction['category'], transaction['amount'] * 0.25)
-        
-        # Calculate z-score
-        z_score = (transaction['amount'] - category_avg) / category_std if category_std > 0 else 0
-        
-        date = pd.to_datetime(transaction['date'])
-        day_of_week = date.dayofweek
-        day_of_month = date.day
-        
-        features = np.array([[
-            z_score,
-            transaction['amount'],
-            day_of_week / 7,
-            day_of_month / 31
-        ]])
-        
-        # Normalize features
-        normalized_features = self.scaler.transform(features)
-        
-        # Get anomaly score
-        anomaly_score = self.isolation_forest.score_samples(normalized_features)[0]
-        
-        # Convert to probability-like score (0-100)
-        confidence_score = (1 - (anomaly_score + 0.5)) * 100
-        
-        # Determine if transaction is anomalous based on z-score and confidence_score
-        is_anomaly = False
-        
-        # Use z-score for initial anomaly detection
-        if abs(z_score) <= 2:  # Within 2 standard deviations
-            is_anomaly = False
-        else:
-            # If outside normal range, check confidence score
-            is_anomaly = confidence_score > 70
-        
-        # Generate insights
-        insights = self._generate_insights(
-            transaction,
-            category_avg,
-            category_std,
-            z_score,
-            day_of_week,
-            day_of_month
+            raise RuntimeError("Anomaly detector is not trained")
+
+        with stage('feature_build'):
+            features, contexts, robust_z = self._transaction_features(transactions)
+
+        # Clear cases are settled statistically; only the rest reach the forest
+        with stage('scoring'):
+            batch = get_scorer().score(self, features, robust_z)
+        for tier, count in zip(*np.unique(batch.tier, return_counts=True)):
+            SCORED_ROWS.inc(int(count), tier=tier)
+
+        with stage('insights'):
+            return self._build_results(transactions, batch, contexts)
+
+    def _prepare_scoring(self):
+        # Flattened up front, so the registry counts it and requests do not wait for it
+        if settings.SCORING_FLAT_FOREST:
+            self.flat_forest()
+
+    def flat_forest(self) -> FlatForest:
+        """The current forest flattened for fast scoring, built on first use"""
+        if self._flat_source is not self.isolation_forest:
+            self._flat_forest = FlatForest(self.isolation_forest)
+            self._flat_source = self.isolation_forest
+        return self._flat_forest
+
+    def _transaction_features(self, transactions: List[Dict[str, Any]]):
+        """Feature rows for incoming transactions plus the context used for insights.
+
+        Built column by column, so a large batch costs a few array passes
+        rather than a Python loop per row.
+        """
+        count = len(transactions)
+        amounts = np.fromiter((t['amount'] for t in transactions), dtype=np.float64, count=count)
+        categories = pd.Series([t['category'] for t in transactions], dtype=object)
+        dates = pd.DatetimeIndex(pd.to_datetime([t['date'] for t in transactions], format='mixed'))
+
+        # Categories without statistics fall back to the amount itself, with a
+        # quarter of it as the spread
+        row_avg = np.where(
+            categories.isin(list(self.category_averages)),
+            categories.map(self.category_averages).to_numpy(dtype=np.float64),
+            amounts
         )
-        
-        return {
-            'is_anomaly': is_anomaly,
-            'confidence_score': confidence_score,
-            'insights': insights
-        }
-        
+        row_std = np.where(
+            categories.isin(list(self.category_std)),
+            categories.map(self.category_std).to_numpy(dtype=np.float64),
+            amounts * 0.25
+        )
+        robust_z = robust_zscores(
+            amounts,
+            categories.map(self.category_median).to_numpy(dtype=np.float64),
+            categories.map(self.category_mad).to_numpy(dtype=np.float64)
+        )
+        day_of_week = dates.dayofweek.to_numpy()
+        day_of_month = dates.day.to_numpy()
+
+        features = np.empty((count, 4), dtype=np.float64)
+        fill_zscores(features[:, 0], amounts, row_avg, row_std)
+        features[:, 1] = amounts
+        features[:, 2] = day_of_week / 7
+        features[:, 3] = day_of_month / 31
+
+        contexts = list(zip(
+            row_avg.tolist(),
+            row_std.tolist(),
+            features[:, 0].tolist(),
+            day_of_week.tolist(),
+            day_of_month.tolist()
+        ))
+        return features, contexts, robust_z
+
+    def _build_results(
+        self,
+        transactions: List[Dict[str, Any]],
+        batch: ScoringBatch,
+        contexts: List[tuple]
+    ) -> List[Dict[str, Any]]:
+        """Turn tier decisions into flags, confidence scores and insights"""
+        results = []
+        for transaction, is_anomaly, confidence_score, tier, context in zip(
+            transactions, batch.is_anomaly.tolist(), batch.confidence.tolist(), batch.tier.tolist(), contexts
+        ):
+            category_avg, category_std, z_score, day_of_week, day_of_month = context
+
+            # Generate insights
+            insights = self._generate_insights(
+                transaction,
+                category_avg,
+                category_std,
+                z_score,
+                day_of_week,
+                day_of_month
+            )
+
+            results.append({
+                'is_anomaly': is_anomaly,
+                'confidence_score': confidence_score,
+                'tier': tier,
+                'insights': insights
+            })
+
+        return results
+
     def _generate_insights(
         self,
         transaction: Dict[str, Any],
@@ -212,12 +471,353 @@ class AnomalyDetector:
             'category_avg': category_avg
         }
 
-# Singleton instance
-_detector = None
+def fit_detector(
+    scaler: StandardScaler,
+    isolation_forest,
+    history: TransactionColumns,
+    averages: Dict[str, float],
+    stds: Dict[str, float],
+    head: Optional[np.ndarray],
+    flat: bool
+) -> tuple:
+    """Featurize the training rows, fit the model and build its scoring state.
+
+    Returns the fitted scaler and forest, the per-category median and MAD,
+    and the flattened forest (None unless ``flat``). Kept at module level so
+    all of it runs on the training pool rather than the event loop.
+    """
+    features = history.features(averages, stds, head=head)
+    scaler, isolation_forest = fit_model(scaler, isolation_forest, features)
+    medians, mads = history.robust_stats()
+    return scaler, isolation_forest, medians, mads, FlatForest(isolation_forest) if flat else None
+
+def anomaly_record(transaction_id: Any, analysis: Dict[str, Any]) -> Dict[str, Any]:
+    """Row for the anomaly_results table.
+
+    The deciding tier is kept in the insights, since it sets the scale of
+    ``confidence_score``.
+    """
+    return {
+        'transaction_id': transaction_id,
+        'is_anomaly': bool(analysis['is_anomaly']),  # Ensure Python bool
+        'confidence_score': float(analysis['confidence_score']),  # Ensure Python float
+        'insights': {**analysis['insights'], 'scoring_tier': analysis['tier']},
+        'detected_at': datetime.utcnow().isoformat()
+    }
+
+# Fitted detectors, one per user
+_registry = ModelRegistry(
+    max_bytes=settings.MODEL_REGISTRY_MAX_BYTES,
+    max_models=settings.MODEL_REGISTRY_MAX_MODELS
+)
+
+def _open_store() -> Optional[ModelStore]:
+    if not settings.MODEL_STORE_DIR:
+        return None
+    try:
+        return ModelStore(settings.MODEL_STORE_DIR, mmap=settings.MODEL_STORE_MMAP)
+    except OSError as e:
+        # e.g. a read-only filesystem on serverless runtimes: serve without persistence
+        log_event(logger, "model_store_disabled", level=logging.WARNING, directory=settings.MODEL_STORE_DIR, error=str(e))
+        return None
+
+# On-disk snapshots so fitted models survive restarts
+_store = _open_store()
+
+def _fetch_category_aggregates(user_id: str) -> CategoryAggregates:
+    """Build a user's rolling aggregates from their recent transactions (blocking)"""
+    since = (datetime.now() - timedelta(days=HORIZON)).date().isoformat()
+    rows = db.client.table('transactions')\
+        .select('amount, category, date')\
+        .eq('user_id', user_id)\
+        .gte('date', since)\
+        .execute().data or []
+    return CategoryAggregates.from_rows(rows)
+
+async def _load_category_aggregates(user_id: str) -> CategoryAggregates:
+    with stage('aggregates_load'):
+        return await db.run_blocking(_fetch_category_aggregates, user_id)
+
+# Rolling per-category aggregates, one entry per user
+_aggregates = AggregateCache(
+    _load_category_aggregates,
+    max_users=settings.AGGREGATE_CACHE_MAX_USERS,
+    ttl=settings.AGGREGATE_CACHE_TTL,
+    max_bytes=settings.AGGREGATE_CACHE_MAX_BYTES
+)
+
+async def get_category_aggregates(user_id: str) -> CategoryAggregates:
+    """A user's rolling 7/30/180-day category aggregates, loaded on first use"""
+    return await _aggregates.get(user_id)
+
+def get_model_registry() -> ModelRegistry:
+    """Get the process-wide per-user model registry"""
+    return _registry
+
+def get_model_store() -> Optional[ModelStore]:
+    """Get the model snapshot store, if persistence is enabled"""
+    return _store
+
+def load_detector(user_id: str) -> Optional[AnomalyDetector]:
+    """Load a user's detector snapshot from disk (blocking)"""
+    if _store is None:
+        return None
+    mtime = _store.mtime(user_id)
+    state = _store.load(user_id)
+    if state is None:
+        return None
+    detector = AnomalyDetector.from_snapshot(state)
+    detector.snapshot_mtime = mtime
+    detector.checked_at = time.monotonic()
+    return detector
+
+async def save_detector(detector: AnomalyDetector):
+    """Snapshot a fitted detector to disk off the event loop"""
+    if _store is None or not detector.trained or detector.user_id is None:
+        return
+    try:
+        await db.run_blocking(
+            _store.save,
+            detector.user_id,
+            detector.to_snapshot(),
+            {'training_rows': detector.training_rows, 'trained_at': detector.trained_at.isoformat()}
+        )
+    except Exception as e:
+        log_event(logger, "model_snapshot_save_failed", level=logging.ERROR, user_id=detector.user_id, error=str(e))
+
+async def prewarm_detectors(limit: int) -> int:
+    """Load the most recently updated snapshots into the registry"""
+    if _store is None or limit <= 0:
+        return 0
+    loaded = 0
+    for user_id in await db.run_blocking(_store.recent_users, limit):
+        detector = await db.run_blocking(load_detector, user_id)
+        if detector is not None:
+            _registry.put(user_id, detector)
+            loaded += 1
+    return loaded
+
+# Background training with bounded concurrency
+_scheduler = TrainingScheduler(
+    concurrency=settings.TRAINING_CONCURRENCY,
+    max_queue=settings.TRAINING_QUEUE_SIZE
+)
+
+def get_training_scheduler() -> TrainingScheduler:
+    """Get the process-wide training scheduler"""
+    return _scheduler
+
+async def _train_user(user_id: str) -> Optional[AnomalyDetector]:
+    """Training job: fit a user's detector, snapshot it and publish it"""
+    detector = AnomalyDetector()
+    try:
+        with stage('train'):
+            trained = await detector.train_async(user_id)
+    except Exception:
+        TRAINING_RUNS.inc(kind='initial', outcome='error')
+        raise
+    if not trained:
+        TRAINING_RUNS.inc(kind='initial', outcome='no_data')
+        return None
+    TRAINING_RUNS.inc(kind='initial', outcome='ok')
+    await save_detector(detector)
+    _registry.put(user_id, detector)
+    return detector
+
+def schedule_training(user_id: str) -> Optional[asyncio.Future]:
+    """Queue a training job for a user; None when the queue is full.
+
+    Read-only workers hand the request to the trainer and also return None.
+    """
+    if not is_trainer():
+        _request_training(user_id)
+        return None
+    try:
+        return _scheduler.submit(user_id, lambda: _train_user(user_id))
+    except asyncio.QueueFull:
+        log_event(logger, "training_queue_full", level=logging.WARNING, user_id=user_id, kind='initial')
+        return None
+
+def schedule_refit(detector: AnomalyDetector) -> None:
+    """Queue an incremental refit for a stale detector"""
+    if detector.shared or detector.user_id is None:
+        return
+    if not is_trainer():
+        # The trainer retrains from Supabase, which already has the new rows
+        _request_training(detector.user_id)
+        return
+    try:
+        _scheduler.submit(detector.user_id, detector.refit_async)
+    except asyncio.QueueFull:
+        log_event(logger, "training_queue_full", level=logging.WARNING, user_id=detector.user_id, kind='refit')
+
+# Read-only detector over the current baseline forest
+_baseline_detector: Optional[AnomalyDetector] = None
+
+async def get_baseline_detector() -> AnomalyDetector:
+    """Detector over the shared baseline: its forest, or its statistics when none is fitted"""
+    global _baseline_detector
+    baseline = await get_baseline()
+    if _baseline_detector is None or _baseline_detector.trained_at != baseline.loaded_at:
+        _baseline_detector = AnomalyDetector.from_baseline(baseline)
+    return _baseline_detector
+
+async def get_anomaly_detector(user_id: str) -> AnomalyDetector:
+    """Get the detector to score a user's transactions with.
+
+    Prefers the user's fitted model from the registry, then from its on-disk
+    snapshot. Otherwise training is queued in the background and the shared
+    baseline detector (``shared`` is set) serves in the meantime, with the
+    statistics alone when no baseline forest exists; requests never wait
+    for training. In multi-worker mode read-only workers reload a cached
+    detector once the trainer has published a newer snapshot of it.
+    """
+    cached = _registry.get(user_id)
+    if cached is not None and (is_trainer() or not await _snapshot_changed(cached)):
+        return cached
+
+    detector = await db.run_blocking(load_detector, user_id)
+    if detector is not None:
+        _registry.put(user_id, detector)
+        return detector
+    if cached is not None:
+        return cached
+
+    schedule_training(user_id)
+    return await get_baseline_detector()
+
+# Multi-worker mode: the worker holding the trainer lock fits every model and
+# publishes it to the model store; the other workers only load snapshots
+_multi_worker = settings.MULTI_WORKER and _store is not None
+_trainer_lock = TrainerLock(os.path.join(settings.MODEL_STORE_DIR, 'trainer.lock')) if _multi_worker else None
+_requests = TrainingRequests(os.path.join(settings.MODEL_STORE_DIR, 'requests')) if _multi_worker else None
+_coordinator: Optional[asyncio.Task] = None
+_baseline_mtime: Optional[float] = None
+
+def is_trainer() -> bool:
+    """Whether this process fits models; always true outside multi-worker mode"""
+    return _trainer_lock is None or _trainer_lock.held
+
+def multi_worker() -> bool:
+    return _multi_worker
+
+def _request_training(key: str) -> None:
+    try:
+        _requests.submit(key)
+    except OSError as e:
+        log_event(logger, "training_request_failed", level=logging.ERROR, key=key, error=str(e))
+
+def request_baseline_refresh() -> None:
+    """Ask the trainer to reload and republish the shared baseline"""
+    _request_training(BASELINE_KEY)
+
+async def _snapshot_changed(detector: AnomalyDetector) -> bool:
+    """Whether the trainer published a newer snapshot (checked at most every few seconds)"""
+    now = time.monotonic()
+    if detector.user_id is None or now - detector.checked_at < settings.MODEL_STORE_REFRESH_SECONDS:
+        return False
+    detector.checked_at = now
+    mtime = await db.run_blocking(_store.mtime, detector.user_id)
+    return mtime is not None and mtime != detector.snapshot_mtime
+
+async def publish_baseline() -> Baseline:
+    """Refresh the shared baseline; in multi-worker mode also publish it to the store"""
+    global _baseline_mtime
+    baseline = await refresh_baseline()
+    if _multi_worker and baseline.rows:
+        await db.run_blocking(_store.save_baseline, baseline.to_snapshot(), {'rows': baseline.rows})
+        _baseline_mtime = await db.run_blocking(_store.baseline_mtime)
+    return baseline
+
+async def _load_shared_baseline() -> bool:
+    """Swap in the baseline published by the trainer if it changed"""
+    global _baseline_mtime
+    mtime = await db.run_blocking(_store.baseline_mtime)
+    if mtime is None or mtime == _baseline_mtime:
+        return False
+    state = await db.run_blocking(_store.load_baseline)
+    if state is None:
+        return False
+    set_baseline(Baseline.from_snapshot(state))
+    _baseline_mtime = mtime
+    return True
+
+async def _become_trainer():
+    set_read_only(False)
+    log_event(logger, "trainer_elected", pid=os.getpid())
+    await publish_baseline()
+
+async def _drain_training_requests():
+    """Queue the fits read-only workers asked for"""
+    for key in await db.run_blocking(_requests.pending):
+        if key == BASELINE_KEY:
+            try:
+                _scheduler.submit(BASELINE_KEY, publish_baseline)
+            except asyncio.QueueFull:
+                break
+        elif schedule_training(key) is None:
+            break
+        await db.run_blocking(_requests.remove, key)
+
+async def _coordinate():
+    while True:
+        await asyncio.sleep(settings.MODEL_STORE_POLL_SECONDS)
+        try:
+            # Take over if the trainer process has gone away
+            if not _trainer_lock.held and await db.run_blocking(_trainer_lock.acquire):
+                await _become_trainer()
+            if _trainer_lock.held:
+                await _drain_training_requests()
+            else:
+                await _load_shared_baseline()
+        except Exception as e:
+            log_event(logger, "coordination_failed", level=logging.ERROR, error=str(e))
+
+async def start_coordination():
+    """Elect the trainer among the workers and load or publish the shared baseline"""
+    global _coordinator
+    if not _multi_worker or _coordinator is not None:
+        return
+    set_read_only(True)
+    if await db.run_blocking(_trainer_lock.acquire):
+        await _become_trainer()
+    elif not await _load_shared_baseline():
+        # Nothing published yet; serve statistics only until the trainer does
+        await refresh_baseline()
+    _coordinator = asyncio.create_task(_coordinate(), name="worker-coordinator")
+
+async def stop_coordination():
+    global _coordinator
+    if _coordinator is None:
+        return
+    _coordinator.cancel()
+    await asyncio.gather(_coordinator, return_exceptions=True)
+    _coordinator = None
+    _trainer_lock.release()
+
+def _collect_metrics():
+    """Registry, aggregate cache and training scheduler gauges for /metrics"""
+    registry = _registry.stats()
+    yield ('finalyze_model_registry_hits_total', 'counter', 'Model registry lookups served from memory', {}, registry['hits'])
+    yield ('finalyze_model_registry_misses_total', 'counter', 'Model registry lookups that missed', {}, registry['misses'])
+    yield ('finalyze_model_registry_evictions_total', 'counter', 'Models evicted from the registry', {}, registry['evictions'])
+    yield ('finalyze_model_registry_models', 'gauge', 'Models held in the registry', {}, registry['models'])
+    yield ('finalyze_model_registry_bytes', 'gauge', 'Estimated bytes held by the registry', {}, registry['bytes'])
+
+    aggregates = _aggregates.stats()
+    yield ('finalyze_aggregate_cache_users', 'gauge', 'Users with category aggregates in memory', {}, aggregates['users'])
+    yield ('finalyze_aggregate_cache_bytes', 'gauge', 'Bytes held by category aggregates', {}, aggregates['bytes'])
+    yield ('finalyze_aggregate_cache_hits_total', 'counter', 'Category aggregate lookups served from memory', {}, aggregates['hits'])
+    yield ('finalyze_aggregate_cache_misses_total', 'counter', 'Category aggregate lookups that loaded from Supabase', {}, aggregates['misses'])
+    yield ('finalyze_aggregate_cache_evictions_total', 'counter', 'Users dropped from the category aggregate cache', {}, aggregates['evictions'])
+
+    scheduler = _scheduler.stats()
+    yield ('finalyze_training_queue_depth', 'gauge', 'Training jobs waiting for a worker', {}, scheduler['queued'])
+    yield ('finalyze_training_running', 'gauge', 'Training jobs currently running', {}, scheduler['running'])
+    yield ('finalyze_training_deduplicated_total', 'counter', 'Training submissions merged into a pending job', {}, scheduler['deduplicated'])
+    yield ('finalyze_training_rejected_total', 'counter', 'Training submissions rejected by a full queue', {}, scheduler['rejected'])
+    yield ('finalyze_worker_trainer', 'gauge', 'Whether this process fits models', {'pid': str(os.getpid())}, int(is_trainer()))
+    if _requests is not None:
+        yield ('finalyze_training_requests_pending', 'gauge', 'Training requests from read-only workers', {}, len(_requests))
 
-def get_anomaly_detector() -> AnomalyDetector:
-    """Get or create the singleton anomaly detector instance"""
-    global _detector
-    if _detector is None:
-        _detector = AnomalyDetector()
-    return _detector
\ No newline at end of file
+register_collector(_collect_metrics)
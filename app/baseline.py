@@ -0,0 +1,181 @@
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, Optional
+
+import numpy as np
+from sklearn.ensemble import IsolationForest
+from sklearn.preprocessing import StandardScaler
+
+from app.category_stats import CategoryStats
+from app.config import db, settings
+from app.features import fit_model, new_isolation_forest
+from app.log import get_logger, log_event
+from app.transaction_columns import TransactionColumns
+
+logger = get_logger(__name__)
+
+
+class Baseline:
+    """Precomputed view of ``default_transactions``, shared by every user.
+
+    Holds the default rows in compact columns, their per-category
+    accumulators, their statistics-independent feature columns (built once,
+    on first use), and optionally a scaler and forest fitted on the default
+    data alone.
+    """
+
+    def __init__(
+        self,
+        columns: TransactionColumns,
+        stats: CategoryStats,
+        category_averages: Dict[str, float],
+        category_std: Dict[str, float]
+    ):
+        self.columns = columns
+        self.stats = stats
+        self.category_averages = category_averages
+        self.category_std = category_std
+        self.scaler: Optional[StandardScaler] = None
+        self.isolation_forest: Optional[IsolationForest] = None
+        self.loaded_at = datetime.utcnow()
+        self._features: Optional[np.ndarray] = None
+
+    @property
+    def rows(self) -> int:
+        return len(self.columns)
+
+    def features(self) -> np.ndarray:
+        """Amount and date feature columns of the default rows, with z-scores left at 0.
+
+        Shared read-only by every detector: training only re-featurizes the
+        user's own rows and refills the z-score column.
+        """
+        if self._features is None:
+            features = self.columns.features()
+            features.setflags(write=False)
+            self._features = features
+        return self._features
+
+    @property
+    def fitted(self) -> bool:
+        return self.isolation_forest is not None
+
+    def info(self) -> Dict[str, object]:
+        return {
+            'rows': self.rows,
+            'categories': len(self.category_averages),
+            'fitted': self.fitted,
+            'loaded_at': self.loaded_at.isoformat()
+        }
+
+    def to_snapshot(self) -> Dict[str, object]:
+        """State for the model store, shared with other worker processes"""
+        return {
+            'columns': self.columns,
+            'stats': self.stats,
+            'category_averages': self.category_averages,
+            'category_std': self.category_std,
+            'scaler': self.scaler,
+            'isolation_forest': self.isolation_forest,
+            'loaded_at': self.loaded_at.isoformat()
+        }
+
+    @classmethod
+    def from_snapshot(cls, state: Dict[str, object]) -> 'Baseline':
+        """Rebuild a baseline from :meth:`to_snapshot` output"""
+        # columns may be read-only memory maps shared between workers;
+        # detectors only ever concatenate them into new arrays
+        baseline = cls(
+            state['columns'],
+            state['stats'],
+            state['category_averages'],
+            state['category_std']
+        )
+        baseline.scaler = state['scaler']
+        baseline.isolation_forest = state['isolation_forest']
+        baseline.loaded_at = datetime.fromisoformat(state['loaded_at'])
+        return baseline
+
+
+def fetch_default_data() -> TransactionColumns:
+    """Fetch default transaction data from Supabase"""
+    try:
+        response = db.client.table('default_transactions')\
+            .select('amount, category, date')\
+            .execute()
+
+        return TransactionColumns.from_rows(response.data or [])
+    except Exception as e:
+        log_event(logger, "default_data_fetch_failed", level=logging.ERROR, error=str(e))
+        return TransactionColumns.empty()
+
+
+def build_baseline(columns: TransactionColumns) -> Baseline:
+    """Compute the shared statistics for the default data"""
+    stats = columns.stats()
+    return Baseline(columns, stats, stats.means(), stats.stds())
+
+
+def baseline_features(baseline: Baseline) -> np.ndarray:
+    """Training matrix for the baseline forest, z-scored against the default data alone"""
+    return baseline.columns.features(baseline.category_averages, baseline.category_std)
+
+
+_baseline: Optional[Baseline] = None
+_lock = asyncio.Lock()
+# Read-only workers never fit; they use the forest published by the trainer
+_read_only = False
+
+
+def set_read_only(read_only: bool) -> None:
+    global _read_only
+    _read_only = read_only
+
+
+def set_baseline(baseline: Baseline) -> None:
+    """Swap in a baseline built elsewhere, e.g. loaded from the model store"""
+    global _baseline
+    _baseline = baseline
+
+
+async def refresh_baseline(fit: Optional[bool] = None) -> Baseline:
+    """Reload the default data and swap in a new shared baseline"""
+    global _baseline
+    if fit is None:
+        fit = settings.BASELINE_FIT_MODEL
+    fit = fit and not _read_only
+
+    columns = await db.run_blocking(fetch_default_data)
+    baseline = build_baseline(columns)
+    if fit and baseline.rows:
+        baseline.scaler, baseline.isolation_forest = await db.run_cpu_bound(
+            fit_model, StandardScaler(), new_isolation_forest(), baseline_features(baseline)
+        )
+
+    # An empty result is usually a failed fetch, so keep retrying on next use
+    if baseline.rows:
+        _baseline = baseline
+    return baseline
+
+
+async def get_baseline() -> Baseline:
+    """Get the shared baseline, loading it on first use"""
+    if _baseline is not None:
+        return _baseline
+    async with _lock:
+        if _baseline is not None:
+            return _baseline
+        return await refresh_baseline()
+
+
+def get_baseline_sync() -> Baseline:
+    """Blocking variant of :func:`get_baseline` for synchronous callers"""
+    global _baseline
+    if _baseline is None:
+        baseline = build_baseline(fetch_default_data())
+        if not baseline.rows:
+            return baseline
+        _baseline = baseline
+    return _baseline
+
@@ -0,0 +1,237 @@
+import asyncio
+import math
+import time
+from collections import OrderedDict
+from datetime import date
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from app.category_stats import CategoryStats, RunningStats
+from app.transaction_columns import EPOCH_ORDINAL
+
+# Rolling windows in days; the longest one is also the scoring window
+WINDOWS = (7, 30, 180)
+HORIZON = max(WINDOWS)
+
+class CategoryAggregates:
+    """Rolling per-category amount aggregates for one user.
+
+    One row per category and one column per day of the last ``HORIZON``
+    days, used as a ring buffer indexed by ``day % HORIZON``: each cell
+    holds the count, sum and sum of squares of that day's amounts. Adding a
+    transaction touches one cell; a window's statistics cost one pass over
+    ``categories x days`` cells, however long the history is. Transactions
+    dated after the newest day count towards that day.
+    """
+
+    def __init__(self, today: Optional[int] = None):
+        self.day = today if today is not None else date.today().toordinal()
+        self.categories: List[str] = []
+        self._index: Dict[str, int] = {}
+        self.counts = np.zeros((0, HORIZON), dtype=np.int32)
+        self.totals = np.zeros((0, HORIZON), dtype=np.float64)
+        self.squares = np.zeros((0, HORIZON), dtype=np.float64)
+        # Bumped on every change, so readers can tell when to recompute
+        self.version = 0
+
+    @classmethod
+    def from_rows(cls, rows: List[Dict[str, Any]], today: Optional[int] = None) -> 'CategoryAggregates':
+        """Build from Supabase rows (amount, category, date); amounts stay float64 for exact totals"""
+        aggregates = cls(today)
+        if rows:
+            dates = np.array([str(row['date'])[:10] for row in rows], dtype='datetime64[D]')
+            aggregates.add_many(
+                np.array([row['category'] for row in rows], dtype=object),
+                np.fromiter((row['amount'] for row in rows), dtype=np.float64, count=len(rows)),
+                dates.astype(np.int64) + EPOCH_ORDINAL
+            )
+        return aggregates
+
+    def _rows(self, categories: Iterable[str]) -> np.ndarray:
+        rows = []
+        for category in categories:
+            row = self._index.get(category)
+            if row is None:
+                row = self._index[category] = len(self.categories)
+                self.categories.append(category)
+            rows.append(row)
+        missing = len(self.categories) - len(self.counts)
+        if missing:
+            self.counts = np.vstack([self.counts, np.zeros((missing, HORIZON), dtype=np.int32)])
+            self.totals = np.vstack([self.totals, np.zeros((missing, HORIZON))])
+            self.squares = np.vstack([self.squares, np.zeros((missing, HORIZON))])
+        return np.asarray(rows, dtype=np.intp)
+
+    def add_many(self, categories: np.ndarray, amounts: np.ndarray, days: np.ndarray) -> None:
+        """Fold many transactions in with a few vectorized scatter-adds"""
+        days = np.minimum(days, self.day)
+        keep = days > self.day - HORIZON
+        if not keep.any():
+            return
+        rows = self._rows(categories[keep])
+        columns = days[keep] % HORIZON
+        amounts = amounts[keep]
+        np.add.at(self.counts, (rows, columns), 1)
+        np.add.at(self.totals, (rows, columns), amounts)
+        np.add.at(self.squares, (rows, columns), amounts * amounts)
+        self.version += 1
+
+    def add(self, transaction: Dict[str, Any]) -> None:
+        """Fold one newly stored transaction in, O(1)"""
+        day = min(date.fromisoformat(str(transaction['date'])[:10]).toordinal(), self.day)
+        if day <= self.day - HORIZON:
+            return
+        row = self._rows([transaction['category']])[0]
+        column = day % HORIZON
+        amount = float(transaction['amount'])
+        self.counts[row, column] += 1
+        self.totals[row, column] += amount
+        self.squares[row, column] += amount * amount
+        self.version += 1
+
+    def advance(self, today: Optional[int] = None) -> None:
+        """Roll the windows forward to ``today``, clearing the days that fall out"""
+        today = today if today is not None else date.today().toordinal()
+        if today <= self.day:
+            return
+        expired = np.arange(self.day + 1, min(today, self.day + HORIZON) + 1) % HORIZON
+        self.counts[:, expired] = 0
+        self.totals[:, expired] = 0.0
+        self.squares[:, expired] = 0.0
+        self.day = today
+        self.version += 1
+
+    def _sums(self, days: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        columns = (self.day - np.arange(min(days, HORIZON))) % HORIZON
+        return (
+            self.counts[:, columns].sum(axis=1),
+            self.totals[:, columns].sum(axis=1),
+            self.squares[:, columns].sum(axis=1)
+        )
+
+    def window(self, days: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Per-category count, sum, mean and sample std over the last ``days`` days"""
+        counts, totals, squares = self._sums(days)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            means = np.where(counts > 0, totals / counts, np.nan)
+            m2 = np.maximum(squares - totals * means, 0.0)
+            stds = np.where(counts > 1, np.sqrt(m2 / (counts - 1)), np.nan)
+        return counts, totals, means, stds
+
+    def stats(self, days: int = HORIZON) -> CategoryStats:
+        """Window statistics as running accumulators, for merging with the baseline"""
+        counts, totals, squares = self._sums(days)
+        stats = {}
+        for category, count, total, square in zip(
+            self.categories, counts.tolist(), totals.tolist(), squares.tolist()
+        ):
+            if count:
+                mean = total / count
+                stats[category] = RunningStats(count, mean, max(square - total * mean, 0.0))
+        return CategoryStats(stats)
+
+    def summary(self) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """Every window's per-category sum, count, mean and std, keyed by window length"""
+        summary = {}
+        for days in WINDOWS:
+            counts, totals, means, stds = self.window(days)
+            summary[str(days)] = {
+                category: {
+                    'sum': total,
+                    'count': count,
+                    'mean': None if math.isnan(mean) else mean,
+                    'std': None if math.isnan(std) else std
+                }
+                for category, count, total, mean, std in zip(
+                    self.categories, counts.tolist(), totals.tolist(), means.tolist(), stds.tolist()
+                )
+                if count
+            }
+        return summary
+
+    @property
+    def nbytes(self) -> int:
+        return self.counts.nbytes + self.totals.nbytes + self.squares.nbytes
+
+
+class AggregateCache:
+    """LRU cache of per-user :class:`CategoryAggregates`.
+
+    A user's aggregates are loaded once with ``loader`` and then kept up to
+    date by the insert path. Concurrent first requests share one load. With
+    ``ttl`` set, entries are reloaded after that many seconds, for workers
+    that do not see every insert. Least recently used users are dropped past
+    ``max_users`` or ``max_bytes`` (0 for no byte limit); an entry's size is
+    re-measured whenever it is looked up, as new categories grow it.
+    """
+
+    def __init__(
+        self,
+        loader: Callable[[str], Awaitable[CategoryAggregates]],
+        max_users: int,
+        ttl: float = 0.0,
+        max_bytes: int = 0
+    ):
+        self.loader = loader
+        self.max_users = max_users
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        # user_id -> (aggregates, loaded on the monotonic clock, measured bytes)
+        self._entries: "OrderedDict[str, Tuple[CategoryAggregates, float, int]]" = OrderedDict()
+        self._loading: Dict[str, asyncio.Future] = {}
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _store(self, user_id: str, aggregates: CategoryAggregates, loaded_at: float) -> None:
+        previous = self._entries.pop(user_id, None)
+        if previous is not None:
+            self._bytes -= previous[2]
+        size = aggregates.nbytes
+        self._entries[user_id] = (aggregates, loaded_at, size)
+        self._bytes += size
+        # The entry just stored is always kept
+        while len(self._entries) > 1 and (
+            len(self._entries) > self.max_users > 0 or self._bytes > self.max_bytes > 0
+        ):
+            _, (_, _, evicted) = self._entries.popitem(last=False)
+            self._bytes -= evicted
+            self.evictions += 1
+
+    async def get(self, user_id: str) -> CategoryAggregates:
+        """A user's aggregates, rolled forward to today"""
+        entry = self._entries.get(user_id)
+        if entry is not None and (not self.ttl or time.monotonic() - entry[1] < self.ttl):
+            self.hits += 1
+            aggregates = entry[0]
+            if aggregates.nbytes != entry[2]:
+                self._store(user_id, aggregates, entry[1])
+            else:
+                self._entries.move_to_end(user_id)
+            aggregates.advance()
+            return aggregates
+
+        self.misses += 1
+        loading = self._loading.get(user_id)
+        if loading is None:
+            loading = self._loading[user_id] = asyncio.ensure_future(self._load(user_id))
+        return await asyncio.shield(loading)
+
+    async def _load(self, user_id: str) -> CategoryAggregates:
+        try:
+            aggregates = await self.loader(user_id)
+            self._store(user_id, aggregates, time.monotonic())
+            return aggregates
+        finally:
+            del self._loading[user_id]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'users': len(self._entries),
+            'bytes': self._bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions
+        }
@@ -0,0 +1,71 @@
+import math
+from typing import Dict, Iterable, Optional
+
+
+class RunningStats:
+    """Welford accumulator for count, mean and sample variance"""
+
+    __slots__ = ('count', 'mean', 'm2')
+
+    def __init__(self, count: int = 0, mean: float = 0.0, m2: float = 0.0):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+
+    def update(self, value: float) -> None:
+        """Add one observation in O(1)"""
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    def merged(self, other: 'RunningStats') -> 'RunningStats':
+        """Combine two accumulators (Chan et al. parallel update)"""
+        if other.count == 0:
+            return RunningStats(self.count, self.mean, self.m2)
+        if self.count == 0:
+            return RunningStats(other.count, other.mean, other.m2)
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        mean = self.mean + delta * other.count / count
+        m2 = self.m2 + other.m2 + delta * delta * self.count * other.count / count
+        return RunningStats(count, mean, m2)
+
+    @property
+    def std(self) -> float:
+        """Sample standard deviation (ddof=1), NaN below two observations like pandas"""
+        if self.count < 2:
+            return math.nan
+        return math.sqrt(max(self.m2, 0.0) / (self.count - 1))
+
+
+class CategoryStats:
+    """Per-category running statistics over transaction amounts"""
+
+    def __init__(self, stats: Optional[Dict[str, RunningStats]] = None):
+        self.stats: Dict[str, RunningStats] = stats or {}
+
+    def update(self, category: str, amount: float) -> RunningStats:
+        """Add one transaction and return that category's accumulator"""
+        stats = self.stats.get(category)
+        if stats is None:
+            stats = self.stats[category] = RunningStats()
+        stats.update(amount)
+        return stats
+
+    def merged(self, other: 'CategoryStats') -> 'CategoryStats':
+        """Per-category combination of two sets of accumulators"""
+        categories = set(self.stats) | set(other.stats)
+        return CategoryStats({c: self.get(c).merged(other.get(c)) for c in categories})
+
+    def means(self) -> Dict[str, float]:
+        return {c: s.mean for c, s in self.stats.items()}
+
+    def stds(self) -> Dict[str, float]:
+        return {c: s.std for c, s in self.stats.items()}
+
+    def get(self, category: str) -> RunningStats:
+        return self.stats.get(category) or RunningStats()
+
+    def categories(self) -> Iterable[str]:
+        return self.stats.keys()
@@ -0,0 +1,151 @@
+import zlib
+from typing import List, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+
+from app.conditional import coded_etag
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+# Content types worth compressing; images, fonts and archives already are
+COMPRESSIBLE_TYPES = ('text/', 'application/json', 'application/x-ndjson', 'application/javascript', 'image/svg+xml')
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """'br' or 'gzip' from an Accept-Encoding header, or None"""
+    accepted = {}
+    for item in accept_encoding.lower().split(','):
+        coding, _, params = item.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                continue
+        accepted[coding.strip()] = quality
+
+    wildcard = accepted.get('*', 0.0)
+    if brotli is not None and accepted.get('br', wildcard) > 0:
+        return 'br'
+    if accepted.get('gzip', wildcard) > 0:
+        return 'gzip'
+    return None
+
+
+class _Compressor:
+    """Streaming compressor that flushes after every chunk, so streamed pages arrive as they are produced"""
+
+    def __init__(self, encoding: str, gzip_level: int, brotli_quality: int):
+        if encoding == 'br':
+            self._brotli = brotli.Compressor(quality=brotli_quality)
+            self._zlib = None
+        else:
+            self._brotli = None
+            # wbits 16+ writes the gzip container
+            self._zlib = zlib.compressobj(gzip_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes, last: bool) -> bytes:
+        if self._brotli is not None:
+            out = self._brotli.process(data)
+            return out + (self._brotli.finish() if last else self._brotli.flush())
+        out = self._zlib.compress(data)
+        return out + self._zlib.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+
+class CompressionMiddleware:
+    """Compresses text and JSON responses with brotli or gzip.
+
+    Bodies under ``minimum_size`` are sent uncompressed; for streamed
+    responses that is decided once enough of the body has arrived. A strong
+    ETag gets the coding appended, so each representation keeps its own
+    validator.
+    """
+
+    def __init__(self, app, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get('accept-encoding', ''))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        pending: List[bytes] = []
+        pending_size = 0
+        compressor: Optional[_Compressor] = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start, pending_size, compressor, passthrough
+            if message['type'] == 'http.response.start':
+                headers = Headers(raw=message['headers'])
+                status = message['status']
+                if status == 304:
+                    # Revalidated against the coded ETag; answer with the same one
+                    etag = headers.get('etag')
+                    if etag:
+                        MutableHeaders(scope=message)['ETag'] = coded_etag(etag, encoding)
+                    passthrough = True
+                elif (
+                    status < 200 or status in (204, 206)
+                    or 'content-encoding' in headers
+                    or 'no-transform' in headers.get('cache-control', '')
+                    or not headers.get('content-type', '').startswith(COMPRESSIBLE_TYPES)
+                ):
+                    passthrough = True
+                else:
+                    MutableHeaders(scope=message).add_vary_header('Accept-Encoding')
+                    length = headers.get('content-length')
+                    passthrough = length is not None and int(length) < self.minimum_size
+                if passthrough:
+                    await send(message)
+                else:
+                    start = message
+                return
+
+            if passthrough or message['type'] != 'http.response.body':
+                await send(message)
+                return
+
+            body = message.get('body', b'')
+            more_body = message.get('more_body', False)
+            if compressor is None:
+                pending.append(body)
+                pending_size += len(body)
+                if pending_size < self.minimum_size:
+                    if more_body:
+                        return
+                    # The whole body came in under the threshold
+                    passthrough = True
+                    await send(start)
+                    await send({'type': 'http.response.body', 'body': b''.join(pending)})
+                    return
+
+                compressor = _Compressor(encoding, self.gzip_level, self.brotli_quality)
+                headers = MutableHeaders(scope=start)
+                headers['Content-Encoding'] = encoding
+                if 'etag' in headers:
+                    headers['ETag'] = coded_etag(headers['etag'], encoding)
+                del headers['Content-Length']
+                body = b''.join(pending)
+                pending.clear()
+                compressed = compressor.compress(body, last=not more_body)
+                if not more_body:
+                    headers['Content-Length'] = str(len(compressed))
+                await send(start)
+            else:
+                compressed = compressor.compress(body, last=not more_body)
+            await send({'type': 'http.response.body', 'body': compressed, 'more_body': more_body})
+
+        await self.app(scope, receive, send_compressed)
@@ -0,0 +1,55 @@
+import hashlib
+from typing import Optional
+
+from fastapi import Response
+
+from app.metrics import NOT_MODIFIED
+
+# Responses may be reused, but only after revalidating them with If-None-Match
+REVALIDATE = 'private, no-cache'
+
+# CompressionMiddleware marks a compressed representation's ETag with its coding
+CODING_SUFFIXES = ('-gzip', '-br')
+
+
+def strong_etag(*parts: object) -> str:
+    """Quoted strong ETag derived from ``parts``"""
+    digest = hashlib.blake2b(digest_size=12)
+    for part in parts:
+        digest.update(repr(part).encode())
+        digest.update(b'\0')
+    return f'"{digest.hexdigest()}"'
+
+
+def coded_etag(etag: str, coding: str) -> str:
+    """The ETag of ``etag``'s representation compressed with ``coding``; weak ETags are kept"""
+    if etag.startswith('W/') or not etag.endswith('"'):
+        return etag
+    return f'{etag[:-1]}-{coding}"'
+
+
+def _base_tag(tag: str) -> str:
+    tag = tag.strip()
+    if tag.startswith('W/'):
+        tag = tag[2:]
+    for suffix in CODING_SUFFIXES:
+        if tag.endswith(suffix + '"'):
+            return tag[:-len(suffix) - 1] + '"'
+    return tag
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against ``etag``, ignoring coding suffixes"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    return _base_tag(etag) in {_base_tag(tag) for tag in if_none_match.split(',')}
+
+
+def not_modified(if_none_match: Optional[str], etag: str, endpoint: str) -> Optional[Response]:
+    """A 304 response when the client's copy is current, otherwise None"""
+    if not etag_matches(if_none_match, etag):
+        return None
+    NOT_MODIFIED.inc(endpoint=endpoint)
+    return Response(status_code=304, headers={'ETag': etag, 'Cache-Control': REVALIDATE})
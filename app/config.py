@@ -1,9 +1,9 @@
 import os
 from dotenv import load_dotenv
-from supabase import create_client
 from dotenv import load_dotenv
 import os
 from fastapi.templating import Jinja2Templates
+from app.database import Database
 
 load_dotenv()
 
@@ -12,13 +12,150 @@ class Settings:
     GOOGLE_CLIENT_SECRET = os.getenv("GOOGLE_CLIENT_SECRET")
     CALLBACK_URL = os.getenv("CALLBACK_URL")
 
+    # Shared outbound HTTP client (Google OAuth): timeouts in seconds, pool
+    # size, idle keep-alive, and retries of transient failures with backoff
+    HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "10"))
+    HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "3"))
+    HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "20"))
+    HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))
+    HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", "2"))
+    HTTP_RETRY_BACKOFF = float(os.getenv("HTTP_RETRY_BACKOFF", "0.2"))
+    HTTP_RETRY_MAX_DELAY = float(os.getenv("HTTP_RETRY_MAX_DELAY", "2"))
+
+    # Per-user model registry
+    MODEL_REGISTRY_MAX_BYTES = int(os.getenv("MODEL_REGISTRY_MAX_BYTES", str(512 * 1024 * 1024)))
+    MODEL_REGISTRY_MAX_MODELS = int(os.getenv("MODEL_REGISTRY_MAX_MODELS", "0"))
+
+    # Incremental refit triggers: new rows since the last fit, or a category
+    # mean moving by more than this many fitted standard deviations
+    REFIT_ROW_THRESHOLD = int(os.getenv("REFIT_ROW_THRESHOLD", "50"))
+    REFIT_DRIFT_THRESHOLD = float(os.getenv("REFIT_DRIFT_THRESHOLD", "0.5"))
+
+    # Import the anomaly stack and load models in the background right after
+    # startup; when off it loads on the first anomaly request
+    ANOMALY_WARM_UP = os.getenv("ANOMALY_WARM_UP", "true").lower() == "true"
+
+    # Shared default_transactions baseline: load at startup, and whether to
+    # also fit a baseline forest on the default data alone
+    BASELINE_PRELOAD = os.getenv("BASELINE_PRELOAD", "true").lower() == "true"
+    BASELINE_FIT_MODEL = os.getenv("BASELINE_FIT_MODEL", "true").lower() == "true"
+
+    # Background training: concurrent jobs and the most jobs waiting
+    TRAINING_CONCURRENCY = int(os.getenv("TRAINING_CONCURRENCY", "2"))
+    TRAINING_QUEUE_SIZE = int(os.getenv("TRAINING_QUEUE_SIZE", "1000"))
+
+    # Write-behind mode for /api/anomaly/detect: respond after scoring and
+    # store rows in bulk from a bounded buffer backed by a local spill file
+    # per process (WRITE_BEHIND_SPILL_PATH plus the pid; all workers must
+    # share the directory so a dead worker's rows are replayed by another).
+    # Requires transactions.id and anomaly_results.id to accept client-generated UUIDs.
+    WRITE_BEHIND = os.getenv("WRITE_BEHIND", "false").lower() == "true"
+    WRITE_BEHIND_MAX_SIZE = int(os.getenv("WRITE_BEHIND_MAX_SIZE", "5000"))
+    WRITE_BEHIND_BATCH_SIZE = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", "200"))
+    WRITE_BEHIND_FLUSH_INTERVAL = float(os.getenv("WRITE_BEHIND_FLUSH_INTERVAL", "1.0"))
+    WRITE_BEHIND_ENQUEUE_TIMEOUT = float(os.getenv("WRITE_BEHIND_ENQUEUE_TIMEOUT", "1.0"))
+    WRITE_BEHIND_SPILL_PATH = os.getenv("WRITE_BEHIND_SPILL_PATH", "write_behind.spill")
+    WRITE_BEHIND_FSYNC = os.getenv("WRITE_BEHIND_FSYNC", "false").lower() == "true"
+
+    # Fitted model snapshots on disk (empty, the default, disables
+    # persistence; gunicorn.conf.py turns it on for the workers to share
+    # models), whether to memory-map their arrays, and how many recent users
+    # to load at startup
+    MODEL_STORE_DIR = os.getenv("MODEL_STORE_DIR", "")
+    MODEL_STORE_MMAP = os.getenv("MODEL_STORE_MMAP", "true").lower() == "true"
+    MODEL_PREWARM_USERS = int(os.getenv("MODEL_PREWARM_USERS", "0"))
+
+    # Multi-worker mode (gunicorn -c gunicorn.conf.py): one worker trains and
+    # publishes models and the baseline to MODEL_STORE_DIR, the others load
+    # them read-only. How often workers poll the store, and how long a
+    # reader serves a cached model before checking for a newer snapshot
+    MULTI_WORKER = os.getenv("MULTI_WORKER", "false").lower() == "true"
+    MODEL_STORE_POLL_SECONDS = float(os.getenv("MODEL_STORE_POLL_SECONDS", "1.0"))
+    MODEL_STORE_REFRESH_SECONDS = float(os.getenv("MODEL_STORE_REFRESH_SECONDS", "5.0"))
+
+    # Per-user rolling 7/30/180-day category aggregates (about 3.6 KB per
+    # category a user has): most users and bytes kept in memory, and seconds
+    # before an entry is reloaded from Supabase (0 never; set it when several
+    # workers insert for the same users)
+    AGGREGATE_CACHE_MAX_USERS = int(os.getenv("AGGREGATE_CACHE_MAX_USERS", "5000"))
+    AGGREGATE_CACHE_MAX_BYTES = int(os.getenv("AGGREGATE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+    AGGREGATE_CACHE_TTL = float(os.getenv("AGGREGATE_CACHE_TTL", "0"))
+
+    # Idempotent /api/anomaly/detect: a repeat of a request (same
+    # Idempotency-Key header, or same user, amount, date, category and
+    # description) within this many seconds gets the first result back
+    # instead of another insert. 0 disables it
+    IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL", "120"))
+    IDEMPOTENCY_MAX_ENTRIES = int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "100000"))
+
+    # Tiered scoring: settle transactions with |z| <= 2, which can never be
+    # anomalies, without the forest, and walk the forest over flat arrays
+    # rather than through scikit-learn. SCORING_ROBUST_Z > 0 (3.5 is the
+    # usual cutoff) opts in to also escalating rows whose median/MAD z-score
+    # exceeds it, which can flag more anomalies than before
+    SCORING_FAST_PATH = os.getenv("SCORING_FAST_PATH", "true").lower() == "true"
+    SCORING_ROBUST_Z = float(os.getenv("SCORING_ROBUST_Z", "0"))
+    SCORING_FLAT_FOREST = os.getenv("SCORING_FLAT_FOREST", "true").lower() == "true"
+
+    # Largest number of transactions accepted by /api/anomaly/detect/batch
+    BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "500"))
+
+    # History pagination: rows per Supabase round-trip when streaming the
+    # full history, and the largest page a client may request with limit=
+    HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "500"))
+    HISTORY_MAX_LIMIT = int(os.getenv("HISTORY_MAX_LIMIT", "1000"))
+
+    # Conditional GET on history: ETags follow a per-user version bumped on
+    # every write. A single process keeps versions in memory: seconds one is
+    # trusted without a local write (0 forever) and most users tracked. With
+    # MULTI_WORKER they are files in HISTORY_VERSION_DIR, shared by the
+    # workers; left empty, history responses carry no ETag
+    HISTORY_VERSION_TTL = float(os.getenv("HISTORY_VERSION_TTL", "0"))
+    HISTORY_VERSION_MAX_USERS = int(os.getenv("HISTORY_VERSION_MAX_USERS", "100000"))
+    HISTORY_VERSION_DIR = os.getenv("HISTORY_VERSION_DIR", "")
+
+    # Rendered HTML pages kept in memory, per template and context (0 renders
+    # every time)
+    TEMPLATE_CACHE_SIZE = int(os.getenv("TEMPLATE_CACHE_SIZE", "256"))
+
+    # Response compression: brotli when installed and accepted, else gzip.
+    # Bodies smaller than COMPRESSION_MIN_SIZE bytes are sent as they are
+    COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+    COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+    COMPRESSION_BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "4"))
+
+    # Historical re-scans: rows per page, where progress is checkpointed, and
+    # how many API-started re-scans run at once (on their own threads, apart
+    # from training) and may wait
+    RESCAN_CHUNK_SIZE = int(os.getenv("RESCAN_CHUNK_SIZE", "1000"))
+    RESCAN_CHECKPOINT_DIR = os.getenv("RESCAN_CHECKPOINT_DIR", "rescan_checkpoints")
+    RESCAN_CONCURRENCY = int(os.getenv("RESCAN_CONCURRENCY", "1"))
+    RESCAN_QUEUE_SIZE = int(os.getenv("RESCAN_QUEUE_SIZE", "100"))
+
+    # Thread pool for blocking Supabase calls, process pool for model training.
+    # 0 processes trains on the thread pool, the default on serverless
+    # runtimes (Vercel, AWS Lambda), which have no /dev/shm for the pool
+    SERVERLESS = bool(os.getenv("VERCEL") or os.getenv("AWS_LAMBDA_FUNCTION_NAME"))
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+    TRAINING_PROCESSES = int(os.getenv("TRAINING_PROCESSES", "0" if SERVERLESS else "1"))
+
+    # Structured logging: level, and the fraction of per-request events kept
+    LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+    LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.01"))
+
 settings = Settings()
 
-# Existing configs
+# The one template environment shared by every route
 templates = Jinja2Templates(directory="app/templates")
 
 # Supabase config
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
\ No newline at end of file
+def create_supabase_client():
+    # Imported here: the SDK and its HTTP stack are only loaded on first use
+    from supabase import create_client
+    return create_client(SUPABASE_URL, SUPABASE_KEY)
+
+# Async data access layer over the Supabase client, created lazily
+db = Database(create_supabase_client, max_workers=settings.DB_POOL_SIZE, cpu_workers=settings.TRAINING_PROCESSES)
\ No newline at end of file
@@ -0,0 +1,115 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks, every worker trains
+    fcntl = None
+
+# Spool key asking the trainer to reload and republish the shared baseline
+BASELINE_KEY = '__baseline__'
+
+
+class TrainerLock:
+    """Non-blocking exclusive lock on a file in the model store.
+
+    Whichever worker holds it is the single trainer. The OS drops the lock
+    when that process exits, so another worker takes over on its next try.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd: Optional[int] = None
+
+    @property
+    def held(self) -> bool:
+        return self._fd is not None
+
+    def acquire(self) -> bool:
+        if self._fd is not None:
+            return True
+        if fcntl is None:
+            self._fd = -1
+            return True
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self._fd = fd
+        return True
+
+    def release(self) -> None:
+        if self._fd is None:
+            return
+        if self._fd >= 0:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+        self._fd = None
+
+
+class TrainingRequests:
+    """Spool directory through which read-only workers ask the trainer for a fit.
+
+    One file per key, so repeated requests for the same user collapse into
+    one. ``submit`` is throttled per key for ``retry_after`` seconds.
+    """
+
+    def __init__(self, directory: str, retry_after: float = 60.0):
+        self.directory = directory
+        self.retry_after = retry_after
+        self._sent: Dict[str, float] = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, hashlib.sha256(key.encode()).hexdigest()[:32] + '.json')
+
+    def submit(self, key: str) -> bool:
+        """Ask for ``key`` to be (re)trained; False when recently asked already"""
+        now = time.monotonic()
+        if now - self._sent.get(key, float('-inf')) < self.retry_after:
+            return False
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'key': key}, f)
+        os.replace(tmp_path, self._path(key))
+        self._sent[key] = now
+        return True
+
+    def pending(self) -> List[str]:
+        """Requested keys, oldest first"""
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith('.json'):
+                    try:
+                        entries.append((entry.stat().st_mtime, entry.path))
+                    except OSError:
+                        continue
+        entries.sort()
+
+        keys = []
+        for _, path in entries:
+            try:
+                with open(path) as f:
+                    keys.append(json.load(f)['key'])
+            except (OSError, ValueError, KeyError):
+                continue
+        return keys
+
+    def remove(self, key: str) -> None:
+        try:
+            os.unlink(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def __len__(self) -> int:
+        with os.scandir(self.directory) as it:
+            return sum(1 for entry in it if entry.name.endswith('.json'))
@@ -0,0 +1,138 @@
+import asyncio
+import logging
+import threading
+import weakref
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional, Union
+
+# Every Database in this process, so a forked pool worker can reset them all
+_instances: "weakref.WeakSet[Database]" = weakref.WeakSet()
+
+
+def _reset_inherited_clients() -> None:
+    """Process pool initializer: drop the Supabase clients inherited through fork.
+
+    Their keep-alive connections belong to the parent, and a child reusing
+    them would interleave requests on the same sockets. Each child builds its
+    own client on first use instead.
+    """
+    for database in list(_instances):
+        database._reset_after_fork()
+
+
+class Database:
+    """Async facade over the synchronous Supabase client.
+
+    Query builders are cheap to construct, so callers build them as usual
+    (``supabase.table(...).select(...)``) and hand them to :meth:`execute`,
+    which runs the blocking HTTP round-trip on a bounded thread pool instead
+    of the event loop. CPU-heavy work such as model fitting goes through
+    :meth:`run_cpu_bound`, which uses a process pool.
+
+    The client is created by ``client_factory`` on first use, so importing
+    the app does not pay for the Supabase SDK until a route needs it.
+    """
+
+    def __init__(self, client_factory: Callable[[], Any], max_workers: int = 8, cpu_workers: int = 1):
+        self._client_factory = client_factory
+        self._client: Any = None
+        # Whether _client came from the factory rather than being assigned
+        self._owns_client = False
+        self._client_lock = threading.Lock()
+        self.max_workers = max_workers
+        self.cpu_workers = cpu_workers
+        self._io_executor: Optional[ThreadPoolExecutor] = None
+        self._cpu_executor: Optional[Executor] = None
+        _instances.add(self)
+
+    @property
+    def client(self) -> Any:
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    self._client = self._client_factory()
+                    self._owns_client = True
+        return self._client
+
+    @client.setter
+    def client(self, client: Any) -> None:
+        self._client = client
+        self._owns_client = False
+
+    def _reset_after_fork(self) -> None:
+        # Assigned clients (in-memory stand-ins) hold no connections and are kept
+        if self._owns_client:
+            self._client = None
+            self._owns_client = False
+        self._client_lock = threading.Lock()
+        # The parent's pool threads and processes do not exist here
+        self._io_executor = None
+        self._cpu_executor = None
+
+    def process_pool(self, max_workers: int) -> ProcessPoolExecutor:
+        """A process pool whose workers create their own Supabase client"""
+        return ProcessPoolExecutor(max_workers=max_workers, initializer=_reset_inherited_clients)
+
+    @property
+    def io_executor(self) -> ThreadPoolExecutor:
+        if self._io_executor is None:
+            self._io_executor = ThreadPoolExecutor(
+                max_workers=self.max_workers,
+                thread_name_prefix="supabase"
+            )
+        return self._io_executor
+
+    @property
+    def cpu_executor(self) -> Executor:
+        if self._cpu_executor is None:
+            # cpu_workers=0 keeps training in-process (e.g. serverless runtimes
+            # that cannot fork) while still keeping it off the event loop
+            if self.cpu_workers > 0:
+                try:
+                    self._cpu_executor = self.process_pool(self.cpu_workers)
+                except (OSError, NotImplementedError) as e:
+                    # No semaphores without /dev/shm (AWS Lambda and the like)
+                    from app.log import get_logger, log_event
+                    log_event(get_logger(__name__), "process_pool_unavailable", level=logging.WARNING, error=str(e))
+                    self._cpu_executor = self.io_executor
+            else:
+                self._cpu_executor = self.io_executor
+        return self._cpu_executor
+
+    async def run_blocking(self, fn: Callable, *args, **kwargs) -> Any:
+        """Run a blocking I/O callable on the database thread pool"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.io_executor, partial(fn, *args, **kwargs))
+
+    async def run_cpu_bound(self, fn: Callable, *args) -> Any:
+        """Run a picklable CPU-bound callable on the training process pool"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.cpu_executor, partial(fn, *args))
+
+    async def execute(self, query: Any) -> Any:
+        """Execute a prepared Supabase query builder without blocking the loop"""
+        return await self.run_blocking(query.execute)
+
+    async def insert(self, table: str, rows: Union[Dict[str, Any], List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        """Insert one row or a list of rows and return the stored rows"""
+        response = await self.execute(self.client.table(table).insert(rows))
+        return response.data or []
+
+    async def upsert(
+        self,
+        table: str,
+        rows: Union[Dict[str, Any], List[Dict[str, Any]]],
+        on_conflict: str = ''
+    ) -> Any:
+        """Upsert rows and return the raw response"""
+        return await self.execute(self.client.table(table).upsert(rows, on_conflict=on_conflict))
+
+    def close(self) -> None:
+        """Shut down the worker pools"""
+        if self._cpu_executor is not None and self._cpu_executor is not self._io_executor:
+            self._cpu_executor.shutdown(wait=False, cancel_futures=True)
+        if self._io_executor is not None:
+            self._io_executor.shutdown(wait=False, cancel_futures=True)
+        self._io_executor = None
+        self._cpu_executor = None
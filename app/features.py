@@ -0,0 +1,44 @@
+from typing import Tuple
+
+import numpy as np
+from sklearn.ensemble import IsolationForest
+from sklearn.preprocessing import StandardScaler
+
+# Feature matrix layout: [z_score, amount, day_of_week / 7, day_of_month / 31]
+N_FEATURES = 4
+
+
+def new_isolation_forest() -> IsolationForest:
+    """Unfitted isolation forest with the detector's hyperparameters"""
+    return IsolationForest(
+        contamination=0.1,  # Expected proportion of anomalies
+        random_state=42,
+        n_estimators=100
+    )
+
+
+def fill_zscores(out: np.ndarray, amounts: np.ndarray, row_avg: np.ndarray, row_std: np.ndarray):
+    """Write per-row z-scores into ``out``.
+
+    Rows with a missing or non-positive std (single-row categories,
+    constant amounts) score 0.
+    """
+    valid = row_std > 0
+    out[:] = 0
+    np.subtract(amounts, row_avg, out=out, where=valid)
+    np.divide(out, row_std, out=out, where=valid)
+
+
+def fit_model(
+    scaler: StandardScaler,
+    isolation_forest: IsolationForest,
+    features: np.ndarray
+) -> Tuple[StandardScaler, IsolationForest]:
+    """Fit scaler and model on a feature matrix.
+
+    Kept at module level so it can be shipped to a worker process.
+    """
+    scaler.fit(features)
+    normalized_features = scaler.transform(features)
+    isolation_forest.fit(normalized_features)
+    return scaler, isolation_forest
@@ -0,0 +1,274 @@
+import base64
+import hashlib
+import itertools
+import json
+import logging
+import os
+import secrets
+import tempfile
+import time
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from app.config import db, settings
+from app.log import get_logger, log_event
+from app.metrics import register_collector
+
+logger = get_logger(__name__)
+
+# Columns of the transactions table a client may project with ``fields=``
+TRANSACTION_FIELDS = ('id', 'amount', 'date', 'category', 'description', 'user_id', 'created_at')
+ANOMALY_FIELD = 'anomaly_results'
+
+# Keyset columns, always selected so every row can serve as a cursor
+CURSOR_FIELDS = ('created_at', 'id')
+
+Cursor = Tuple[str, Any]
+
+
+def encode_cursor(row: Dict[str, Any]) -> str:
+    """Opaque cursor pointing just past ``row`` in (created_at, id) order"""
+    raw = json.dumps([row['created_at'], row['id']], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Cursor:
+    """Inverse of :func:`encode_cursor`; raises ValueError on malformed input"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except Exception:
+        raise ValueError('Invalid cursor')
+    return str(created_at), row_id
+
+
+def build_select(fields: Optional[str], anomaly_filter: bool) -> str:
+    """Translate a ``fields=`` projection into a PostgREST select clause"""
+    if fields:
+        requested = [f.strip() for f in fields.split(',') if f.strip()]
+        unknown = [f for f in requested if f not in TRANSACTION_FIELDS and f != ANOMALY_FIELD]
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+        columns = [f for f in TRANSACTION_FIELDS if f in requested or f in CURSOR_FIELDS]
+        embed = ANOMALY_FIELD in requested
+    else:
+        columns = ['*']
+        embed = True
+
+    # Filtering on the embedded table needs an inner join to drop non-matching rows
+    if anomaly_filter:
+        columns.append(f'{ANOMALY_FIELD}!inner(*)' if embed else f'{ANOMALY_FIELD}!inner(is_anomaly)')
+    elif embed:
+        columns.append(f'{ANOMALY_FIELD}(*)')
+    return ', '.join(columns)
+
+
+def _quote(value: Any) -> str:
+    # Double quotes let PostgREST accept ':' '+' ',' in timestamps and ids
+    return '"' + str(value).replace('"', '\\"') + '"'
+
+
+def build_history_query(
+    user_id: str,
+    select: str,
+    page_size: int,
+    after: Optional[Cursor] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    is_anomaly: Optional[bool] = None
+) -> Any:
+    """One keyset page of a user's transactions, newest first"""
+    query = db.client.table('transactions')\
+        .select(select)\
+        .eq('user_id', user_id)
+
+    if start_date:
+        query = query.gte('date', start_date)
+    if end_date:
+        query = query.lte('date', end_date)
+    if is_anomaly is not None:
+        query = query.eq(f'{ANOMALY_FIELD}.is_anomaly', is_anomaly)
+    if after is not None:
+        created_at, row_id = after
+        query = query.or_(
+            f'created_at.lt.{_quote(created_at)},'
+            f'and(created_at.eq.{_quote(created_at)},id.lt.{_quote(row_id)})'
+        )
+
+    return query\
+        .order('created_at', desc=True)\
+        .order('id', desc=True)\
+        .limit(page_size)
+
+
+async def fetch_history_page(page_size: int, **query_args) -> List[Dict[str, Any]]:
+    """Fetch a single keyset page"""
+    response = await db.execute(build_history_query(page_size=page_size, **query_args))
+    return response.data or []
+
+
+async def iter_history_pages(
+    first_page: List[Dict[str, Any]],
+    page_size: int,
+    **query_args
+) -> AsyncIterator[List[Dict[str, Any]]]:
+    """Yield ``first_page`` and then every following keyset page.
+
+    Only one page is held in memory at a time.
+    """
+    page = first_page
+    while page:
+        yield page
+        if len(page) < page_size:
+            return
+        query_args['after'] = (page[-1]['created_at'], page[-1]['id'])
+        page = await fetch_history_page(page_size, **query_args)
+
+
+class HistoryVersions:
+    """Per-user version of the stored history, for ETags.
+
+    Writers call :meth:`bump` once their rows are stored; readers take
+    :meth:`current` before querying, so a response is never labelled newer
+    than its rows. Versions come from one counter behind a random per-process
+    prefix, so a user forgotten here (evicted, expired, or the process
+    restarted) gets a version no client has seen rather than an old one.
+    Writes made by other processes are not seen; ``ttl`` bounds how long a
+    version is trusted without a local write. Several workers use
+    :class:`SharedHistoryVersions` instead.
+    """
+
+    def __init__(self, ttl: float, max_users: int):
+        self.ttl = ttl
+        self.max_users = max_users
+        self._prefix = secrets.token_hex(4)
+        self._counter = itertools.count(1)
+        # user_id -> (minted on the monotonic clock, version)
+        self._versions: "OrderedDict[str, Tuple[float, int]]" = OrderedDict()
+        self.bumps = 0
+
+    def bump(self, user_id: str) -> None:
+        self._versions[user_id] = (time.monotonic(), next(self._counter))
+        self._versions.move_to_end(user_id)
+        self.bumps += 1
+        while len(self._versions) > self.max_users:
+            self._versions.popitem(last=False)
+
+    def current(self, user_id: str) -> Optional[str]:
+        entry = self._versions.get(user_id)
+        if entry is None or (self.ttl > 0 and time.monotonic() - entry[0] >= self.ttl):
+            self._versions[user_id] = entry = (time.monotonic(), next(self._counter))
+            while len(self._versions) > self.max_users:
+                self._versions.popitem(last=False)
+        return f'{self._prefix}-{entry[1]}'
+
+    def __len__(self) -> int:
+        return len(self._versions)
+
+
+class SharedHistoryVersions:
+    """Per-user history versions kept in files, shared by the workers of a host.
+
+    Each user's version is one small file in ``directory``, named after a
+    hash of the user_id and replaced atomically on :meth:`bump`, so a worker
+    sees the writes every other worker made. A missing file is created with a
+    fresh version, but never over one a writer put there meanwhile. Without
+    a usable directory :meth:`current` returns None and responses carry no
+    ETag, rather than one another worker may already have invalidated.
+    """
+
+    def __init__(self, directory: Optional[str]):
+        self.directory = directory
+        self._prefix = secrets.token_hex(4)
+        self._counter = itertools.count(1)
+        self.bumps = 0
+        if directory:
+            try:
+                os.makedirs(directory, exist_ok=True)
+            except OSError as e:
+                self._disable(e)
+
+    def _disable(self, error: OSError) -> None:
+        log_event(logger, "history_versions_disabled", level=logging.WARNING, directory=self.directory, error=str(error))
+        self.directory = None
+
+    def _path(self, user_id: str) -> str:
+        return os.path.join(self.directory, hashlib.sha256(user_id.encode()).hexdigest()[:32] + '.version')
+
+    def _write(self, user_id: str, replace: bool) -> None:
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(f'{self._prefix}-{next(self._counter)}')
+            if replace:
+                os.replace(tmp_path, self._path(user_id))
+            else:
+                # Fails if the file exists, so a writer's newer version is kept
+                os.link(tmp_path, self._path(user_id))
+        finally:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+
+    def bump(self, user_id: str) -> None:
+        if self.directory is None:
+            return
+        self.bumps += 1
+        try:
+            self._write(user_id, replace=True)
+        except OSError as e:
+            # An old version left behind would confirm stale bodies
+            try:
+                os.unlink(self._path(user_id))
+            except FileNotFoundError:
+                pass
+            except OSError:
+                self._disable(e)
+
+    def current(self, user_id: str) -> Optional[str]:
+        if self.directory is None:
+            return None
+        path = self._path(user_id)
+        try:
+            with open(path) as f:
+                return f.read() or None
+        except FileNotFoundError:
+            pass
+        except OSError:
+            return None
+        try:
+            self._write(user_id, replace=False)
+        except FileExistsError:
+            pass
+        except OSError:
+            return None
+        try:
+            with open(path) as f:
+                return f.read() or None
+        except OSError:
+            return None
+
+
+_versions = None
+
+
+def get_history_versions():
+    """The process-wide history version table; shared between workers in MULTI_WORKER mode"""
+    global _versions
+    if _versions is None:
+        if settings.MULTI_WORKER:
+            _versions = SharedHistoryVersions(settings.HISTORY_VERSION_DIR or None)
+        else:
+            _versions = HistoryVersions(settings.HISTORY_VERSION_TTL, settings.HISTORY_VERSION_MAX_USERS)
+    return _versions
+
+
+def _collect_metrics():
+    """History version table size for /metrics"""
+    if _versions is None:
+        return
+    if isinstance(_versions, HistoryVersions):
+        yield ('finalyze_history_versions', 'gauge', 'Users with a tracked history version', {}, len(_versions))
+    yield ('finalyze_history_version_bumps_total', 'counter', 'History writes that invalidated ETags', {}, _versions.bumps)
+
+
+register_collector(_collect_metrics)
@@ -0,0 +1,85 @@
+import asyncio
+import random
+from typing import Optional
+
+import httpx
+
+from app.config import settings
+
+# Responses worth retrying: rate limiting and transient upstream failures
+RETRY_STATUSES = {429, 502, 503, 504}
+
+# Failures where the request never reached the server, so even a
+# non-idempotent request (e.g. a one-time OAuth code exchange) is safe to resend
+_NOT_SENT = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def create_http_client() -> httpx.AsyncClient:
+    """Pooled client with keep-alive (HTTP/2 when h2 is installed) and bounded timeouts"""
+    return httpx.AsyncClient(
+        http2=_http2_available(),
+        timeout=httpx.Timeout(settings.HTTP_TIMEOUT, connect=settings.HTTP_CONNECT_TIMEOUT),
+        limits=httpx.Limits(
+            max_connections=settings.HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.HTTP_MAX_CONNECTIONS,
+            keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY
+        )
+    )
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """The application-wide outbound HTTP client, created on first use"""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = create_http_client()
+    return _client
+
+
+async def close_http_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def _retry_delay(attempt: int, response: Optional[httpx.Response]) -> float:
+    if response is not None:
+        retry_after = response.headers.get('Retry-After', '')
+        if retry_after.isdigit():
+            return min(float(retry_after), settings.HTTP_RETRY_MAX_DELAY)
+    # Exponential backoff with full jitter
+    return random.uniform(0, min(settings.HTTP_RETRY_BACKOFF * 2 ** attempt, settings.HTTP_RETRY_MAX_DELAY))
+
+
+async def request_with_retry(method: str, url: str, idempotent: bool = True, **kwargs) -> httpx.Response:
+    """Send a request on the shared client, retrying transient failures.
+
+    Requests that are not ``idempotent`` are only resent when they never
+    reached the server or the server refused them outright (429/503).
+    """
+    client = get_http_client()
+    retries = settings.HTTP_RETRIES
+    for attempt in range(retries + 1):
+        response = None
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.TransportError as e:
+            if attempt == retries or not (idempotent or isinstance(e, _NOT_SENT)):
+                raise
+        else:
+            retryable = response.status_code in RETRY_STATUSES and (
+                idempotent or response.status_code in (429, 503)
+            )
+            if not retryable or attempt == retries:
+                return response
+        await asyncio.sleep(_retry_delay(attempt, response))
@@ -0,0 +1,173 @@
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import orjson
+
+from app.config import settings
+from app.metrics import register_collector
+
+
+class IdempotencyConflict(Exception):
+    """Raised when an idempotency key is reused for a different request body"""
+
+
+def _digest(parts: List[Any]) -> str:
+    return hashlib.sha256(orjson.dumps(parts)).hexdigest()
+
+
+def request_fingerprint(transaction: Dict[str, Any]) -> str:
+    """Hash of the fields that make a transaction"""
+    return _digest([
+        'content',
+        transaction['user_id'],
+        float(transaction['amount']),
+        transaction['date'],
+        transaction['category'],
+        transaction['description']
+    ])
+
+
+def request_key(transaction: Dict[str, Any], header: Optional[str] = None) -> str:
+    """Cache key for a detect request.
+
+    The client's ``Idempotency-Key`` header when given, scoped to the user;
+    otherwise the request's fingerprint.
+    """
+    if header:
+        return _digest(['key', transaction['user_id'], header])
+    return request_fingerprint(transaction)
+
+
+class IdempotencyCache:
+    """TTL-bounded cache of detect results keyed by idempotency key.
+
+    A repeat of a finished request gets its stored result back, and a repeat
+    arriving while the first is still running waits for it instead of running
+    again. Failures are not cached, so the client's next retry runs anew.
+    Each entry remembers the fingerprint of the request that made it, and a
+    request with the same key but another fingerprint raises
+    IdempotencyConflict instead of getting someone else's result. Entries
+    expire ``ttl`` seconds after they complete; past ``max_entries`` the
+    oldest are dropped.
+    """
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # key -> (expiry on the monotonic clock, fingerprint, result)
+        self._results: "OrderedDict[str, Tuple[float, Optional[str], Any]]" = OrderedDict()
+        # key -> (future of the first request, its fingerprint)
+        self._running: Dict[str, Tuple[asyncio.Future, Optional[str]]] = {}
+        self.replayed = 0
+        self.stored = 0
+        self.conflicts = 0
+
+    def _check(self, fingerprint: Optional[str], stored: Optional[str]) -> None:
+        if fingerprint != stored:
+            self.conflicts += 1
+            raise IdempotencyConflict("Idempotency-Key was already used with a different request")
+
+    def _lookup(self, key: str) -> Tuple[bool, Optional[str], Any]:
+        entry = self._results.get(key)
+        if entry is None:
+            return False, None, None
+        expires, fingerprint, result = entry
+        if expires <= time.monotonic():
+            del self._results[key]
+            return False, None, None
+        return True, fingerprint, result
+
+    def _expire(self) -> None:
+        now = time.monotonic()
+        while self._results:
+            key, (expires, _, _) = next(iter(self._results.items()))
+            if expires > now and len(self._results) <= self.max_entries:
+                break
+            del self._results[key]
+
+    async def run(
+        self,
+        key: str,
+        fn: Callable[[], Awaitable[Any]],
+        fingerprint: Optional[str] = None
+    ) -> Tuple[Any, bool]:
+        """``fn()``'s result for ``key`` and whether it was replayed from an earlier call"""
+        while True:
+            found, stored, result = self._lookup(key)
+            if found:
+                self._check(fingerprint, stored)
+                self.replayed += 1
+                return result, True
+
+            if key not in self._running:
+                break
+            running, stored = self._running[key]
+            self._check(fingerprint, stored)
+            try:
+                result = await asyncio.shield(running)
+            except asyncio.CancelledError:
+                # The first request was cancelled rather than failed: run it here
+                if running.cancelled():
+                    continue
+                raise
+            self.replayed += 1
+            return result, True
+
+        future = asyncio.get_running_loop().create_future()
+        self._running[key] = (future, fingerprint)
+        try:
+            result = await fn()
+        except Exception as e:
+            future.set_exception(e)
+            # Nobody else may be waiting; mark the exception as retrieved
+            future.exception()
+            raise
+        except BaseException:
+            future.cancel()
+            raise
+        else:
+            future.set_result(result)
+            self._results[key] = (time.monotonic() + self.ttl, fingerprint, result)
+            self.stored += 1
+            self._expire()
+            return result, False
+        finally:
+            del self._running[key]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'entries': len(self._results),
+            'running': len(self._running),
+            'stored': self.stored,
+            'replayed': self.replayed,
+            'conflicts': self.conflicts
+        }
+
+
+_cache: Optional[IdempotencyCache] = None
+
+
+def get_idempotency_cache() -> Optional[IdempotencyCache]:
+    """The process-wide detect result cache, or None when disabled"""
+    global _cache
+    if settings.IDEMPOTENCY_TTL <= 0:
+        return None
+    if _cache is None:
+        _cache = IdempotencyCache(settings.IDEMPOTENCY_TTL, settings.IDEMPOTENCY_MAX_ENTRIES)
+    return _cache
+
+
+def _collect_metrics():
+    """Idempotency cache size and replay count for /metrics"""
+    if _cache is None:
+        return
+    stats = _cache.stats()
+    yield ('finalyze_idempotency_entries', 'gauge', 'Detect results held for idempotent replay', {}, stats['entries'])
+    yield ('finalyze_idempotency_replayed_total', 'counter', 'Detect requests answered from an earlier identical request', {}, stats['replayed'])
+    yield ('finalyze_idempotency_conflicts_total', 'counter', 'Idempotency keys reused with a different request', {}, stats['conflicts'])
+
+
+register_collector(_collect_metrics)
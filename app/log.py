@@ -0,0 +1,49 @@
+import logging
+import random
+import sys
+from typing import Any
+
+import orjson
+
+from app.config import settings
+
+
+class _JSONFormatter(logging.Formatter):
+    """One JSON object per line: level, logger, event and structured fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            'ts': round(record.created, 3),
+            'level': record.levelname.lower(),
+            'logger': record.name,
+            'event': record.getMessage(),
+            **getattr(record, 'fields', {})
+        }
+        return orjson.dumps(payload, default=str).decode()
+
+
+def get_logger(name: str = 'finalyze') -> logging.Logger:
+    """Logger under the ``finalyze`` hierarchy, which writes JSON lines to stdout"""
+    if name != 'finalyze' and not name.startswith('finalyze.'):
+        name = f'finalyze.{name}'
+    logger = logging.getLogger(name)
+    root = logging.getLogger('finalyze')
+    if not root.handlers:
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(_JSONFormatter())
+        root.addHandler(handler)
+        root.setLevel(settings.LOG_LEVEL)
+        root.propagate = False
+    return logger
+
+
+def log_event(logger: logging.Logger, event: str, level: int = logging.INFO, sampled: bool = False, **fields: Any):
+    """Emit a structured log line.
+
+    Sampled events are kept with probability LOG_SAMPLE_RATE so per-request
+    logging stays cheap under load; warnings and errors should not be sampled.
+    """
+    if sampled and random.random() >= settings.LOG_SAMPLE_RATE:
+        return
+    if logger.isEnabledFor(level):
+        logger.log(level, event, extra={'fields': fields})
@@ -0,0 +1,168 @@
+import bisect
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from starlette.datastructures import MutableHeaders
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# (metric name, type, help, labels, value) produced by collectors at scrape time
+Sample = Tuple[str, str, str, Dict[str, str], float]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ''
+    inner = ','.join(f'{k}="{_escape(v)}"' for k, v in sorted(labels.items()))
+    return '{' + inner + '}'
+
+
+class Counter:
+    """Monotonic counter with optional labels"""
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._values: Dict[Tuple[Tuple[str, str], ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        for key, value in sorted(self._values.items()):
+            lines.append(f'{self.name}{_format_labels(dict(key))} {value}')
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels"""
+
+    def __init__(self, name: str, help: str, buckets: Iterable[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [per-bucket counts (+Inf last), sum, count]
+        self._series: Dict[Tuple[Tuple[str, str], ...], list] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        for key, (counts, total, count) in sorted(self._series.items()):
+            labels = dict(key)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{self.name}_bucket{_format_labels({**labels, "le": le})} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(labels)} {total}')
+            lines.append(f'{self.name}_count{_format_labels(labels)} {count}')
+        return lines
+
+
+STAGE_SECONDS = Histogram(
+    'finalyze_stage_seconds',
+    'Time spent in each stage of the anomaly pipeline'
+)
+TRAINING_RUNS = Counter(
+    'finalyze_training_runs_total',
+    'Model training runs by kind and outcome'
+)
+REQUEST_ERRORS = Counter(
+    'finalyze_request_errors_total',
+    'Anomaly API requests that failed, by endpoint and status'
+)
+SCORED_ROWS = Counter(
+    'finalyze_scored_transactions_total',
+    'Transactions scored, by the tier that decided them'
+)
+NOT_MODIFIED = Counter(
+    'finalyze_not_modified_total',
+    'Conditional requests answered 304 Not Modified, by endpoint'
+)
+
+_metrics = [STAGE_SECONDS, TRAINING_RUNS, REQUEST_ERRORS, SCORED_ROWS, NOT_MODIFIED]
+_collectors: List[Callable[[], Iterable[Sample]]] = []
+
+
+def register_collector(collector: Callable[[], Iterable[Sample]]) -> None:
+    """Add a callable that reports current gauge/counter values at scrape time"""
+    _collectors.append(collector)
+
+
+def render_metrics() -> str:
+    """All metrics in the Prometheus text exposition format"""
+    lines: List[str] = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+
+    described = set()
+    for collector in _collectors:
+        for name, kind, help, labels, value in collector():
+            if name not in described:
+                lines.append(f'# HELP {name} {help}')
+                lines.append(f'# TYPE {name} {kind}')
+                described.add(name)
+            lines.append(f'{name}{_format_labels(labels)} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+# Per-request (stage, seconds) pairs, set by ServerTimingMiddleware
+_request_timings: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar('request_timings', default=None)
+
+
+@contextmanager
+def stage(name: str):
+    """Time a pipeline stage into the histogram and the request's Server-Timing"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=name)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings.append((name, elapsed))
+
+
+class ServerTimingMiddleware:
+    """Adds a Server-Timing header with the stages recorded during a request"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        timings: List[Tuple[str, float]] = []
+        token = _request_timings.set(timings)
+        start = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message['type'] == 'http.response.start':
+                entries = [f'{name};dur={seconds * 1000:.2f}' for name, seconds in timings]
+                entries.append(f'total;dur={(time.perf_counter() - start) * 1000:.2f}')
+                MutableHeaders(scope=message).append('Server-Timing', ', '.join(entries))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _request_timings.reset(token)
@@ -0,0 +1,119 @@
+import sys
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+try:
+    from sklearn.tree._tree import NODE_DTYPE
+    NODE_BYTES = NODE_DTYPE.itemsize
+except ImportError:  # layout of scikit-learn 1.3+
+    NODE_BYTES = 64
+
+# Python objects around each tree (estimator, Tree, parameters), roughly
+TREE_OVERHEAD_BYTES = 2048
+
+
+def forest_size(forest: Any) -> int:
+    """Approximate resident size of a fitted tree ensemble, from its node counts"""
+    size = 0
+    for estimator in forest.estimators_:
+        tree = estimator.tree_
+        value_bytes = tree.n_outputs * tree.max_n_classes * 8
+        size += tree.node_count * (NODE_BYTES + value_bytes) + TREE_OVERHEAD_BYTES
+    size += sum(np.asarray(features).nbytes for features in forest.estimators_features_)
+    return size
+
+
+def estimate_model_size(detector: Any) -> int:
+    """Approximate resident size of a fitted detector in bytes"""
+    size = forest_size(detector.isolation_forest) if detector.isolation_forest is not None else 0
+    # Scaler arrays and category dicts are a few entries each
+    size += sys.getsizeof(detector.category_averages) + sys.getsizeof(detector.category_std) + 1024
+
+    # The cached training rows are resident too, unless they are memory-mapped
+    history = getattr(detector, '_history', None)
+    if history is not None and not isinstance(history.amounts, np.memmap):
+        size += history.nbytes
+    flat_forest = getattr(detector, '_flat_forest', None)
+    if flat_forest is not None:
+        size += flat_forest.nbytes
+    return size
+
+
+class ModelRegistry:
+    """LRU registry of fitted anomaly detectors keyed by user_id.
+
+    Entries are evicted least-recently-used first once either the memory
+    budget (``max_bytes``) or the optional entry cap (``max_models``) is
+    exceeded.
+    """
+
+    def __init__(self, max_bytes: int, max_models: int = 0):
+        self.max_bytes = max_bytes
+        self.max_models = max_models
+        self._entries: "OrderedDict[str, Any]" = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, user_id: str) -> Optional[Any]:
+        """Return the cached detector for a user and mark it as recently used"""
+        with self._lock:
+            detector = self._entries.get(user_id)
+            if detector is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return detector
+
+    def put(self, user_id: str, detector: Any) -> None:
+        """Store a fitted detector, evicting older entries to stay in budget"""
+        size = estimate_model_size(detector)
+        with self._lock:
+            if user_id in self._entries:
+                self._remove(user_id)
+            self._entries[user_id] = detector
+            self._sizes[user_id] = size
+            self._total_bytes += size
+            self._evict_over_budget()
+
+    def _remove(self, user_id: str) -> None:
+        del self._entries[user_id]
+        self._total_bytes -= self._sizes.pop(user_id)
+
+    def _over_budget(self) -> bool:
+        if self.max_models and len(self._entries) > self.max_models:
+            return True
+        return self.max_bytes > 0 and self._total_bytes > self.max_bytes
+
+    def _evict_over_budget(self) -> None:
+        # Always keep the most recent entry, even if it alone exceeds the budget
+        while len(self._entries) > 1 and self._over_budget():
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, user_id: str) -> bool:
+        return user_id in self._entries
+
+    def stats(self) -> Dict[str, int]:
+        """Snapshot of registry counters"""
+        with self._lock:
+            return {
+                'models': len(self._entries),
+                'bytes': self._total_bytes,
+                'max_bytes': self.max_bytes,
+                'max_models': self.max_models,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
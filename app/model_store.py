@@ -0,0 +1,140 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import joblib
+import sklearn
+
+from app.log import get_logger, log_event
+
+logger = get_logger(__name__)
+
+# Bump whenever the snapshot layout or detector state changes shape
+SNAPSHOT_VERSION = 2
+
+
+class ModelStore:
+    """Versioned on-disk snapshots of fitted per-user detector state.
+
+    Each user gets two files named after a hash of the user_id:
+    ``<key>.v<N>.joblib`` holds the state dict (uncompressed, so numpy arrays
+    in it can be memory-mapped on load) and ``<key>.v<N>.json`` holds the
+    metadata. The metadata is written last and acts as the commit marker.
+    The shared default-data baseline is stored the same way under
+    ``baseline.v<N>``.
+    """
+
+    def __init__(self, directory: str, mmap: bool = True):
+        self.directory = directory
+        self.mmap = mmap
+        os.makedirs(directory, exist_ok=True)
+
+    def _key(self, user_id: str) -> str:
+        return hashlib.sha256(user_id.encode()).hexdigest()[:32]
+
+    def _named_paths(self, name: str):
+        base = os.path.join(self.directory, f"{name}.v{SNAPSHOT_VERSION}")
+        return base + '.joblib', base + '.json'
+
+    def _paths(self, user_id: str):
+        return self._named_paths(self._key(user_id))
+
+    def _write_atomic(self, path: str, write) -> None:
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                write(f)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    def _save(self, paths, state: Dict[str, Any], meta: Dict[str, Any]) -> None:
+        data_path, meta_path = paths
+        self._write_atomic(data_path, lambda f: joblib.dump(state, f))
+
+        metadata = {
+            'version': SNAPSHOT_VERSION,
+            'sklearn_version': sklearn.__version__,
+            'saved_at': datetime.utcnow().isoformat(),
+            **(meta or {})
+        }
+        self._write_atomic(meta_path, lambda f: f.write(json.dumps(metadata).encode()))
+
+    def _load_meta(self, paths) -> Optional[Dict[str, Any]]:
+        _, meta_path = paths
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        # Pickled estimators are only safe to load with the same scikit-learn
+        if meta.get('version') != SNAPSHOT_VERSION or meta.get('sklearn_version') != sklearn.__version__:
+            return None
+        return meta
+
+    def _load(self, paths, name: str) -> Optional[Dict[str, Any]]:
+        if self._load_meta(paths) is None:
+            return None
+        data_path, _ = paths
+        try:
+            return joblib.load(data_path, mmap_mode='r' if self.mmap else None)
+        except Exception as e:
+            log_event(logger, "model_snapshot_load_failed", level=logging.ERROR, snapshot=name, error=str(e))
+            return None
+
+    def _mtime(self, paths) -> Optional[float]:
+        try:
+            return os.stat(paths[1]).st_mtime
+        except OSError:
+            return None
+
+    def save(self, user_id: str, state: Dict[str, Any], meta: Optional[Dict[str, Any]] = None) -> None:
+        """Persist a detector state dict, replacing any previous snapshot"""
+        self._save(self._paths(user_id), state, {'user_id': user_id, **(meta or {})})
+
+    def load(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """Load a user's state dict, memory-mapping its arrays when enabled"""
+        return self._load(self._paths(user_id), user_id)
+
+    def mtime(self, user_id: str) -> Optional[float]:
+        """When a user's snapshot was last committed, or None if there is none"""
+        return self._mtime(self._paths(user_id))
+
+    def save_baseline(self, state: Dict[str, Any], meta: Optional[Dict[str, Any]] = None) -> None:
+        """Persist the shared baseline state"""
+        self._save(self._named_paths('baseline'), state, meta or {})
+
+    def load_baseline(self) -> Optional[Dict[str, Any]]:
+        """Load the shared baseline state, memory-mapping its arrays when enabled"""
+        return self._load(self._named_paths('baseline'), 'baseline')
+
+    def baseline_mtime(self) -> Optional[float]:
+        return self._mtime(self._named_paths('baseline'))
+
+    def recent_users(self, limit: int) -> List[str]:
+        """user_ids of the most recently saved snapshots, newest first"""
+        suffix = f".v{SNAPSHOT_VERSION}.json"
+        baseline = os.path.basename(self._named_paths('baseline')[1])
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith(suffix) and entry.name != baseline:
+                    entries.append((entry.stat().st_mtime, entry.path))
+        entries.sort(reverse=True)
+
+        users = []
+        for _, path in entries:
+            if len(users) >= limit:
+                break
+            try:
+                with open(path) as f:
+                    users.append(json.load(f)['user_id'])
+            except (OSError, ValueError, KeyError):
+                continue
+        return users
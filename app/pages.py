@@ -0,0 +1,68 @@
+from collections import OrderedDict
+from typing import Tuple
+
+from fastapi import Request, Response
+from fastapi.responses import HTMLResponse
+
+from app.conditional import REVALIDATE, not_modified, strong_etag
+from app.config import settings, templates
+from app.metrics import register_collector
+
+# (rendered body, ETag)
+RenderedPage = Tuple[bytes, str]
+
+
+class PageCache:
+    """Rendered templates kept as bytes, keyed by template name and context.
+
+    The pages only depend on their template and a few string parameters, so
+    a render is reusable until the process restarts with new templates.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._pages: "OrderedDict[tuple, RenderedPage]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, name: str, **context: str) -> RenderedPage:
+        key = (name, tuple(sorted(context.items())))
+        page = self._pages.get(key)
+        if page is not None:
+            self._pages.move_to_end(key)
+            self.hits += 1
+            return page
+
+        self.misses += 1
+        body = templates.get_template(name).render(**context).encode()
+        page = (body, strong_etag(body))
+        if self.max_entries > 0:
+            self._pages[key] = page
+            while len(self._pages) > self.max_entries:
+                self._pages.popitem(last=False)
+        return page
+
+    def __len__(self) -> int:
+        return len(self._pages)
+
+
+_cache = PageCache(settings.TEMPLATE_CACHE_SIZE)
+
+
+def render_page(request: Request, name: str, **context: str) -> Response:
+    """HTML response for a template, or 304 when the client's copy is current"""
+    body, etag = _cache.render(name, **context)
+    cached = not_modified(request.headers.get('if-none-match'), etag, 'page')
+    if cached is not None:
+        return cached
+    return HTMLResponse(body, headers={'ETag': etag, 'Cache-Control': REVALIDATE})
+
+
+def _collect_metrics():
+    """Rendered page cache size and hit rate for /metrics"""
+    yield ('finalyze_page_cache_entries', 'gauge', 'Rendered pages held in memory', {}, len(_cache))
+    yield ('finalyze_page_cache_hits_total', 'counter', 'Page requests served from a cached render', {}, _cache.hits)
+    yield ('finalyze_page_cache_misses_total', 'counter', 'Page requests that rendered a template', {}, _cache.misses)
+
+
+register_collector(_collect_metrics)
@@ -0,0 +1,232 @@
+"""Re-score users' whole transaction history with their current models.
+
+Each user's ``transactions`` are streamed newest first in keyset pages; a
+page is featurized column-wise, scored with one ``score_samples`` call and
+its ``anomaly_results`` upserted in one round-trip. Progress is checkpointed
+after every page, so an interrupted re-scan resumes where it stopped.
+
+    python -m app.rescan USER_ID [USER_ID ...] [--workers 4]
+    python -m app.rescan --all
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.anomaly_service import AnomalyDetector, anomaly_record, get_model_store, load_detector
+from app.config import db, settings
+from app.history import build_history_query
+from app.log import get_logger, log_event
+from app.metrics import register_collector
+from app.training import TrainingScheduler
+
+logger = get_logger(__name__)
+
+RESCAN_FIELDS = 'id, amount, category, date, created_at'
+
+
+class RescanCheckpoint:
+    """One small JSON file per user recording how far their re-scan got"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, user_id: str) -> str:
+        return os.path.join(self.directory, hashlib.sha256(user_id.encode()).hexdigest()[:32] + '.json')
+
+    def load(self, user_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._path(user_id)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save(self, user_id: str, state: Dict[str, Any]) -> None:
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self._path(user_id))
+
+
+def _detector_for(user_id: str, train: bool) -> Tuple[Optional[AnomalyDetector], Optional[str]]:
+    """The user's model and a version tag for it (None when it cannot be kept)"""
+    detector = load_detector(user_id)
+    if detector is None and train:
+        detector = AnomalyDetector()
+        if not detector.train(user_id):
+            return None, None
+        store = get_model_store()
+        if store is None:
+            # Refitting on the same rows gives the same forest (fixed seed)
+            return detector, None
+        # Stored so a resumed re-scan keeps scoring with this exact model
+        store.save(user_id, detector.to_snapshot(), {
+            'training_rows': detector.training_rows, 'trained_at': detector.trained_at.isoformat()
+        })
+    if detector is None:
+        return None, None
+    return detector, detector.trained_at.isoformat()
+
+
+def rescan_user(
+    user_id: str,
+    chunk_size: int,
+    checkpoint_dir: str,
+    restart: bool = False,
+    train: bool = True
+) -> Dict[str, Any]:
+    """Re-score every transaction of one user (blocking; runs on a re-scan thread or worker process).
+
+    Uses the user's stored model, training one when there is none and
+    ``train`` is set. A checkpoint left by a different model version is
+    discarded, so every row ends up scored by the same model.
+    """
+    checkpoints = RescanCheckpoint(checkpoint_dir)
+    detector, model = _detector_for(user_id, train)
+    if detector is None:
+        return {'user_id': user_id, 'done': False, 'error': 'No model or training data for user'}
+
+    state = None if restart else checkpoints.load(user_id)
+    if state is None or state.get('model') != model:
+        state = {'user_id': user_id, 'model': model, 'cursor': None, 'scanned': 0, 'anomalies': 0, 'done': False}
+    elif state['done']:
+        return state
+
+    while True:
+        after = tuple(state['cursor']) if state['cursor'] else None
+        rows = build_history_query(user_id, RESCAN_FIELDS, chunk_size, after=after).execute().data or []
+        if not rows:
+            break
+
+        analyses = detector.analyze_transactions(rows)
+        results = [anomaly_record(row['id'], analysis) for row, analysis in zip(rows, analyses)]
+        # One result per transaction: re-scans replace the previous score
+        db.client.table('anomaly_results').upsert(results, on_conflict='transaction_id').execute()
+
+        state['cursor'] = [rows[-1]['created_at'], rows[-1]['id']]
+        state['scanned'] += len(rows)
+        state['anomalies'] += sum(1 for analysis in analyses if analysis['is_anomaly'])
+        checkpoints.save(user_id, state)
+        if len(rows) < chunk_size:
+            break
+
+    state['done'] = True
+    checkpoints.save(user_id, state)
+    return state
+
+
+def rescan_status(user_id: str, checkpoint_dir: str) -> Optional[Dict[str, Any]]:
+    """The checkpoint of a user's last re-scan, if any"""
+    return RescanCheckpoint(checkpoint_dir).load(user_id)
+
+
+def rescan_users(
+    user_ids: List[str],
+    workers: int,
+    chunk_size: int,
+    checkpoint_dir: str,
+    restart: bool = False
+) -> List[Dict[str, Any]]:
+    """Re-scan many users in parallel, one process per user at a time"""
+    if workers <= 1:
+        return [rescan_user(user_id, chunk_size, checkpoint_dir, restart) for user_id in user_ids]
+
+    results = []
+    # Workers build their own Supabase client rather than sharing the one
+    # list_user_ids() opened here
+    with db.process_pool(workers) as pool:
+        futures = {
+            pool.submit(rescan_user, user_id, chunk_size, checkpoint_dir, restart): user_id
+            for user_id in user_ids
+        }
+        for future in as_completed(futures):
+            user_id = futures[future]
+            try:
+                results.append(future.result())
+            except Exception as e:
+                log_event(logger, "rescan_failed", level=logging.ERROR, user_id=user_id, error=str(e))
+                results.append({'user_id': user_id, 'done': False, 'error': str(e)})
+    return results
+
+
+# Re-scans started from the API get their own job queue and threads: they
+# mostly wait on Supabase, and must not hold a training slot or process
+_scheduler = TrainingScheduler(concurrency=settings.RESCAN_CONCURRENCY, max_queue=settings.RESCAN_QUEUE_SIZE)
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def get_rescan_scheduler() -> TrainingScheduler:
+    """The process-wide queue of API-started re-scans"""
+    return _scheduler
+
+
+async def run_rescan(user_id: str, restart: bool = False, train: bool = True) -> Dict[str, Any]:
+    """Re-scan one user on the re-scan threads"""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=_scheduler.concurrency, thread_name_prefix="rescan")
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, partial(
+        rescan_user, user_id, settings.RESCAN_CHUNK_SIZE, settings.RESCAN_CHECKPOINT_DIR, restart, train
+    ))
+
+
+async def stop_rescans() -> None:
+    """Cancel queued re-scans; running ones stop at their next checkpoint on restart"""
+    global _executor
+    await _scheduler.stop()
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def _collect_metrics():
+    """Re-scan queue gauges for /metrics"""
+    stats = _scheduler.stats()
+    yield ('finalyze_rescan_queue_depth', 'gauge', 'Re-scans waiting for a thread', {}, stats['queued'])
+    yield ('finalyze_rescan_running', 'gauge', 'Re-scans currently running', {}, stats['running'])
+
+
+register_collector(_collect_metrics)
+
+
+def list_user_ids(page_size: int = 1000) -> List[str]:
+    """Every id in the users table"""
+    user_ids = []
+    start = 0
+    while True:
+        rows = db.client.table('users').select('id').order('id')\
+            .range(start, start + page_size - 1).execute().data or []
+        user_ids.extend(str(row['id']) for row in rows)
+        if len(rows) < page_size:
+            return user_ids
+        start += page_size
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-score users' transaction history")
+    parser.add_argument('user_ids', nargs='*')
+    parser.add_argument('--all', action='store_true', help='every user in the users table')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--chunk-size', type=int, default=settings.RESCAN_CHUNK_SIZE)
+    parser.add_argument('--checkpoint-dir', default=settings.RESCAN_CHECKPOINT_DIR)
+    parser.add_argument('--restart', action='store_true', help='ignore existing checkpoints')
+    args = parser.parse_args()
+
+    user_ids = list_user_ids() if args.all else args.user_ids
+    if not user_ids:
+        parser.error('give user ids or --all')
+
+    for result in rescan_users(user_ids, args.workers, args.chunk_size, args.checkpoint_dir, args.restart):
+        print(json.dumps(result))
+
+
+if __name__ == '__main__':
+    main()
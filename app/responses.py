@@ -0,0 +1,29 @@
+from typing import Any
+
+import orjson
+from fastapi.responses import JSONResponse
+
+# numpy arrays and scalars, datetimes and dates are encoded natively by orjson
+ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+def _default(obj: Any) -> Any:
+    """Fallback for types orjson does not handle natively"""
+    # numpy scalars and non-native arrays; checked by duck typing so this
+    # module does not import numpy
+    tolist = getattr(obj, 'tolist', None)
+    if tolist is not None:
+        return tolist()
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def dumps(content: Any) -> bytes:
+    """Serialize to JSON bytes"""
+    return orjson.dumps(content, default=_default, option=ORJSON_OPTIONS)
+
+
+class ORJSONResponse(JSONResponse):
+    """JSON response rendered with orjson"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
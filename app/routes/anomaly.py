@@ -1,12 +1,30 @@
-from fastapi import APIRouter, HTTPException, Request, BackgroundTasks
-from pydantic import BaseModel, Field, validator
-from datetime import datetime, date
-from typing import Optional, Dict, Any
-import numpy as np
-from app.config import supabase, templates
-from app.anomaly_service import get_anomaly_detector
+from fastapi import APIRouter, HTTPException, Request, Response, Body, Header, Query
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field, ValidationError, validator
+from datetime import date, datetime
+from typing import TYPE_CHECKING, Callable, Optional, Dict, Any, List, AsyncIterator
+import asyncio
+import logging
+import uuid
+from app.config import db, settings
+from app.services import anomaly_service
+from app.write_behind import WriteBehindBuffer, WriteBehindFull, get_write_behind
+from app.idempotency import IdempotencyConflict, get_idempotency_cache, request_fingerprint, request_key
+from app.responses import ORJSONResponse, dumps
+from app.conditional import REVALIDATE, not_modified, strong_etag
+from app.pages import render_page
+from app.metrics import REQUEST_ERRORS, stage
+from app.log import get_logger, log_event
+from app.history import (
+    build_select, decode_cursor, encode_cursor, fetch_history_page, get_history_versions, iter_history_pages
+)
 
-router = APIRouter()
+if TYPE_CHECKING:
+    from app.anomaly_service import AnomalyDetector
+    from app.category_aggregates import CategoryAggregates
+
+router = APIRouter(default_response_class=ORJSONResponse)
+logger = get_logger(__name__)
 
 class Transaction(BaseModel):
     amount: float = Field(..., gt=0)
@@ -29,105 +47,434 @@ class Transaction(BaseModel):
             raise ValueError('Invalid user_id')
         return v
 
-def serialize_for_json(obj: Any) -> Any:
-    """Convert objects to JSON-serializable format"""
-    if isinstance(obj, np.bool_):
-        return bool(obj)  # Convert numpy.bool_ to Python bool
-    elif isinstance(obj, np.integer):
-        return int(obj)  # Convert numpy integers to Python int
-    elif isinstance(obj, np.floating):
-        return float(obj)  # Convert numpy floats to Python float
-    elif isinstance(obj, (np.ndarray, list)):
-        return [serialize_for_json(item) for item in obj]
-    elif isinstance(obj, dict):
-        return {k: serialize_for_json(v) for k, v in obj.items()}
-    elif isinstance(obj, (datetime, date)):
-        return obj.isoformat()
-    return obj
+VALID_CATEGORIES = ['makanan berat', 'makanan ringan', 'minuman', 'PDAM', 'transportasi', 'kuota', 'lainnya']
+
+def validate_transaction(transaction: Transaction):
+    """Business-rule checks on top of the Transaction model"""
+    # Validate date
+    try:
+        datetime.strptime(transaction.date, '%Y-%m-%d')
+    except ValueError:
+        raise HTTPException(status_code=422, detail="Invalid date format. Use YYYY-MM-DD")
+
+    # Validate category
+    if transaction.category.lower() not in [cat.lower() for cat in VALID_CATEGORIES]:
+        raise HTTPException(status_code=422, detail="Invalid category")
+
+    # Validate amount
+    if transaction.amount <= 0:
+        raise HTTPException(status_code=422, detail="Amount must be greater than 0")
+
+def transaction_record(transaction: Transaction) -> Dict[str, Any]:
+    """Row for the transactions table"""
+    return {
+        'amount': float(transaction.amount),  # Ensure float type
+        'date': transaction.date,
+        'category': transaction.category,
+        'description': transaction.description,
+        'user_id': transaction.user_id,
+        'created_at': datetime.utcnow().isoformat()
+    }
+
+async def _scoring_state(service, user_id: str):
+    """A user's detector plus rolling aggregates, with scoring statistics taken from the latter"""
+    detector, aggregates = await asyncio.gather(
+        service.get_anomaly_detector(user_id),
+        service.get_category_aggregates(user_id)
+    )
+    detector.sync_statistics(aggregates)
+    return detector, aggregates
+
+def _observe(
+    service,
+    detector: 'AnomalyDetector',
+    aggregates: 'CategoryAggregates',
+    transactions: List[Dict[str, Any]]
+) -> None:
+    """Fold stored transactions into the user's aggregates and model statistics"""
+    for trans_data in transactions:
+        aggregates.add(trans_data)
+        detector.observe(trans_data, aggregates)
+    if detector.stale:
+        service.schedule_refit(detector)
 
 @router.post("/api/anomaly/detect")
-async def detect_anomaly(transaction: Transaction, background_tasks: BackgroundTasks):
+async def detect_anomaly(
+    transaction: Transaction,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, max_length=255)
+):
+    """Store and score one transaction.
+
+    A retry of the same request (same ``Idempotency-Key`` header, or the
+    same transaction when there is none) within ``IDEMPOTENCY_TTL`` gets the
+    original ``transaction_id`` and analysis back without a second insert,
+    marked with an ``Idempotent-Replayed`` header. Reusing a key for a
+    different transaction is rejected with 422.
+    """
+    cache = get_idempotency_cache()
+    if cache is None:
+        return await _detect(transaction)
+
+    fields = transaction.dict()
     try:
-        print(f"Received transaction data: {transaction.dict()}")
+        result, replayed = await cache.run(
+            request_key(fields, idempotency_key), lambda: _detect(transaction), request_fingerprint(fields)
+        )
+    except IdempotencyConflict as e:
+        REQUEST_ERRORS.inc(endpoint='detect', status='422')
+        raise HTTPException(status_code=422, detail=str(e))
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+        log_event(logger, "transaction_replayed", sampled=True, user_id=transaction.user_id)
+    return result
 
-        # Validate date
-        try:
-            datetime.strptime(transaction.date, '%Y-%m-%d')
-        except ValueError:
-            raise HTTPException(status_code=422, detail="Invalid date format. Use YYYY-MM-DD")
+async def _detect(transaction: Transaction) -> Dict[str, Any]:
+    try:
+        log_event(logger, "transaction_received", sampled=True, **transaction.dict())
 
-        # Validate category
-        valid_categories = ['makanan berat', 'makanan ringan', 'minuman', 'PDAM', 'transportasi', 'kuota', 'lainnya']
-        if transaction.category.lower() not in [cat.lower() for cat in valid_categories]:
-            raise HTTPException(status_code=422, detail="Invalid category")
+        with stage('validation'):
+            validate_transaction(transaction)
+
+            # Save transaction
+            trans_data = transaction_record(transaction)
+
+        # Get detector first; a cold user is served by the shared baseline
+        # while their own model trains in the background
+        service = await anomaly_service()
+        with stage('model_lookup'):
+            detector, aggregates = await _scoring_state(service, transaction.user_id)
+
+        write_behind = get_write_behind()
+        if write_behind is not None:
+            return await _detect_write_behind(write_behind, detector, aggregates, trans_data)
 
-        # Validate amount
-        if transaction.amount <= 0:
-            raise HTTPException(status_code=422, detail="Amount must be greater than 0")
-        
-        # Save transaction
-        trans_data = {
-            'amount': float(transaction.amount),  # Ensure float type
-            'date': transaction.date,
-            'category': transaction.category,
-            'description': transaction.description,
-            'user_id': transaction.user_id,
-            'created_at': datetime.utcnow().isoformat()
-        }
-        
         # Save to database
-        result = supabase.table('transactions').insert(trans_data).execute()
-        if not result.data:
+        with stage('transactions_insert'):
+            saved = await db.insert('transactions', trans_data)
+        if not saved:
             raise HTTPException(status_code=500, detail="Failed to save transaction")
             
-        transaction_id = result.data[0]['id']
+        transaction_id = saved[0]['id']
         
-        # Get detector and analyze transaction
-        detector = get_anomaly_detector()
+        # Analyze transaction, then fold it into the rolling statistics
         analysis = detector.analyze_transaction(trans_data)
-        
-        # Ensure all values are JSON serializable
-        serialized_analysis = serialize_for_json(analysis)
+        _observe(service, detector, aggregates, [trans_data])
         
         # Prepare anomaly data
-        anomaly_data = {
-            'transaction_id': transaction_id,
-            'is_anomaly': bool(serialized_analysis['is_anomaly']),  # Ensure Python bool
-            'confidence_score': float(serialized_analysis['confidence_score']),  # Ensure Python float
-            'insights': serialized_analysis['insights'],
-            'detected_at': datetime.utcnow().isoformat()
-        }
+        anomaly_data = service.anomaly_record(transaction_id, analysis)
         
         # Save analysis results
-        anomaly_result = supabase.table('anomaly_results').insert(anomaly_data).execute()
-        if not anomaly_result.data:
+        with stage('anomaly_results_insert'):
+            anomaly_result = await db.insert('anomaly_results', anomaly_data)
+        if not anomaly_result:
             raise HTTPException(status_code=500, detail="Failed to save anomaly results")
+        get_history_versions().bump(transaction.user_id)
         
         return {
             "transaction_id": transaction_id,
-            "analysis": serialized_analysis
+            "analysis": analysis,
+            "model_stale": detector.shared or detector.stale
         }
         
     except ValueError as e:
+        REQUEST_ERRORS.inc(endpoint='detect', status='422')
         raise HTTPException(status_code=422, detail=str(e))
+    except WriteBehindFull as e:
+        REQUEST_ERRORS.inc(endpoint='detect', status='503')
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
     except Exception as e:
-        print(f"Error processing transaction: {str(e)}")
+        REQUEST_ERRORS.inc(endpoint='detect', status='500')
+        log_event(logger, "transaction_failed", level=logging.ERROR, user_id=transaction.user_id, error=str(e))
         raise HTTPException(status_code=500, detail=str(e))
 
+async def _detect_write_behind(
+    write_behind: WriteBehindBuffer,
+    detector: 'AnomalyDetector',
+    aggregates: 'CategoryAggregates',
+    trans_data: Dict[str, Any]
+) -> Dict[str, Any]:
+    """Score first and hand both rows to the write-behind buffer"""
+    service = await anomaly_service()
+    transaction_id = str(uuid.uuid4())
+    trans_data['id'] = transaction_id
+
+    analysis = detector.analyze_transaction(trans_data)
+    _observe(service, detector, aggregates, [trans_data])
+
+    anomaly_data = service.anomaly_record(transaction_id, analysis)
+    anomaly_data['id'] = str(uuid.uuid4())
+    with stage('write_behind_enqueue'):
+        await write_behind.enqueue(trans_data, anomaly_data)
+
+    return {
+        "transaction_id": transaction_id,
+        "analysis": analysis,
+        "model_stale": detector.shared or detector.stale
+    }
+
+@router.post("/api/anomaly/detect/batch")
+async def detect_anomaly_batch(transactions: List[Dict[str, Any]] = Body(...)):
+    """Score many transactions at once with one insert and one model pass per user.
+
+    Each entry of ``results`` matches the request item at the same index and
+    carries either ``transaction_id`` and ``analysis`` or an ``error``.
+    """
+    if not transactions:
+        raise HTTPException(status_code=422, detail="At least one transaction is required")
+    if len(transactions) > settings.BATCH_MAX_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch too large, maximum is {settings.BATCH_MAX_SIZE} transactions"
+        )
+
+    results: List[Dict[str, Any]] = [None] * len(transactions)
+    accepted = []  # (index, trans_data)
+
+    # Validate all items up front so one bad row does not reject the batch
+    for index, item in enumerate(transactions):
+        try:
+            transaction = Transaction(**item)
+            validate_transaction(transaction)
+            accepted.append((index, transaction_record(transaction)))
+        except ValidationError as e:
+            results[index] = {
+                'index': index,
+                'error': [
+                    {'field': '.'.join(str(part) for part in err['loc']), 'message': err['msg']}
+                    for err in e.errors()
+                ]
+            }
+        except HTTPException as e:
+            results[index] = {'index': index, 'error': e.detail}
+
+    if not accepted:
+        return {"results": results}
+
+    try:
+        by_user: Dict[str, List[int]] = {}
+        for position, (_, data) in enumerate(accepted):
+            by_user.setdefault(data['user_id'], []).append(position)
+
+        # Get detectors first; cold users are served by the shared baseline
+        service = await anomaly_service()
+        with stage('model_lookup'):
+            states = {user_id: await _scoring_state(service, user_id) for user_id in by_user}
+        detectors = {user_id: state[0] for user_id, state in states.items()}
+
+        # Save all transactions in one round-trip; rows come back in insert order
+        with stage('transactions_insert'):
+            saved = await db.insert('transactions', [data for _, data in accepted])
+        if len(saved) != len(accepted):
+            raise HTTPException(status_code=500, detail="Failed to save transactions")
+        transaction_ids = [row['id'] for row in saved]
+
+        # One scoring pass per user over the stacked feature matrix
+        analyses: List[Dict[str, Any]] = [None] * len(accepted)
+        for user_id, positions in by_user.items():
+            detector, aggregates = states[user_id]
+            user_transactions = [accepted[p][1] for p in positions]
+            user_analyses = detector.analyze_transactions(user_transactions)
+            for position, analysis in zip(positions, user_analyses):
+                analyses[position] = analysis
+            _observe(service, detector, aggregates, user_transactions)
+
+        # Save all analysis results in one round-trip
+        anomaly_rows = [
+            service.anomaly_record(transaction_id, analysis)
+            for transaction_id, analysis in zip(transaction_ids, analyses)
+        ]
+        with stage('anomaly_results_insert'):
+            anomaly_result = await db.insert('anomaly_results', anomaly_rows)
+        if not anomaly_result:
+            raise HTTPException(status_code=500, detail="Failed to save anomaly results")
+        versions = get_history_versions()
+        for user_id in by_user:
+            versions.bump(user_id)
+
+    except HTTPException:
+        REQUEST_ERRORS.inc(endpoint='detect_batch', status='500')
+        raise
+    except Exception as e:
+        REQUEST_ERRORS.inc(endpoint='detect_batch', status='500')
+        log_event(logger, "transaction_batch_failed", level=logging.ERROR, size=len(accepted), error=str(e))
+        raise HTTPException(status_code=500, detail=str(e))
+
+    for (index, data), transaction_id, analysis in zip(accepted, transaction_ids, analyses):
+        detector = detectors[data['user_id']]
+        results[index] = {
+            'index': index,
+            'transaction_id': transaction_id,
+            'analysis': analysis,
+            'model_stale': detector.shared or detector.stale
+        }
+
+    return {"results": results}
+
+async def _stream_rows(
+    pages: AsyncIterator[List[Dict[str, Any]]],
+    ndjson: bool,
+    on_error: Optional[Callable[[], None]] = None
+) -> AsyncIterator[bytes]:
+    """Encode pages of rows as a JSON array or as NDJSON, one page per chunk"""
+    first = True
+    if not ndjson:
+        yield b'['
+    try:
+        async for page in pages:
+            if ndjson:
+                yield b''.join(dumps(row) + b'\n' for row in page)
+            else:
+                # Each page is itself a JSON array; splice it without its brackets
+                encoded = dumps(page)[1:-1]
+                if encoded:
+                    yield encoded if first else b',' + encoded
+                    first = False
+    except Exception as e:
+        # Status is already sent; end the stream and leave a trace
+        REQUEST_ERRORS.inc(endpoint='history', status='stream')
+        log_event(logger, "history_stream_failed", level=logging.ERROR, error=str(e))
+        if on_error is not None:
+            on_error()
+    if not ndjson:
+        yield b']'
+
+async def _single_page(rows: List[Dict[str, Any]]) -> AsyncIterator[List[Dict[str, Any]]]:
+    yield rows
+
 @router.get("/api/anomaly/history/{user_id}")
-async def get_history(user_id: str):
+async def get_history(
+    request: Request,
+    user_id: str,
+    limit: Optional[int] = Query(None, ge=1, le=settings.HISTORY_MAX_LIMIT),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    start_date: Optional[str] = Query(None, pattern=r'^\d{4}-\d{2}-\d{2}$'),
+    end_date: Optional[str] = Query(None, pattern=r'^\d{4}-\d{2}-\d{2}$'),
+    is_anomaly: Optional[bool] = None,
+    format: str = Query('json', pattern=r'^(json|ndjson)$')
+):
+    """Stream a user's transactions with their anomaly results, newest first.
+
+    Without ``limit`` the whole matching history is streamed page by page.
+    With ``limit`` one page is returned and the ``X-Next-Cursor`` header
+    carries the cursor for the next one, if any. Responses carry a strong
+    ETag that changes whenever this user's history is written, and a request
+    whose ``If-None-Match`` still matches gets ``304 Not Modified`` without a
+    query. No ETag is sent when no history version is available.
+    """
     try:
-        response = supabase.table('transactions')\
-            .select('*, anomaly_results(*)')\
-            .eq('user_id', user_id)\
-            .order('created_at', desc=True)\
-            .execute()
-        
-        # Ensure all response data is JSON serializable
-        return serialize_for_json(response.data)
+        query_args = {
+            'user_id': user_id,
+            'select': build_select(fields, is_anomaly is not None),
+            'after': decode_cursor(cursor) if cursor else None,
+            'start_date': start_date,
+            'end_date': end_date,
+            'is_anomaly': is_anomaly
+        }
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    # Taken before querying, so the rows are at least as new as the version
+    versions = get_history_versions()
+    version = versions.current(user_id)
+    headers = {}
+    if version is not None:
+        etag = strong_etag(version, limit, cursor, fields, start_date, end_date, is_anomaly, format)
+        cached = not_modified(request.headers.get('if-none-match'), etag, 'history')
+        if cached is not None:
+            return cached
+        headers = {'ETag': etag, 'Cache-Control': REVALIDATE}
+
+    try:
+        if limit is not None:
+            # One extra row tells whether another page exists
+            rows = await fetch_history_page(limit + 1, **query_args)
+            if len(rows) > limit:
+                rows = rows[:limit]
+                headers['X-Next-Cursor'] = encode_cursor(rows[-1])
+            pages = _single_page(rows)
+        else:
+            # Fetch the first page eagerly so query errors still map to a 500
+            page_size = settings.HISTORY_PAGE_SIZE
+            first_page = await fetch_history_page(page_size, **query_args)
+            pages = iter_history_pages(first_page, page_size, **query_args)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    ndjson = format == 'ndjson'
+    return StreamingResponse(
+        # A truncated body must not be revalidated as current
+        _stream_rows(pages, ndjson, on_error=lambda: versions.bump(user_id)),
+        media_type='application/x-ndjson' if ndjson else 'application/json',
+        headers=headers
+    )
+
+@router.get("/api/anomaly/summary/{user_id}")
+async def get_category_summary(user_id: str):
+    """Per-category sum, count, mean and std over the last 7, 30 and 180 days"""
+    service = await anomaly_service()
+    try:
+        aggregates = await service.get_category_aggregates(user_id)
+    except Exception as e:
+        REQUEST_ERRORS.inc(endpoint='summary', status='500')
+        log_event(logger, "summary_failed", level=logging.ERROR, user_id=user_id, error=str(e))
+        raise HTTPException(status_code=500, detail=str(e))
+    return {
+        "user_id": user_id,
+        "as_of": date.fromordinal(aggregates.day).isoformat(),
+        "windows": aggregates.summary()
+    }
+
+@router.post("/api/anomaly/rescan/{user_id}", status_code=202)
+async def rescan_history(user_id: str, restart: bool = False):
+    """Re-score a user's whole history in the background with their current model.
+
+    Resumes from the last checkpoint unless ``restart`` is set; progress is
+    reported by the GET endpoint.
+    """
+    service = await anomaly_service()
+    from app.rescan import get_rescan_scheduler, run_rescan
+
+    async def job():
+        try:
+            return await run_rescan(user_id, restart, service.is_trainer())
+        finally:
+            # Rewritten anomaly results, even from a partial run
+            get_history_versions().bump(user_id)
+
+    try:
+        get_rescan_scheduler().submit(user_id, job)
+    except asyncio.QueueFull:
+        raise HTTPException(status_code=503, detail="Too many queued jobs", headers={"Retry-After": "5"})
+    return {"status": "queued", "user_id": user_id}
+
+@router.get("/api/anomaly/rescan/{user_id}")
+async def get_rescan_status(user_id: str):
+    """Progress of a user's last re-scan"""
+    await anomaly_service()
+    from app.rescan import rescan_status
+    state = await db.run_blocking(rescan_status, user_id, settings.RESCAN_CHECKPOINT_DIR)
+    if state is None:
+        raise HTTPException(status_code=404, detail="No re-scan for this user")
+    return state
+
+@router.post("/api/anomaly/baseline/refresh")
+async def refresh_default_baseline():
+    """Reload default_transactions into the shared baseline"""
+    service = await anomaly_service()
+    if not service.is_trainer():
+        # Only the trainer worker fits; it republishes to every worker
+        service.request_baseline_refresh()
+        return ORJSONResponse({"status": "queued"}, status_code=202)
+    try:
+        baseline = await service.publish_baseline()
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    if not baseline.rows:
+        raise HTTPException(status_code=503, detail="No default transaction data available")
+    return baseline.info()
 
 @router.get("/anomaly")
 async def anomaly_page(request: Request):
-    return templates.TemplateResponse("anomaly.html", {"request": request})
\ No newline at end of file
+    return render_page(request, "anomaly.html")
\ No newline at end of file
@@ -1,11 +1,12 @@
 from fastapi import APIRouter, HTTPException
 from fastapi.responses import RedirectResponse
 from fastapi.responses import HTMLResponse
-from fastapi.templating import Jinja2Templates
 from fastapi import Request
 from app.config import settings
 import httpx
-from app.config import supabase
+from app.config import db
+from app.pages import render_page
+from app.http_client import request_with_retry
 
 
 router = APIRouter()
@@ -27,30 +28,39 @@ def login_with_google():
     auth_url = f"{GOOGLE_AUTH_URL}?{'&'.join([f'{key}={value}' for key, value in params.items()])}"
     return RedirectResponse(auth_url)
 
+def _upsert_user(user_data: dict):
+    # Blocking Supabase call (and first-use client creation); runs on the DB pool
+    return db.client.table("users").upsert(
+        user_data,
+        on_conflict="email"  # Menggunakan email sebagai unique constraint
+    ).execute()
+
 @router.get("/callback")
 async def callback(code: str):
     try:
-        # Exchange code for token
-        async with httpx.AsyncClient() as client:
-            token_response = await client.post(
-                GOOGLE_TOKEN_URL,
-                data={
-                    "client_id": settings.GOOGLE_CLIENT_ID,
-                    "client_secret": settings.GOOGLE_CLIENT_SECRET,
-                    "redirect_uri": settings.CALLBACK_URL,
-                    "grant_type": "authorization_code",
-                    "code": code,
-                },
-            )
+        # Exchange code for token; the code is single-use, so only resend
+        # when Google never received or outright refused the request
+        token_response = await request_with_retry(
+            "POST",
+            GOOGLE_TOKEN_URL,
+            idempotent=False,
+            data={
+                "client_id": settings.GOOGLE_CLIENT_ID,
+                "client_secret": settings.GOOGLE_CLIENT_SECRET,
+                "redirect_uri": settings.CALLBACK_URL,
+                "grant_type": "authorization_code",
+                "code": code,
+            },
+        )
         token_response.raise_for_status()
         tokens = token_response.json()
 
         # Get user info
-        async with httpx.AsyncClient() as client:
-            userinfo_response = await client.get(
-                GOOGLE_USERINFO_URL,
-                headers={"Authorization": f"Bearer {tokens['access_token']}"},
-            )
+        userinfo_response = await request_with_retry(
+            "GET",
+            GOOGLE_USERINFO_URL,
+            headers={"Authorization": f"Bearer {tokens['access_token']}"},
+        )
         userinfo_response.raise_for_status()
         user_info = userinfo_response.json()
 
@@ -67,10 +77,7 @@ async def callback(code: str):
 
         # Insert atau update user ke Supabase
         try:
-            response = supabase.table("users").upsert(
-                user_data,
-                on_conflict="email"  # Menggunakan email sebagai unique constraint
-            ).execute()
+            response = await db.run_blocking(_upsert_user, user_data)
             
             if hasattr(response, 'error') and response.error:
                 raise HTTPException(
@@ -110,16 +117,13 @@ async def callback(code: str):
         )
 
 
-
-templates = Jinja2Templates(directory="app/templates")
-
 @router.get("/login-page", response_class=HTMLResponse)
 def login_page(request: Request):
-    return templates.TemplateResponse("login.html", {"request": request})
+    return render_page(request, "login.html")
 
 @router.get("/dashboard", response_class=HTMLResponse)
 def dashboard(request: Request, user_name: str = "User"):
-    return templates.TemplateResponse("dashboard.html", {"request": request, "user_name": user_name})
+    return render_page(request, "dashboard.html", user_name=user_name)
 
 @router.get("/logout", response_class=HTMLResponse)
 def logout():
@@ -0,0 +1,245 @@
+"""Tiered anomaly scoring.
+
+Every transaction first meets the statistical tier: when its z-score
+against the category mean/std is unremarkable (and, if a robust limit is
+configured, so is its robust z-score against the category median/MAD), it
+is settled as normal right there. Only the
+remaining rows reach the forest tier, which scores them with the fitted
+IsolationForest. By default that tier walks all trees at once over flat node
+arrays (:class:`FlatForest`) instead of calling ``score_samples``. A
+detector without a forest (the baseline before one is fitted) has the rest
+settled on the z-score alone.
+"""
+import math
+from typing import Any, List, Optional, Sequence
+
+import numpy as np
+from scipy.special import erf
+from sklearn.ensemble import IsolationForest
+from sklearn.preprocessing import StandardScaler
+
+from app.config import settings
+
+# A transaction within this many standard deviations of its category mean is
+# never an anomaly
+ZSCORE_NORMAL = 2.0
+# Forest confidence above which an unusual transaction is an anomaly
+CONFIDENCE_ANOMALY = 70.0
+# Without a forest, a transaction this many standard deviations from its
+# category mean is an anomaly
+ZSCORE_ANOMALY = 3.0
+# Scales MAD to a standard deviation under normality (Iglewicz and Hoaglin)
+MAD_SCALE = 0.6745
+
+
+def average_path_length(n_samples: np.ndarray) -> np.ndarray:
+    """Expected path length of an unsuccessful BST search over ``n`` points, as in scikit-learn"""
+    n_samples = np.asarray(n_samples, dtype=np.float64)
+    lengths = np.zeros_like(n_samples)
+    lengths[n_samples == 2] = 1.0
+    large = n_samples > 2
+    n = n_samples[large]
+    lengths[large] = 2.0 * (np.log(n - 1.0) + np.euler_gamma) - 2.0 * (n - 1.0) / n
+    return lengths
+
+
+class FlatForest:
+    """A fitted IsolationForest flattened into one set of node arrays.
+
+    All trees are walked level by level for all rows at once, a handful of
+    numpy operations per level, which for request-sized batches is far
+    cheaper than ``score_samples``' per-tree dispatch. Leaf routing matches
+    scikit-learn's (inputs compared as float32), so scores agree.
+    """
+
+    def __init__(self, forest: IsolationForest):
+        features, thresholds, lefts, rights, leaf_lengths, roots = [], [], [], [], [], []
+        offset = 0
+        max_depth = 0
+        for tree, tree_features in zip(forest.estimators_, forest.estimators_features_):
+            nodes = tree.tree_
+            count = nodes.node_count
+            left = nodes.children_left.astype(np.int64)
+            right = nodes.children_right.astype(np.int64)
+            leaf = left == -1
+            index = np.arange(count)
+
+            # Node depths, one level at a time from the root
+            depth = np.zeros(count, dtype=np.int64)
+            level = np.array([0])
+            while len(level):
+                level = level[~leaf[level]]
+                children = np.concatenate([left[level], right[level]])
+                depth[children] = np.concatenate([depth[level], depth[level]]) + 1
+                level = children
+
+            feature = np.asarray(tree_features)[np.where(leaf, 0, nodes.feature)]
+            features.append(feature.astype(np.int8))
+            thresholds.append(nodes.threshold.astype(np.float64))
+            # Leaves loop back to themselves, so extra levels leave rows in place
+            lefts.append((np.where(leaf, index, left) + offset).astype(np.int32))
+            rights.append((np.where(leaf, index, right) + offset).astype(np.int32))
+            leaf_lengths.append(depth + average_path_length(nodes.n_node_samples))
+            roots.append(offset)
+            offset += count
+            max_depth = max(max_depth, int(depth.max()))
+
+        self.feature = np.concatenate(features)
+        self.threshold = np.concatenate(thresholds)
+        self.left = np.concatenate(lefts)
+        self.right = np.concatenate(rights)
+        self.leaf_length = np.concatenate(leaf_lengths)
+        self.roots = np.asarray(roots, dtype=np.int32)
+        self.max_depth = max_depth
+        self.denominator = len(roots) * float(average_path_length([forest._max_samples])[0])
+
+    def score_samples(self, X: np.ndarray) -> np.ndarray:
+        """Same values as ``IsolationForest.score_samples``"""
+        X = np.asarray(X, dtype=np.float32)
+        rows = np.arange(len(X))[:, None]
+        nodes = np.broadcast_to(self.roots, (len(X), len(self.roots)))
+        for _ in range(self.max_depth):
+            go_left = X[rows, self.feature[nodes]] <= self.threshold[nodes]
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+        depths = self.leaf_length[nodes].sum(axis=1)
+        if self.denominator == 0:
+            # A single training sample: scikit-learn scores every row 2 ** -1
+            return np.full(len(X), -0.5)
+        return -(2.0 ** (-depths / self.denominator))
+
+    @property
+    def nbytes(self) -> int:
+        return sum(a.nbytes for a in (self.feature, self.threshold, self.left, self.right, self.leaf_length, self.roots))
+
+
+def standardize(scaler: StandardScaler, X: np.ndarray) -> np.ndarray:
+    """``scaler.transform`` without its input validation, same arithmetic"""
+    X = X.copy()
+    if scaler.with_mean:
+        X -= scaler.mean_
+    if scaler.with_std:
+        X /= scaler.scale_
+    return X
+
+
+class ScoringBatch:
+    """A batch being scored: inputs, and per-row outcomes as tiers settle them"""
+
+    def __init__(self, features: np.ndarray, robust_z: np.ndarray, robust_limit: float):
+        count = len(features)
+        self.features = features
+        self.z = features[:, 0]
+        self.robust_z = robust_z
+        # Rows some statistic flags as out of the ordinary
+        self.unusual = np.abs(self.z) > ZSCORE_NORMAL
+        if robust_limit > 0:
+            self.unusual |= np.abs(robust_z) > robust_limit
+        self.is_anomaly = np.zeros(count, dtype=bool)
+        self.confidence = np.zeros(count, dtype=np.float64)
+        self.tier = np.empty(count, dtype=object)
+        self.pending = np.ones(count, dtype=bool)
+
+    def settle(self, rows: np.ndarray, is_anomaly: np.ndarray, confidence: np.ndarray, tier: str) -> None:
+        self.is_anomaly[rows] = is_anomaly
+        self.confidence[rows] = confidence
+        self.tier[rows] = tier
+        self.pending[rows] = False
+
+
+class StatisticalTier:
+    """Settles rows no statistic flags as normal, without touching the model.
+
+    Their confidence is how unusual the amount is under a normal
+    distribution, ``P(|Z| < |z|)`` scaled to 0-100. This is not the forest
+    tier's scale, which is why results record the tier.
+    """
+
+    name = 'zscore'
+
+    def decide(self, detector: Any, batch: ScoringBatch) -> None:
+        rows = batch.pending & ~batch.unusual
+        if rows.any():
+            z = np.abs(batch.z[rows])
+            batch.settle(rows, False, erf(z / math.sqrt(2.0)) * 100, self.name)
+
+
+class ForestTier:
+    """Scores the remaining rows with the detector's IsolationForest"""
+
+    name = 'forest'
+
+    def __init__(self, flat: bool = True):
+        self.flat = flat
+
+    def decide(self, detector: Any, batch: ScoringBatch) -> None:
+        rows = np.flatnonzero(batch.pending)
+        if not len(rows) or detector.isolation_forest is None:
+            return
+        features = batch.features[rows]
+        if self.flat:
+            scores = detector.flat_forest().score_samples(standardize(detector.scaler, features))
+        else:
+            scores = detector.isolation_forest.score_samples(detector.scaler.transform(features))
+        # Convert to probability-like score (0-100)
+        confidence = (1 - (scores + 0.5)) * 100
+        # Anomalous only when a statistic flags the row and the forest agrees
+        is_anomaly = batch.unusual[rows] & (confidence > CONFIDENCE_ANOMALY)
+        batch.settle(rows, is_anomaly, confidence, self.name)
+
+
+class StatisticsOnlyTier:
+    """Settles what no forest could: anomalous beyond ZSCORE_ANOMALY, on the zscore tier's scale"""
+
+    name = 'zscore'
+
+    def decide(self, detector: Any, batch: ScoringBatch) -> None:
+        rows = batch.pending.copy()
+        if rows.any():
+            z = np.abs(batch.z[rows])
+            batch.settle(rows, z > ZSCORE_ANOMALY, erf(z / math.sqrt(2.0)) * 100, self.name)
+
+
+class TieredScorer:
+    """Runs a batch through ``tiers`` in order until every row is settled.
+
+    The last tier must settle whatever reaches it.
+    """
+
+    def __init__(self, tiers: Sequence[Any], robust_limit: float = 0.0):
+        self.tiers = list(tiers)
+        self.robust_limit = robust_limit
+
+    def score(self, detector: Any, features: np.ndarray, robust_z: np.ndarray) -> ScoringBatch:
+        batch = ScoringBatch(features, robust_z, self.robust_limit)
+        for tier in self.tiers:
+            if not batch.pending.any():
+                break
+            tier.decide(detector, batch)
+        return batch
+
+
+def build_scorer(fast_path: bool, robust_limit: float, flat_forest: bool) -> TieredScorer:
+    tiers: List[Any] = [StatisticalTier()] if fast_path else []
+    tiers.append(ForestTier(flat=flat_forest))
+    tiers.append(StatisticsOnlyTier())
+    return TieredScorer(tiers, robust_limit)
+
+
+def robust_zscores(amounts: np.ndarray, medians: np.ndarray, mads: np.ndarray) -> np.ndarray:
+    """``0.6745 * (x - median) / MAD``; 0 where the MAD is missing or zero"""
+    out = np.zeros_like(amounts)
+    valid = mads > 0
+    np.subtract(amounts, medians, out=out, where=valid)
+    np.divide(out * MAD_SCALE, mads, out=out, where=valid)
+    return out
+
+
+_scorer: Optional[TieredScorer] = None
+
+
+def get_scorer() -> TieredScorer:
+    """The process-wide scorer configured from settings"""
+    global _scorer
+    if _scorer is None:
+        _scorer = build_scorer(settings.SCORING_FAST_PATH, settings.SCORING_ROBUST_Z, settings.SCORING_FLAT_FOREST)
+    return _scorer
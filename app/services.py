@@ -0,0 +1,80 @@
+import asyncio
+import importlib
+import logging
+from types import ModuleType
+from typing import Optional
+
+from app.config import settings
+from app.log import get_logger, log_event
+from app.write_behind import get_write_behind
+
+logger = get_logger(__name__)
+
+# app.anomaly_service once imported and started; it pulls in numpy, pandas
+# and scikit-learn, which routes other than the anomaly API never need
+_service: Optional[ModuleType] = None
+_lock = asyncio.Lock()
+
+
+async def _start() -> ModuleType:
+    # Imported on a thread so the event loop keeps serving other routes
+    service = await asyncio.to_thread(importlib.import_module, 'app.anomaly_service')
+
+    if service.multi_worker():
+        # Elect the single trainer; it publishes the baseline for the others
+        try:
+            await service.start_coordination()
+        except Exception as e:
+            log_event(logger, "coordination_start_failed", level=logging.ERROR, error=str(e))
+    # Load the shared default_transactions baseline once for all users
+    elif settings.BASELINE_PRELOAD:
+        try:
+            await service.refresh_baseline()
+        except Exception as e:
+            log_event(logger, "baseline_preload_failed", level=logging.ERROR, error=str(e))
+    # Warm-load the most recently updated per-user models from disk
+    try:
+        await service.prewarm_detectors(settings.MODEL_PREWARM_USERS)
+    except Exception as e:
+        log_event(logger, "model_prewarm_failed", level=logging.ERROR, error=str(e))
+
+    service.get_training_scheduler().start()
+    write_behind = get_write_behind()
+    if write_behind is not None:
+        await write_behind.start()
+    return service
+
+
+async def anomaly_service() -> ModuleType:
+    """app.anomaly_service, imported and started on first use"""
+    global _service
+    if _service is not None:
+        return _service
+    async with _lock:
+        if _service is None:
+            _service = await _start()
+    return _service
+
+
+async def warm_up() -> None:
+    """Load the anomaly stack ahead of the first anomaly request"""
+    try:
+        await anomaly_service()
+    except Exception as e:
+        log_event(logger, "anomaly_warm_up_failed", level=logging.ERROR, error=str(e))
+
+
+async def stop_anomaly_services() -> None:
+    """Flush buffered writes and stop background work, if it was ever started"""
+    global _service
+    if _service is None:
+        return
+    write_behind = get_write_behind()
+    if write_behind is not None:
+        await write_behind.stop()
+    await _service.stop_coordination()
+    await _service.get_training_scheduler().stop()
+    # Cheap once the anomaly service is loaded
+    from app.rescan import stop_rescans
+    await stop_rescans()
+    _service = None
@@ -0,0 +1,109 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from app.log import get_logger, log_event
+
+logger = get_logger(__name__)
+
+Job = Callable[[], Awaitable[Any]]
+
+
+class TrainingScheduler:
+    """Deduplicating queue of per-user model jobs run by a bounded worker pool.
+
+    ``submit`` never waits for the job itself: it returns a future that
+    resolves once a worker has run it. A key (user_id) that is already queued
+    or running is not queued again; callers share the existing future.
+    """
+
+    def __init__(self, concurrency: int = 2, max_queue: int = 0):
+        self.concurrency = max(1, concurrency)
+        self.max_queue = max_queue
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._jobs: Dict[str, asyncio.Future] = {}
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.deduplicated = 0
+        self.rejected = 0
+
+    def start(self) -> None:
+        """Start the worker tasks on the running event loop"""
+        if self._workers:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._workers = [
+            asyncio.create_task(self._worker(), name=f"training-worker-{i}")
+            for i in range(self.concurrency)
+        ]
+
+    async def stop(self) -> None:
+        """Cancel the workers and fail any jobs still waiting"""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        for future in self._jobs.values():
+            if not future.done():
+                future.cancel()
+        self._jobs.clear()
+        self._queue = None
+
+    def submit(self, key: str, job: Job) -> asyncio.Future:
+        """Queue ``job`` for ``key`` unless one is already pending.
+
+        Raises asyncio.QueueFull when the queue is at capacity.
+        """
+        existing = self._jobs.get(key)
+        if existing is not None and not existing.done():
+            self.deduplicated += 1
+            return existing
+
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait((key, job, future))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise
+        self._jobs[key] = future
+        return future
+
+    async def _worker(self) -> None:
+        while True:
+            key, job, future = await self._queue.get()
+            self.running += 1
+            try:
+                result = await job()
+            except asyncio.CancelledError:
+                future.cancel()
+                raise
+            except Exception as e:
+                self.failed += 1
+                log_event(logger, "training_job_failed", level=logging.ERROR, key=key, error=str(e))
+                if not future.done():
+                    future.set_exception(e)
+                    # Nobody may be awaiting it; mark the exception as retrieved
+                    future.exception()
+            else:
+                self.completed += 1
+                if not future.done():
+                    future.set_result(result)
+            finally:
+                self.running -= 1
+                if self._jobs.get(key) is future:
+                    del self._jobs[key]
+                self._queue.task_done()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'queued': self._queue.qsize() if self._queue is not None else 0,
+            'running': self.running,
+            'completed': self.completed,
+            'failed': self.failed,
+            'deduplicated': self.deduplicated,
+            'rejected': self.rejected,
+            'concurrency': self.concurrency
+        }
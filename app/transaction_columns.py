@@ -0,0 +1,162 @@
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.category_stats import CategoryStats, RunningStats
+from app.features import N_FEATURES, fill_zscores
+
+# The categories accepted by the Transaction model, in code order; others
+# found in stored rows get the next free codes
+CATEGORIES = ('makanan berat', 'makanan ringan', 'minuman', 'PDAM', 'transportasi', 'kuota', 'lainnya')
+
+# date(1970, 1, 1).toordinal(), to turn datetime64 days into date ordinals
+EPOCH_ORDINAL = 719163
+
+
+class TransactionColumns:
+    """Compact columnar copy of transactions for model training.
+
+    Holds only what features are built from: the category as a uint8 code
+    into ``categories``, the date as an int32 day ordinal and the amount as
+    float32, 9 bytes per row. Descriptions and ids are never kept.
+    """
+
+    __slots__ = ('codes', 'days', 'amounts', 'categories')
+
+    def __init__(
+        self,
+        codes: np.ndarray,
+        days: np.ndarray,
+        amounts: np.ndarray,
+        categories: Sequence[str] = CATEGORIES
+    ):
+        self.codes = codes
+        self.days = days
+        self.amounts = amounts
+        self.categories = tuple(categories)
+
+    @classmethod
+    def empty(cls) -> 'TransactionColumns':
+        return cls(np.empty(0, dtype=np.uint8), np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32))
+
+    @classmethod
+    def from_rows(cls, rows: List[Dict[str, Any]]) -> 'TransactionColumns':
+        """Build straight from Supabase response rows (amount, category, date)"""
+        count = len(rows)
+        categories = list(CATEGORIES)
+        index = {category: code for code, category in enumerate(categories)}
+
+        def code(category: str) -> int:
+            value = index.get(category)
+            if value is None:
+                if len(categories) > np.iinfo(np.uint8).max:
+                    raise ValueError('More than 256 distinct categories')
+                value = index[category] = len(categories)
+                categories.append(category)
+            return value
+
+        codes = np.fromiter((code(row['category']) for row in rows), dtype=np.uint8, count=count)
+        amounts = np.fromiter((row['amount'] for row in rows), dtype=np.float32, count=count)
+        # ISO dates (or timestamps, cut to the date) parse to datetime64 in C
+        dates = np.array([str(row['date'])[:10] for row in rows], dtype='datetime64[D]')
+        days = (dates.astype(np.int64) + EPOCH_ORDINAL).astype(np.int32)
+        return cls(codes, days, amounts, categories)
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + self.days.nbytes + self.amounts.nbytes
+
+    def labels(self) -> np.ndarray:
+        """Category of every row as an object array"""
+        return np.asarray(self.categories, dtype=object)[self.codes]
+
+    def _recoded(self, categories: Sequence[str]) -> np.ndarray:
+        """This instance's codes translated into another category list"""
+        if tuple(categories[:len(self.categories)]) == self.categories:
+            return self.codes
+        index = {category: code for code, category in enumerate(categories)}
+        lookup = np.array([index[category] for category in self.categories], dtype=np.uint8)
+        return lookup[self.codes]
+
+    def concat(self, other: 'TransactionColumns') -> 'TransactionColumns':
+        """Rows of both, as new arrays (either side may be a read-only memory map)"""
+        categories = list(self.categories)
+        categories.extend(c for c in other.categories if c not in self.categories)
+        if len(categories) > np.iinfo(np.uint8).max + 1:
+            raise ValueError('More than 256 distinct categories')
+        return TransactionColumns(
+            np.concatenate([self.codes, other._recoded(categories)]),
+            np.concatenate([self.days, other.days]),
+            np.concatenate([self.amounts, other.amounts]),
+            categories
+        )
+
+    def _per_code(self, values: Dict[str, float]) -> np.ndarray:
+        return np.array([values.get(category, np.nan) for category in self.categories], dtype=np.float64)
+
+    def features(
+        self,
+        averages: Optional[Dict[str, float]] = None,
+        stds: Optional[Dict[str, float]] = None,
+        head: Optional[np.ndarray] = None
+    ) -> np.ndarray:
+        """Feature matrix, with z-scores from the given category statistics (0 without).
+
+        ``head`` is an already built matrix for the first rows (its z-score
+        column is ignored), so only the rows after it are featurized.
+        """
+        start = 0 if head is None else len(head)
+        features = np.empty((len(self), N_FEATURES), dtype=np.float64)
+        if head is not None:
+            features[:start, 1:] = head[:, 1:]
+
+        days = self.days[start:].astype(np.int64)
+        dates = (days - EPOCH_ORDINAL).astype('datetime64[D]')
+        features[start:, 1] = self.amounts[start:]
+        # Ordinal 1 (0001-01-01) was a Monday
+        features[start:, 2] = (days - 1) % 7 / 7
+        features[start:, 3] = ((dates - dates.astype('datetime64[M]')).astype(np.int64) + 1) / 31
+
+        features[:, 0] = 0
+        if averages is not None:
+            fill_zscores(
+                features[:, 0],
+                features[:, 1],
+                self._per_code(averages)[self.codes],
+                self._per_code(stds)[self.codes]
+            )
+        return features
+
+    def stats(self) -> CategoryStats:
+        """Exact per-category accumulators, two vectorized passes over the rows"""
+        size = len(self.categories)
+        amounts = self.amounts.astype(np.float64)
+        counts = np.bincount(self.codes, minlength=size)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            means = np.bincount(self.codes, weights=amounts, minlength=size) / counts
+        deviations = amounts - means[self.codes]
+        m2 = np.bincount(self.codes, weights=deviations * deviations, minlength=size)
+        return CategoryStats({
+            category: RunningStats(int(count), float(mean), float(squares))
+            for category, count, mean, squares in zip(self.categories, counts, means, m2)
+            if count
+        })
+
+    def robust_stats(self) -> Tuple[Dict[str, float], Dict[str, float]]:
+        """Per-category median and median absolute deviation of the amounts"""
+        amounts = self.amounts.astype(np.float64)
+        order = np.lexsort((amounts, self.codes))
+        bounds = np.cumsum(np.bincount(self.codes, minlength=len(self.categories)))
+        medians, mads = {}, {}
+        start = 0
+        for category, end in zip(self.categories, bounds.tolist()):
+            if end > start:
+                values = amounts[order[start:end]]
+                median = float(np.median(values))
+                medians[category] = median
+                mads[category] = float(np.median(np.abs(values - median)))
+            start = end
+        return medians, mads
@@ -0,0 +1,327 @@
+import asyncio
+import glob
+import logging
+import os
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+import orjson
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks, only this worker's own files are replayed
+    fcntl = None
+
+from app.config import db, settings
+from app.history import get_history_versions
+from app.log import get_logger, log_event
+from app.metrics import register_collector
+
+logger = get_logger(__name__)
+
+# (sequence number, transactions row, anomaly_results row)
+Entry = Tuple[int, Dict[str, Any], Dict[str, Any]]
+
+
+class WriteBehindFull(Exception):
+    """Raised when the buffer stays full for longer than the enqueue timeout"""
+
+
+class WriteBehindBuffer:
+    """Bounded in-process buffer that writes detect results to Supabase in bulk.
+
+    Each entry is appended to a local spill file before it is acknowledged to
+    the caller and marked done (``{"ack": seq}``) once its batch is stored, so
+    rows that were never flushed are replayed on the next start. Every
+    process writes its own ``<spill_path>.<pid>`` and holds a lock on it;
+    on start, spill files whose owner is gone are claimed and replayed too. Batches are
+    flushed when ``batch_size`` entries are waiting or ``flush_interval``
+    seconds after the first one arrived, whichever comes first. Rows carry
+    client-generated ids and are upserted, so a replayed batch that had in
+    fact been stored before a crash does not create duplicates.
+    """
+
+    def __init__(
+        self,
+        max_size: int,
+        batch_size: int,
+        flush_interval: float,
+        spill_path: str,
+        enqueue_timeout: float = 1.0,
+        fsync: bool = False
+    ):
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.spill_path = spill_path
+        self.enqueue_timeout = enqueue_timeout
+        self.fsync = fsync
+
+        self._items: Deque[Entry] = deque()
+        self._not_empty = asyncio.Event()
+        self._not_full = asyncio.Event()
+        self._not_full.set()
+        self._spill = None
+        self._spill_file: Optional[str] = None
+        self._seq = 0
+        self._task: Optional[asyncio.Task] = None
+        self._inflight: List[Entry] = []
+
+        self.enqueued = 0
+        self.flushed = 0
+        self.rejected = 0
+        self.flush_failures = 0
+        self.flush_count = 0
+        self.flush_seconds_total = 0.0
+        self.last_flush_seconds = 0.0
+
+    # Spill file
+
+    def _append(self, record: Dict[str, Any]) -> None:
+        self._spill.write(orjson.dumps(record) + b'\n')
+        self._spill.flush()
+        if self.fsync:
+            os.fsync(self._spill.fileno())
+
+    def _replay(self, path: str) -> List[Entry]:
+        """Entries written to a spill file but never acknowledged"""
+        if not os.path.exists(path):
+            return []
+        entries: Dict[int, Entry] = {}
+        acked = 0
+        with open(path, 'rb') as f:
+            for line in f:
+                try:
+                    record = orjson.loads(line)
+                except orjson.JSONDecodeError:
+                    # A torn final line from a crash mid-write
+                    continue
+                if 'ack' in record:
+                    acked = max(acked, record['ack'])
+                else:
+                    entries[record['seq']] = (record['seq'], record['transaction'], record['anomaly'])
+        return [entry for seq, entry in sorted(entries.items()) if seq > acked]
+
+    def _claim_orphans(self) -> List[Tuple[str, Any]]:
+        """Other spill files no live process holds, locked, with their open handles.
+
+        Includes a plain ``spill_path`` left by a single-process run.
+        """
+        if fcntl is None:
+            candidates = [self.spill_path]
+        else:
+            candidates = [self.spill_path] + sorted(glob.glob(glob.escape(self.spill_path) + '.*'))
+        claimed = []
+        for path in candidates:
+            if path == self._spill_file or not os.path.isfile(path):
+                continue
+            try:
+                f = open(path, 'rb')
+            except FileNotFoundError:
+                continue
+            if fcntl is not None:
+                try:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    # Its owner is alive
+                    f.close()
+                    continue
+                try:
+                    same = os.path.samestat(os.fstat(f.fileno()), os.stat(path))
+                except FileNotFoundError:
+                    same = False
+                if not same:
+                    # Another process claimed and removed it meanwhile
+                    f.close()
+                    continue
+            claimed.append((path, f))
+        return claimed
+
+    # Lifecycle
+
+    async def start(self) -> None:
+        """Replay unflushed rows from this and orphaned spill files and start flushing"""
+        if self._task is not None:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.spill_path)), exist_ok=True)
+        self._spill_file = f'{self.spill_path}.{os.getpid()}'
+        self._spill = open(self._spill_file, 'ab')
+        if fcntl is not None:
+            # Held until stop() or exit; marks the file as owned by a live process
+            fcntl.flock(self._spill.fileno(), fcntl.LOCK_EX)
+
+        # A file under our own pid is left over from an earlier process
+        pending = self._replay(self._spill_file)
+        orphans = self._claim_orphans()
+        for path, _ in orphans:
+            pending.extend(self._replay(path))
+
+        # Rewrite our file with only the rows still to be stored, renumbered
+        self._spill.truncate(0)
+        for seq, transaction, anomaly in pending:
+            self._seq += 1
+            self._append({'seq': self._seq, 'transaction': transaction, 'anomaly': anomaly})
+            self._items.append((self._seq, transaction, anomaly))
+        if orphans:
+            # The rows are in our file now, so the orphans can go
+            os.fsync(self._spill.fileno())
+            for path, f in orphans:
+                os.remove(path)
+                f.close()
+        if self._items:
+            log_event(logger, "write_behind_replay", rows=len(self._items))
+            self._not_empty.set()
+        self._task = asyncio.create_task(self._run(), name="write-behind-flusher")
+
+    async def stop(self) -> None:
+        """Flush what is buffered and close the spill file"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        # A batch interrupted mid-retry goes back to the front
+        self._items.extendleft(reversed(self._inflight))
+        self._inflight = []
+        while self._items:
+            batch = [self._items.popleft() for _ in range(min(self.batch_size, len(self._items)))]
+            if not await self._flush(batch):
+                # Left in the spill file for the next start
+                break
+        empty = os.fstat(self._spill.fileno()).st_size == 0
+        self._spill.close()
+        self._spill = None
+        if empty:
+            os.remove(self._spill_file)
+
+    # Producer side
+
+    async def enqueue(self, transaction: Dict[str, Any], anomaly: Dict[str, Any]) -> None:
+        """Buffer one transaction and its anomaly result.
+
+        Waits up to ``enqueue_timeout`` seconds for room, then raises
+        WriteBehindFull.
+        """
+        deadline = time.monotonic() + self.enqueue_timeout
+        while len(self._items) >= self.max_size:
+            self._not_full.clear()
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    raise asyncio.TimeoutError
+                await asyncio.wait_for(self._not_full.wait(), remaining)
+            except asyncio.TimeoutError:
+                self.rejected += 1
+                raise WriteBehindFull("Write-behind buffer is full")
+
+        self._seq += 1
+        self._append({'seq': self._seq, 'transaction': transaction, 'anomaly': anomaly})
+        self._items.append((self._seq, transaction, anomaly))
+        self.enqueued += 1
+        self._not_empty.set()
+
+    # Consumer side
+
+    async def _next_batch(self) -> List[Entry]:
+        await self._not_empty.wait()
+        deadline = time.monotonic() + self.flush_interval
+        while len(self._items) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            await asyncio.sleep(min(remaining, 0.05))
+
+        batch = [self._items.popleft() for _ in range(min(self.batch_size, len(self._items)))]
+        if not self._items:
+            self._not_empty.clear()
+        self._not_full.set()
+        return batch
+
+    async def _flush(self, batch: List[Entry]) -> bool:
+        """Store one batch; True on success"""
+        start = time.perf_counter()
+        try:
+            await db.upsert('transactions', [transaction for _, transaction, _ in batch], on_conflict='id')
+            await db.upsert('anomaly_results', [anomaly for _, _, anomaly in batch], on_conflict='id')
+        except Exception as e:
+            self.flush_failures += 1
+            log_event(logger, "write_behind_flush_failed", level=logging.ERROR, rows=len(batch), error=str(e))
+            return False
+
+        elapsed = time.perf_counter() - start
+        self.flush_count += 1
+        self.flush_seconds_total += elapsed
+        self.last_flush_seconds = elapsed
+        self.flushed += len(batch)
+
+        # Only now do the rows show up in history
+        versions = get_history_versions()
+        for user_id in {transaction['user_id'] for _, transaction, _ in batch}:
+            versions.bump(user_id)
+
+        self._append({'ack': batch[-1][0]})
+        if not self._items:
+            # Everything written so far is stored; start the file over
+            self._spill.truncate(0)
+        return True
+
+    async def _run(self) -> None:
+        backoff = 0.5
+        while True:
+            self._inflight = await self._next_batch()
+            while not await self._flush(self._inflight):
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30.0)
+            self._inflight = []
+            backoff = 0.5
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'depth': len(self._items),
+            'max_size': self.max_size,
+            'enqueued': self.enqueued,
+            'flushed': self.flushed,
+            'rejected': self.rejected,
+            'flush_failures': self.flush_failures,
+            'flush_count': self.flush_count,
+            'flush_seconds_total': self.flush_seconds_total,
+            'last_flush_seconds': self.last_flush_seconds
+        }
+
+
+_buffer: Optional[WriteBehindBuffer] = None
+
+
+def get_write_behind() -> Optional[WriteBehindBuffer]:
+    """The process-wide write-behind buffer, or None when the mode is off"""
+    global _buffer
+    if not settings.WRITE_BEHIND:
+        return None
+    if _buffer is None:
+        _buffer = WriteBehindBuffer(
+            max_size=settings.WRITE_BEHIND_MAX_SIZE,
+            batch_size=settings.WRITE_BEHIND_BATCH_SIZE,
+            flush_interval=settings.WRITE_BEHIND_FLUSH_INTERVAL,
+            spill_path=settings.WRITE_BEHIND_SPILL_PATH,
+            enqueue_timeout=settings.WRITE_BEHIND_ENQUEUE_TIMEOUT,
+            fsync=settings.WRITE_BEHIND_FSYNC
+        )
+    return _buffer
+
+
+def _collect_metrics():
+    """Write-behind queue depth and flush latency for /metrics"""
+    if _buffer is None:
+        return
+    stats = _buffer.stats()
+    yield ('finalyze_write_behind_depth', 'gauge', 'Rows waiting in the write-behind buffer', {}, stats['depth'])
+    yield ('finalyze_write_behind_flushed_total', 'counter', 'Rows stored by the write-behind flusher', {}, stats['flushed'])
+    yield ('finalyze_write_behind_rejected_total', 'counter', 'Rows rejected because the buffer was full', {}, stats['rejected'])
+    yield ('finalyze_write_behind_flush_failures_total', 'counter', 'Failed write-behind flushes', {}, stats['flush_failures'])
+    yield ('finalyze_write_behind_flush_seconds_total', 'counter', 'Time spent flushing write-behind batches', {}, stats['flush_seconds_total'])
+    yield ('finalyze_write_behind_flushes_total', 'counter', 'Successful write-behind flushes', {}, stats['flush_count'])
+    yield ('finalyze_write_behind_last_flush_seconds', 'gauge', 'Duration of the last write-behind flush', {}, stats['last_flush_seconds'])
+
+
+register_collector(_collect_metrics)
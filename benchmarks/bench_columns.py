@@ -0,0 +1,83 @@
+"""Memory of a user's training working set, per 10k transactions.
+
+Compares the previous representation (response rows materialized into a
+DataFrame, then a float64 feature matrix plus an object category array kept
+on the detector) with the compact TransactionColumns built straight from the
+rows, and times both builds.
+
+    python -m benchmarks.bench_columns --rows 10000
+"""
+import argparse
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+from app.transaction_columns import CATEGORIES, TransactionColumns
+
+
+def make_rows(n_rows: int, seed: int = 42):
+    """Rows shaped like the training select (amount, category, date)"""
+    rng = np.random.default_rng(seed)
+    start = date(2024, 1, 1)
+    return [
+        {
+            'amount': float(np.round(rng.lognormal(10.5, 0.8), 2)),
+            'category': CATEGORIES[int(rng.integers(len(CATEGORIES)))],
+            'date': (start + timedelta(days=int(rng.integers(0, 180)))).isoformat()
+        }
+        for _ in range(n_rows)
+    ]
+
+
+def legacy_working_set(rows):
+    """The frame, float64 feature matrix and object category array training used to keep"""
+    df = pd.DataFrame(rows)
+    dates = pd.to_datetime(df['date'], format='mixed')
+    features = np.empty((len(df), 4), dtype=np.float64)
+    features[:, 0] = 0
+    features[:, 1] = df['amount'].to_numpy(dtype=np.float64)
+    features[:, 2] = dates.dt.dayofweek.to_numpy() / 7
+    features[:, 3] = dates.dt.day.to_numpy() / 31
+    return df, features, df['category'].to_numpy(dtype=object)
+
+
+def traced(fn, *args):
+    """Result, bytes still allocated by it, peak bytes and seconds"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn(*args)
+    elapsed = time.perf_counter() - start
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, retained, peak, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=10_000)
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    per_10k = 10_000 / args.rows
+
+    (df, features, categories), _, legacy_peak, legacy_seconds = traced(legacy_working_set, rows)
+    columns, _, compact_peak, compact_seconds = traced(TransactionColumns.from_rows, rows)
+
+    # Resident per user: the DataFrame lives through training, the matrix and
+    # categories for the detector's lifetime
+    legacy_frame = int(df.memory_usage(deep=True).sum())
+    legacy_kept = features.nbytes + categories.nbytes
+    print(f"{'per 10k rows':<34} {'legacy':>12} {'compact':>12}")
+    print(f"{'training frame / columns (bytes)':<34} {legacy_frame * per_10k:>12,.0f} {columns.nbytes * per_10k:>12,.0f}")
+    print(f"{'kept on the detector (bytes)':<34} {legacy_kept * per_10k:>12,.0f} {columns.nbytes * per_10k:>12,.0f}")
+    print(f"{'peak while building (bytes)':<34} {legacy_peak * per_10k:>12,.0f} {compact_peak * per_10k:>12,.0f}")
+    print(f"{'build time (ms)':<34} {legacy_seconds * 1000 * per_10k:>12.2f} {compact_seconds * 1000 * per_10k:>12.2f}")
+    print(f"features identical apart from float32 amounts: "
+          f"{np.array_equal(features[:, 2:], columns.features()[:, 2:])}")
+
+
+if __name__ == '__main__':
+    main()
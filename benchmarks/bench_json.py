@@ -0,0 +1,101 @@
+"""Benchmark for JSON encoding of a 10k-row history payload.
+
+Compares the previous pipeline (recursive serialize_for_json followed by the
+standard library encoder) with the orjson path used by app.responses.
+
+    python -m benchmarks.bench_json
+"""
+import argparse
+import json
+import time
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+from app.responses import dumps
+
+CATEGORIES = ['makanan berat', 'makanan ringan', 'minuman', 'PDAM', 'transportasi', 'kuota', 'lainnya']
+
+
+def legacy_serialize_for_json(obj):
+    """The recursive converter previously applied to every response"""
+    if isinstance(obj, np.bool_):
+        return bool(obj)
+    elif isinstance(obj, np.integer):
+        return int(obj)
+    elif isinstance(obj, np.floating):
+        return float(obj)
+    elif isinstance(obj, (np.ndarray, list)):
+        return [legacy_serialize_for_json(item) for item in obj]
+    elif isinstance(obj, dict):
+        return {k: legacy_serialize_for_json(v) for k, v in obj.items()}
+    elif isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    return obj
+
+
+def make_history(n_rows: int, seed: int = 42):
+    """History rows shaped like the Supabase select with embedded anomaly_results"""
+    rng = np.random.default_rng(seed)
+    start = datetime(2024, 1, 1)
+    rows = []
+    for i in range(n_rows):
+        created_at = (start + timedelta(minutes=int(i))).isoformat()
+        amount = float(np.round(rng.lognormal(10.5, 0.8), 2))
+        rows.append({
+            'id': i + 1,
+            'amount': amount,
+            'date': created_at[:10],
+            'category': CATEGORIES[i % len(CATEGORIES)],
+            'description': f'transaction {i}',
+            'user_id': 'benchmark-user',
+            'created_at': created_at,
+            'anomaly_results': [{
+                'id': i + 1,
+                'transaction_id': i + 1,
+                'is_anomaly': bool(rng.random() < 0.05),
+                'confidence_score': float(rng.uniform(40, 100)),
+                'insights': {
+                    'amount_analysis': 'Pengeluaran sangat normal untuk kategori ini (rata-rata: Rp 50.000)',
+                    'timing_analysis': 'Transaksi dilakukan pada hari Senin, tanggal 1',
+                    'category_frequency': f'Kategori: {CATEGORIES[i % len(CATEGORIES)]}',
+                    'category_avg': amount
+                },
+                'detected_at': created_at
+            }]
+        })
+    return rows
+
+
+def legacy_encode(rows) -> bytes:
+    return json.dumps(legacy_serialize_for_json(rows)).encode()
+
+
+def best_of(fn, payload, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(payload)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=10_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    rows = make_history(args.rows)
+    assert json.loads(legacy_encode(rows)) == json.loads(dumps(rows))
+
+    legacy = best_of(legacy_encode, rows, args.repeat)
+    fast = best_of(dumps, rows, args.repeat)
+    print(f"rows: {args.rows:,}  payload: {len(dumps(rows)) / 1024:,.0f} KiB")
+    print(f"serialize_for_json + json.dumps: {legacy * 1000:8.2f} ms")
+    print(f"orjson (app.responses.dumps):     {fast * 1000:8.2f} ms")
+    print(f"speedup: {legacy / fast:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
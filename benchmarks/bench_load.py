@@ -0,0 +1,137 @@
+"""ASGI-level load test of the anomaly API.
+
+Drives ``/api/anomaly/detect`` and ``/api/anomaly/history/{user_id}``
+in-process through httpx's ASGI transport, with the app's lifespan running
+and Supabase replaced by the in-memory stand-in. Reports throughput and
+latency percentiles as JSON.
+
+    python -m benchmarks.bench_load --requests 2000 --concurrency 32
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import time
+from typing import Any, Callable, Dict, List
+
+import httpx
+import numpy as np
+
+os.environ.setdefault("SUPABASE_URL", "http://localhost")
+os.environ.setdefault("SUPABASE_KEY", "benchmark")
+os.environ.setdefault("MODEL_STORE_DIR", "")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from benchmarks.supabase_stub import CATEGORIES, InMemorySupabase, install, seed  # noqa: E402
+
+
+def latency_summary(latencies: List[float], errors: int, elapsed: float) -> Dict[str, Any]:
+    ms = np.asarray(latencies) * 1000
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99]) if len(ms) else (0.0, 0.0, 0.0)
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'seconds': elapsed,
+        'throughput_rps': len(latencies) / elapsed if elapsed else 0.0,
+        'p50_ms': float(p50),
+        'p95_ms': float(p95),
+        'p99_ms': float(p99),
+        'max_ms': float(ms.max()) if len(ms) else 0.0
+    }
+
+
+async def drive(
+    client: httpx.AsyncClient,
+    make_request: Callable[[int], Any],
+    requests: int,
+    concurrency: int
+) -> Dict[str, Any]:
+    """Issue ``requests`` calls from ``concurrency`` workers"""
+    counter = itertools.count()
+    latencies: List[float] = []
+    errors = 0
+
+    async def worker():
+        nonlocal errors
+        while True:
+            index = next(counter)
+            if index >= requests:
+                return
+            start = time.perf_counter()
+            response = await make_request(index)
+            # Streaming bodies count until the last byte is read
+            await response.aread()
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latency_summary(latencies, errors, time.perf_counter() - start)
+
+
+async def run(
+    requests: int = 2000,
+    concurrency: int = 32,
+    users: int = 20,
+    history_rows: int = 500,
+    history_limit: int = 100,
+    db_latency: float = 0.0
+) -> Dict[str, Any]:
+    stub = install(InMemorySupabase(latency=db_latency))
+    user_ids = [f'bench-user-{i}' for i in range(users)]
+    seed(stub, user_ids, history_rows)
+
+    from main import app
+    from app.services import anomaly_service
+
+    rng = random.Random(0)
+    today = time.strftime('%Y-%m-%d')
+
+    def detect(index: int):
+        return client.post('/api/anomaly/detect', json={
+            'amount': round(rng.lognormvariate(10.5, 0.8), 2),
+            'date': today,
+            'category': rng.choice(CATEGORIES),
+            'description': 'load test',
+            'user_id': user_ids[index % users]
+        })
+
+    def history(index: int):
+        params = {'limit': history_limit} if history_limit else {}
+        return client.get(f'/api/anomaly/history/{user_ids[index % users]}', params=params)
+
+    async with app.router.lifespan_context(app):
+        # Fit every user's model up front so the run measures the warm path
+        service = await anomaly_service()
+        for user_id in user_ids:
+            await service._train_user(user_id)
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://benchmark') as client:
+            return {
+                'detect': await drive(client, detect, requests, concurrency),
+                'history': await drive(client, history, requests, concurrency)
+            }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=2000, help='requests per endpoint')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--history-rows', type=int, default=500, help='seeded transactions per user')
+    parser.add_argument('--history-limit', type=int, default=100, help='page size, 0 streams everything')
+    parser.add_argument('--db-latency-ms', type=float, default=0.0, help='simulated Supabase round-trip')
+    args = parser.parse_args()
+    results = asyncio.run(run(
+        args.requests, args.concurrency, args.users,
+        args.history_rows, args.history_limit, args.db_latency_ms / 1000
+    ))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
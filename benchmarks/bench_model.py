@@ -0,0 +1,105 @@
+"""Benchmarks for the anomaly model at varying history sizes.
+
+Times ``AnomalyDetector.train`` against the in-memory Supabase stand-in,
+training feature building (TransactionColumns) on synthetic rows and ``analyze_transaction`` on
+the trained detectors. Prints JSON.
+
+    python -m benchmarks.bench_model --sizes 100 1000 10000
+"""
+import argparse
+import json
+import os
+import statistics
+import time
+from typing import Any, Dict, List
+
+os.environ.setdefault("SUPABASE_URL", "http://localhost")
+os.environ.setdefault("SUPABASE_KEY", "benchmark")
+os.environ.setdefault("MODEL_STORE_DIR", "")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from app.anomaly_service import AnomalyDetector  # noqa: E402
+from benchmarks.bench_prepare_features import column_features  # noqa: E402
+from benchmarks.supabase_stub import InMemorySupabase, install, make_rows, seed  # noqa: E402
+
+
+def timings(fn, repeat: int) -> List[float]:
+    """Wall-clock seconds of ``repeat`` calls"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def summarize(samples: List[float], items: int = 1) -> Dict[str, float]:
+    best = min(samples)
+    return {
+        'runs': len(samples),
+        'best_ms': best * 1000,
+        'median_ms': statistics.median(samples) * 1000,
+        'items_per_second': items / best
+    }
+
+
+def bench_train(client: InMemorySupabase, sizes: List[int], repeat: int) -> Dict[str, Any]:
+    results = {}
+    for n_rows in sizes:
+        user_id = f'bench-train-{n_rows}'
+        client.write('transactions', make_rows(n_rows, user_id, seed=n_rows))
+        results[str(n_rows)] = summarize(timings(lambda: AnomalyDetector().train(user_id), repeat), n_rows)
+    return results
+
+
+def bench_prepare_features(sizes: List[int], repeat: int) -> Dict[str, Any]:
+    results = {}
+    for n_rows in sizes:
+        rows = make_rows(n_rows, seed=n_rows)
+        results[str(n_rows)] = summarize(timings(lambda: column_features(rows), repeat), n_rows)
+    return results
+
+
+def bench_analyze(sizes: List[int], calls: int) -> Dict[str, Any]:
+    results = {}
+    transactions = make_rows(calls, 'probe', seed=7)
+    for n_rows in sizes:
+        detector = AnomalyDetector()
+        detector.train(f'bench-train-{n_rows}')
+        samples = []
+        for transaction in transactions:
+            start = time.perf_counter()
+            detector.analyze_transaction(transaction)
+            samples.append(time.perf_counter() - start)
+        samples.sort()
+        results[str(n_rows)] = {
+            'calls': calls,
+            'p50_ms': samples[len(samples) // 2] * 1000,
+            'p99_ms': samples[int(len(samples) * 0.99) - 1] * 1000,
+            'calls_per_second': calls / sum(samples)
+        }
+    return results
+
+
+def run(sizes: List[int], repeat: int = 3, calls: int = 200, default_rows: int = 1000) -> Dict[str, Any]:
+    client = install(InMemorySupabase())
+    seed(client, [], 0, default_rows=default_rows)
+    return {
+        'train': bench_train(client, sizes, repeat),
+        'prepare_features': bench_prepare_features(sizes, repeat),
+        'analyze_transaction': bench_analyze(sizes, calls)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1_000, 10_000])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--calls', type=int, default=200, help='analyze_transaction calls per size')
+    parser.add_argument('--default-rows', type=int, default=1000)
+    args = parser.parse_args()
+    print(json.dumps(run(args.sizes, args.repeat, args.calls, args.default_rows), indent=2))
+
+
+if __name__ == '__main__':
+    main()
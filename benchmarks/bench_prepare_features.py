@@ -0,0 +1,86 @@
+"""Micro-benchmark for building training features.
+
+Compares the columnar builder the detector trains with (TransactionColumns
+plus its category statistics) against the original row-by-row
+implementation, and checks both produce the same features (amounts are
+held as float32 in the columns).
+
+    python -m benchmarks.bench_prepare_features
+"""
+import argparse
+import time
+from typing import Any, Dict, List
+
+import numpy as np
+import pandas as pd
+
+from app.transaction_columns import CATEGORIES, TransactionColumns
+
+
+def make_transactions(n_rows: int, seed: int = 42) -> pd.DataFrame:
+    """Synthetic transaction history shaped like the Supabase rows"""
+    rng = np.random.default_rng(seed)
+    dates = pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 180, n_rows), unit='D')
+    return pd.DataFrame({
+        'amount': np.round(rng.lognormal(10.5, 0.8, n_rows), 2),
+        'category': rng.choice(CATEGORIES, n_rows),
+        'date': dates.strftime('%Y-%m-%d'),
+        'description': 'benchmark',
+    })
+
+
+def column_features(rows: List[Dict[str, Any]]) -> np.ndarray:
+    """Features the way training builds them: columns, then z-scores from their own statistics"""
+    columns = TransactionColumns.from_rows(rows)
+    stats = columns.stats()
+    return columns.features(stats.means(), stats.stds())
+
+
+def legacy_prepare_features(df: pd.DataFrame) -> np.ndarray:
+    """The original iterrows-based implementation, kept as the reference"""
+    category_stats = df.groupby('category')['amount'].agg(['mean', 'std']).to_dict('index')
+    category_averages = {k: v['mean'] for k, v in category_stats.items()}
+    category_std = {k: v['std'] for k, v in category_stats.items()}
+
+    features = []
+    for _, row in df.iterrows():
+        avg = category_averages.get(row['category'], row['amount'])
+        std = category_std.get(row['category'], row['amount'] * 0.1)
+        z_score = (row['amount'] - avg) / std if std > 0 else 0
+        date = pd.to_datetime(row['date'])
+        features.append([z_score, row['amount'], date.dayofweek / 7, date.day / 31])
+    return np.array(features)
+
+
+def rows_per_second(fn, data, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(data)
+        best = min(best, time.perf_counter() - start)
+    return len(data) / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1_000, 100_000, 1_000_000])
+    parser.add_argument('--legacy-max-rows', type=int, default=100_000,
+                        help='skip the slow reference implementation above this size')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'rows':>10} {'columnar rows/s':>18} {'legacy rows/s':>14} {'speedup':>8} matches")
+    for n_rows in args.sizes:
+        df = make_transactions(n_rows)
+        rows = df.to_dict('records')
+        vectorized = rows_per_second(column_features, rows, args.repeat)
+        if n_rows <= args.legacy_max_rows:
+            matches = np.allclose(column_features(rows), legacy_prepare_features(df), rtol=1e-6, atol=1e-6)
+            legacy = rows_per_second(legacy_prepare_features, df, 1)
+            print(f"{n_rows:>10,} {vectorized:>18,.0f} {legacy:>14,.0f} {vectorized / legacy:>7.1f}x {matches}")
+        else:
+            print(f"{n_rows:>10,} {vectorized:>18,.0f} {'-':>14} {'-':>8} -")
+
+
+if __name__ == '__main__':
+    main()
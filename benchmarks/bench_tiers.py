@@ -0,0 +1,97 @@
+"""Benchmark for the tiered scoring engine.
+
+Trains a detector on synthetic history from the in-memory Supabase stand-in,
+then scores fresh transactions drawn from the same distribution with each
+engine configuration. Reports the share of rows the statistical tier settles
+(forest traversals skipped), per-transaction latency on the single-request
+path, and how many decisions differ from the previous rule (forest on every
+row, anomaly iff |z| > 2 and confidence > 70). Prints JSON.
+
+    python -m benchmarks.bench_tiers --history 2000 --transactions 5000
+"""
+import argparse
+import json
+import os
+import time
+from typing import Any, Dict
+
+import numpy as np
+
+os.environ.setdefault("SUPABASE_URL", "http://localhost")
+os.environ.setdefault("SUPABASE_KEY", "benchmark")
+os.environ.setdefault("MODEL_STORE_DIR", "")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from app.anomaly_service import AnomalyDetector  # noqa: E402
+from app.scoring import CONFIDENCE_ANOMALY, ZSCORE_NORMAL, build_scorer  # noqa: E402
+from benchmarks.supabase_stub import InMemorySupabase, install, make_rows, seed  # noqa: E402
+
+CONFIGURATIONS = {
+    'forest_only_sklearn': dict(fast_path=False, robust_limit=0.0, flat_forest=False),
+    'forest_only_flat': dict(fast_path=False, robust_limit=0.0, flat_forest=True),
+    'tiered_sklearn': dict(fast_path=True, robust_limit=3.5, flat_forest=False),
+    'tiered_flat': dict(fast_path=True, robust_limit=3.5, flat_forest=True),
+    'tiered_flat_no_robust': dict(fast_path=True, robust_limit=0.0, flat_forest=True)
+}
+
+
+def legacy_decisions(detector: AnomalyDetector, features: np.ndarray) -> np.ndarray:
+    scores = detector.isolation_forest.score_samples(detector.scaler.transform(features))
+    confidence = (1 - (scores + 0.5)) * 100
+    return (np.abs(features[:, 0]) > ZSCORE_NORMAL) & (confidence > CONFIDENCE_ANOMALY)
+
+
+def run(history: int = 2000, transactions: int = 5000, single: int = 500) -> Dict[str, Any]:
+    stub = install(InMemorySupabase())
+    seed(stub, ['bench-tiers'], history)
+    detector = AnomalyDetector()
+    detector.train('bench-tiers')
+
+    rows = make_rows(transactions, 'bench-tiers', seed=1)
+    features, _, robust_z = detector._transaction_features(rows)
+    expected = legacy_decisions(detector, features)
+
+    sklearn_scores = detector.isolation_forest.score_samples(detector.scaler.transform(features))
+    flat_scores = detector.flat_forest().score_samples(
+        (features - detector.scaler.mean_) / detector.scaler.scale_
+    )
+
+    results: Dict[str, Any] = {
+        'history_rows': history,
+        'transactions': transactions,
+        'flat_forest_max_score_difference': float(np.abs(sklearn_scores - flat_scores).max()),
+        'configurations': {}
+    }
+    for name, config in CONFIGURATIONS.items():
+        scorer = build_scorer(**config)
+        batch = scorer.score(detector, features, robust_z)
+        tiers, counts = np.unique(batch.tier, return_counts=True)
+
+        # The request path scores one transaction at a time
+        start = time.perf_counter()
+        for index in range(single):
+            scorer.score(detector, features[index:index + 1], robust_z[index:index + 1])
+        per_transaction = (time.perf_counter() - start) / single
+
+        results['configurations'][name] = {
+            **config,
+            'settled_by_tier': {str(tier): int(count) for tier, count in zip(tiers, counts)},
+            'forest_traversals_skipped': float(np.mean(batch.tier == 'zscore')),
+            'single_transaction_us': per_transaction * 1e6,
+            'anomalies': int(batch.is_anomaly.sum()),
+            'decisions_changed_vs_previous_rule': int((batch.is_anomaly != expected).sum())
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--history', type=int, default=2000, help='seeded transactions for the user')
+    parser.add_argument('--transactions', type=int, default=5000, help='transactions to score')
+    parser.add_argument('--single', type=int, default=500, help='one-at-a-time scoring calls to time')
+    args = parser.parse_args()
+    print(json.dumps(run(args.history, args.transactions, args.single), indent=2))
+
+
+if __name__ == '__main__':
+    main()
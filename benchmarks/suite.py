@@ -0,0 +1,87 @@
+"""Run the model benchmarks and the ASGI load test and write one JSON report.
+
+Reports carry the git commit they were taken at, so two runs can be
+diffed to spot regressions:
+
+    python -m benchmarks.suite --output bench-$(git rev-parse --short HEAD).json
+    python -m benchmarks.suite --quick
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+from datetime import datetime, timezone
+from typing import Any, Dict
+
+os.environ.setdefault("SUPABASE_URL", "http://localhost")
+os.environ.setdefault("SUPABASE_KEY", "benchmark")
+os.environ.setdefault("MODEL_STORE_DIR", "")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+import numpy as np  # noqa: E402
+import sklearn  # noqa: E402
+
+from benchmarks import bench_load, bench_model  # noqa: E402
+
+
+def environment() -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'sklearn': sklearn.__version__
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--output', help='write the report here instead of stdout')
+    parser.add_argument('--quick', action='store_true', help='small sizes for a smoke run')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1_000, 10_000])
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--db-latency-ms', type=float, default=0.0)
+    args = parser.parse_args()
+
+    if args.quick:
+        args.sizes, args.requests = [100, 1_000], 200
+
+    config = {
+        'sizes': args.sizes,
+        'requests': args.requests,
+        'concurrency': args.concurrency,
+        'db_latency_ms': args.db_latency_ms
+    }
+    report = {
+        'environment': environment(),
+        'config': config,
+        'model': bench_model.run(args.sizes),
+        'load': asyncio.run(bench_load.run(
+            requests=args.requests,
+            concurrency=args.concurrency,
+            db_latency=args.db_latency_ms / 1000
+        ))
+    }
+
+    encoded = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(encoded + '\n')
+    else:
+        print(encoded)
+
+
+if __name__ == '__main__':
+    main()
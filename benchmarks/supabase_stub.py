@@ -0,0 +1,209 @@
+"""In-memory stand-in for the Supabase client used by app.config.
+
+Implements the part of the postgrest query builder the app calls:
+``table().select/insert/upsert/eq/gte/lte/or_/order/limit/execute``.
+Embedded ``anomaly_results(...)`` selects are joined on ``transaction_id``
+so history responses have the same shape as the real ones.
+"""
+import itertools
+import random
+import re
+import threading
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+CATEGORIES = ['makanan berat', 'makanan ringan', 'minuman', 'PDAM', 'transportasi', 'kuota', 'lainnya']
+
+_KEYSET = re.compile(r'created_at\.lt\."(.*)",and\(created_at\.eq\."(.*)",id\.lt\."(.*)"\)$')
+_EMBED = re.compile(r'anomaly_results(!inner)?\(')
+
+
+def _compare(left: Any, right: Any) -> Any:
+    """Align types the way PostgREST casts filter strings to the column type"""
+    if isinstance(left, (int, float)) and not isinstance(right, (int, float)):
+        return left, float(right)
+    return str(left), str(right)
+
+
+class Response:
+    def __init__(self, data: List[Dict[str, Any]]):
+        self.data = data
+
+
+class Query:
+    def __init__(self, store: 'InMemorySupabase', table: str):
+        self.store = store
+        self.table_name = table
+        self.columns = '*'
+        self.filters: List[Callable[[Dict[str, Any]], bool]] = []
+        self.embedded_filters: List[Callable[[Dict[str, Any]], bool]] = []
+        self.orders: List[tuple] = []
+        self.row_limit: Optional[int] = None
+        self.operation = 'select'
+        self.payload: List[Dict[str, Any]] = []
+
+    def select(self, columns: str = '*', **kwargs) -> 'Query':
+        self.columns = columns
+        return self
+
+    def _filter(self, column: str, test: Callable[[Any, Any], bool], value: Any) -> 'Query':
+        if column.startswith('anomaly_results.'):
+            field = column.split('.', 1)[1]
+            self.embedded_filters.append(lambda row: row.get(field) == value)
+            return self
+
+        def check(row):
+            if row.get(column) is None:
+                return False
+            return test(*_compare(row[column], value))
+        self.filters.append(check)
+        return self
+
+    def eq(self, column: str, value: Any) -> 'Query':
+        return self._filter(column, lambda a, b: a == b, value)
+
+    def gte(self, column: str, value: Any) -> 'Query':
+        return self._filter(column, lambda a, b: a >= b, value)
+
+    def lte(self, column: str, value: Any) -> 'Query':
+        return self._filter(column, lambda a, b: a <= b, value)
+
+    def or_(self, expression: str) -> 'Query':
+        # Only the keyset condition built by app.history is supported
+        match = _KEYSET.match(expression)
+        if match is None:
+            raise NotImplementedError(f"Unsupported or_ filter: {expression}")
+        created_at, _, row_id = match.groups()
+        self.filters.append(
+            lambda row: row['created_at'] < created_at
+            or (row['created_at'] == created_at and row['id'] < int(row_id))
+        )
+        return self
+
+    def order(self, column: str, desc: bool = False) -> 'Query':
+        self.orders.append((column, desc))
+        return self
+
+    def limit(self, count: int) -> 'Query':
+        self.row_limit = count
+        return self
+
+    def insert(self, rows: Any) -> 'Query':
+        self.operation = 'insert'
+        self.payload = rows if isinstance(rows, list) else [rows]
+        return self
+
+    def upsert(self, rows: Any, on_conflict: str = 'id') -> 'Query':
+        self.operation = 'upsert'
+        self.payload = rows if isinstance(rows, list) else [rows]
+        return self
+
+    def execute(self) -> Response:
+        if self.store.latency:
+            time.sleep(self.store.latency)
+        with self.store.lock:
+            if self.operation == 'select':
+                return Response(self._select())
+            return Response(self.store.write(self.table_name, self.payload, self.operation == 'upsert'))
+
+    def _select(self) -> List[Dict[str, Any]]:
+        rows = [row for row in self.store.rows(self.table_name) if all(f(row) for f in self.filters)]
+
+        embed = _EMBED.search(self.columns)
+        if embed is not None:
+            joined = []
+            for row in rows:
+                results = [
+                    dict(result) for result in self.store.anomalies_for(row['id'])
+                    if all(f(result) for f in self.embedded_filters)
+                ]
+                if embed.group(1) and not results:
+                    continue
+                joined.append({**row, 'anomaly_results': results})
+            rows = joined
+        else:
+            rows = [dict(row) for row in rows]
+
+        for column, desc in reversed(self.orders):
+            rows.sort(key=lambda row: row[column], reverse=desc)
+        if self.row_limit is not None:
+            rows = rows[:self.row_limit]
+        return rows
+
+
+class InMemorySupabase:
+    """Thread-safe tables of dict rows with serial integer ids.
+
+    ``latency`` adds a fixed delay (seconds) to every ``execute`` call to
+    approximate a network round-trip.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.tables: Dict[str, List[Dict[str, Any]]] = {}
+        self._by_id: Dict[str, Dict[Any, Dict[str, Any]]] = {}
+        self._anomalies_by_transaction: Dict[Any, List[Dict[str, Any]]] = {}
+        self._ids = itertools.count(1)
+
+    def table(self, name: str) -> Query:
+        return Query(self, name)
+
+    def rows(self, table: str) -> List[Dict[str, Any]]:
+        return self.tables.get(table, [])
+
+    def anomalies_for(self, transaction_id: Any) -> List[Dict[str, Any]]:
+        return self._anomalies_by_transaction.get(transaction_id, [])
+
+    def write(self, table: str, rows: List[Dict[str, Any]], upsert: bool = False) -> List[Dict[str, Any]]:
+        stored = self.tables.setdefault(table, [])
+        by_id = self._by_id.setdefault(table, {})
+        written = []
+        for row in rows:
+            row = dict(row)
+            row.setdefault('id', next(self._ids))
+            if upsert and row['id'] in by_id:
+                by_id[row['id']].update(row)
+                written.append(dict(by_id[row['id']]))
+                continue
+            stored.append(row)
+            by_id[row['id']] = row
+            if table == 'anomaly_results':
+                self._anomalies_by_transaction.setdefault(row['transaction_id'], []).append(row)
+            written.append(dict(row))
+        return written
+
+
+def make_rows(n_rows: int, user_id: Optional[str] = None, seed: int = 42, days: int = 170) -> List[Dict[str, Any]]:
+    """Synthetic transactions dated within the last ``days`` days"""
+    rng = random.Random(seed)
+    today = date.today()
+    now = datetime.utcnow()
+    rows = []
+    for i in range(n_rows):
+        row = {
+            'amount': round(rng.lognormvariate(10.5, 0.8), 2),
+            'category': rng.choice(CATEGORIES),
+            'date': (today - timedelta(days=rng.randint(0, days))).isoformat(),
+            'description': 'benchmark'
+        }
+        if user_id is not None:
+            row['user_id'] = user_id
+            row['created_at'] = (now - timedelta(seconds=n_rows - i)).isoformat()
+        rows.append(row)
+    return rows
+
+
+def seed(client: InMemorySupabase, users: List[str], rows_per_user: int, default_rows: int = 1000) -> None:
+    """Fill default_transactions and each user's transactions"""
+    client.write('default_transactions', make_rows(default_rows, seed=0))
+    for index, user_id in enumerate(users):
+        client.write('transactions', make_rows(rows_per_user, user_id, seed=index + 1))
+
+
+def install(client: InMemorySupabase) -> InMemorySupabase:
+    """Point the app's data access layer at ``client``"""
+    from app.config import db
+    db.client = client
+    return client
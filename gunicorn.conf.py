@@ -0,0 +1,35 @@
+"""Gunicorn settings for running several uvicorn workers.
+
+    gunicorn -c gunicorn.conf.py main:app
+
+Workers share fitted models and the default-data baseline through
+MODEL_STORE_DIR: the worker holding the trainer lock fits them and the
+others load the snapshots read-only (see MULTI_WORKER in app/config.py).
+"""
+import os
+import tempfile
+
+# Each worker loads the ML stack and keeps its own model registry, so the
+# default is a small fixed count rather than one per core
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+
+# Read by each worker when it imports the app; the workers share models
+# through the store
+os.environ.setdefault("MULTI_WORKER", "true")
+os.environ.setdefault("MODEL_STORE_DIR", "model_store")
+# Each worker only sees its own inserts, so category aggregates are reloaded
+os.environ.setdefault("AGGREGATE_CACHE_TTL", "60")
+# History versions are files every worker reads and bumps, so no worker
+# confirms a body that misses another worker's insert
+os.environ.setdefault("HISTORY_VERSION_DIR", os.path.join(tempfile.gettempdir(), "finalyze-history-versions"))
+# Split the single-process model registry (512 MB) and category aggregate
+# (64 MB) budgets between the workers
+os.environ.setdefault("MODEL_REGISTRY_MAX_BYTES", str(512 * 1024 * 1024 // workers))
+os.environ.setdefault("AGGREGATE_CACHE_MAX_BYTES", str(64 * 1024 * 1024 // workers))
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+worker_class = "uvicorn.workers.UvicornWorker"
+# Each worker loads the app itself, so no model state is forked from the master
+preload_app = False
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = 30
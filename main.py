@@ -1,42 +1,81 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from fastapi.staticfiles import StaticFiles
-from app.routes import auth, anomaly  # Added anomaly import
-from fastapi.responses import HTMLResponse
-from fastapi.templating import Jinja2Templates
+from fastapi.responses import HTMLResponse, PlainTextResponse
 from fastapi import Request
-from app.routes.anomaly import router as anomaly_router
-
-templates = Jinja2Templates(directory="app/templates")
+from app.routes import auth, anomaly
+from app.config import db, settings
+from app.services import stop_anomaly_services, warm_up
+from app.http_client import close_http_client, get_http_client
+from app.metrics import ServerTimingMiddleware, render_metrics
+from app.compression import CompressionMiddleware
+from app.pages import render_page
 
 from fastapi.middleware.cors import CORSMiddleware
 
-app = FastAPI()
-
-# Configure CORS
-app.add_middleware(
-    CORSMiddleware,
-    # masukkan URL yang ingin menggunakan service
-    allow_origins=["http://127.0.0.1:8000/", "https://finalyze.up.railway.app/"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-# Directly serve the index.html at the root route
-@app.get("/", response_class=HTMLResponse)
-def landing_page(request: Request):
-    return templates.TemplateResponse("index.html", {"request": request})
-
-# Dashboard route
-@app.get("/dashboard", response_class=HTMLResponse)
-def dashboard_page(request: Request):
-    return templates.TemplateResponse("dashboard.html", {"request": request})
-
-# Anomaly detection dashboard route
-@app.get("/anomaly-dashboard", response_class=HTMLResponse)
-def anomaly_dashboard(request: Request):
-    return templates.TemplateResponse("anomaly.html", {"request": request})
-
-# Register routers
-app.include_router(auth.router, prefix="/auth")
-app.include_router(anomaly_router)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # The anomaly stack (numpy, pandas, scikit-learn, models) loads in the
+    # background or on the first anomaly request; other routes never wait for it
+    warming = asyncio.create_task(warm_up()) if settings.ANOMALY_WARM_UP else None
+    # One pooled keep-alive client for outbound calls (Google OAuth)
+    get_http_client()
+    yield
+    if warming is not None:
+        warming.cancel()
+        await asyncio.gather(warming, return_exceptions=True)
+    await stop_anomaly_services()
+    await close_http_client()
+    # Release the Supabase thread pool and training processes
+    db.close()
+
+def create_app() -> FastAPI:
+    app = FastAPI(lifespan=lifespan)
+
+    # Configure CORS
+    app.add_middleware(
+        CORSMiddleware,
+        # masukkan URL yang ingin menggunakan service
+        allow_origins=["http://127.0.0.1:8000/", "https://finalyze.up.railway.app/"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+
+    # Per-stage timings of each request in a Server-Timing header
+    app.add_middleware(ServerTimingMiddleware)
+
+    # gzip/brotli for text and JSON bodies above the size threshold
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=settings.COMPRESSION_MIN_SIZE,
+        gzip_level=settings.COMPRESSION_GZIP_LEVEL,
+        brotli_quality=settings.COMPRESSION_BROTLI_QUALITY,
+    )
+
+    # Prometheus scrape endpoint
+    @app.get("/metrics", response_class=PlainTextResponse)
+    def metrics():
+        return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+    # Directly serve the index.html at the root route
+    @app.get("/", response_class=HTMLResponse)
+    def landing_page(request: Request):
+        return render_page(request, "index.html")
+
+    # Dashboard route
+    @app.get("/dashboard", response_class=HTMLResponse)
+    def dashboard_page(request: Request):
+        return render_page(request, "dashboard.html")
+
+    # Anomaly detection dashboard route
+    @app.get("/anomaly-dashboard", response_class=HTMLResponse)
+    def anomaly_dashboard(request: Request):
+        return render_page(request, "anomaly.html")
+
+    # Register routers
+    app.include_router(auth.router, prefix="/auth")
+    app.include_router(anomaly.router)
+    return app
+
+app = create_app()
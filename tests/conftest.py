@@ -0,0 +1,10 @@
+import os
+import sys
+
+# Settings are read at import time; nothing here talks to Supabase or the model store
+os.environ.setdefault("SUPABASE_URL", "http://localhost")
+os.environ.setdefault("SUPABASE_KEY", "test")
+os.environ.setdefault("MODEL_STORE_DIR", "")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,43 @@
+import asyncio
+
+import pytest
+
+import app.anomaly_service as service
+from app.baseline import build_baseline
+from app.transaction_columns import TransactionColumns
+
+DEFAULT_ROWS = [
+    {'amount': amount, 'category': 'food', 'date': '2026-05-01'}
+    for amount in (20000.0, 25000.0, 30000.0, 35000.0, 40000.0)
+]
+
+
+@pytest.fixture
+def cold_user(monkeypatch):
+    """No stored model and a baseline without a forest; records queued trainings"""
+    baseline = build_baseline(TransactionColumns.from_rows(DEFAULT_ROWS))
+
+    async def get_baseline():
+        return baseline
+
+    queued = []
+    monkeypatch.setattr(service, 'get_baseline', get_baseline)
+    monkeypatch.setattr(service, '_baseline_detector', None)
+    monkeypatch.setattr(service, '_store', None)
+    monkeypatch.setattr(service, 'schedule_training', queued.append)
+    return queued
+
+
+def test_cold_user_without_baseline_forest_is_scored_on_statistics(cold_user):
+    detector = asyncio.run(service.get_anomaly_detector('new-user'))
+
+    assert cold_user == ['new-user']
+    assert detector.shared and detector.isolation_forest is None
+    normal, unusual, extreme = detector.analyze_transactions([
+        {'amount': 31000.0, 'category': 'food', 'date': '2026-06-01'},
+        {'amount': 50000.0, 'category': 'food', 'date': '2026-06-01'},
+        {'amount': 90000.0, 'category': 'food', 'date': '2026-06-01'},
+    ])
+    assert [r['tier'] for r in (normal, unusual, extreme)] == ['zscore'] * 3
+    assert [r['is_anomaly'] for r in (normal, unusual, extreme)] == [False, False, True]
+    assert normal['confidence_score'] < unusual['confidence_score'] < extreme['confidence_score']
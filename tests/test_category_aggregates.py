@@ -0,0 +1,142 @@
+import asyncio
+import math
+from datetime import date, timedelta
+
+import numpy as np
+import pytest
+
+from app.category_aggregates import HORIZON, AggregateCache, CategoryAggregates
+
+TODAY = date(2026, 6, 1)
+
+
+def row(days_ago, category, amount):
+    return {'date': (TODAY - timedelta(days=days_ago)).isoformat(), 'category': category, 'amount': amount}
+
+
+ROWS = [
+    row(0, 'food', 10.0),
+    row(3, 'food', 30.0),
+    row(20, 'food', 50.0),
+    row(100, 'rent', 1000.0),
+    row(179, 'rent', 1200.0),
+    row(180, 'rent', 9999.0),  # already outside the horizon
+]
+
+
+def build():
+    return CategoryAggregates.from_rows(ROWS, today=TODAY.toordinal())
+
+
+def test_windows_match_direct_statistics():
+    summary = build().summary()
+
+    assert summary['7'] == {'food': {'sum': 40.0, 'count': 2, 'mean': 20.0, 'std': pytest.approx(np.std([10, 30], ddof=1))}}
+    assert summary['30']['food']['count'] == 3
+    assert summary['30']['food']['std'] == pytest.approx(np.std([10, 30, 50], ddof=1))
+    assert 'rent' not in summary['30']
+    assert summary['180']['rent'] == {'sum': 2200.0, 'count': 2, 'mean': 1100.0, 'std': pytest.approx(np.std([1000, 1200], ddof=1))}
+
+
+def test_single_row_has_no_std():
+    summary = CategoryAggregates.from_rows([row(0, 'food', 10.0)], today=TODAY.toordinal()).summary()
+    assert summary['7']['food']['std'] is None
+
+
+def test_add_matches_from_rows():
+    one_by_one = CategoryAggregates(today=TODAY.toordinal())
+    for r in ROWS:
+        one_by_one.add(r)
+    assert one_by_one.summary() == build().summary()
+
+
+def test_add_ignores_rows_beyond_horizon_and_clamps_future_dates():
+    aggregates = CategoryAggregates(today=TODAY.toordinal())
+    aggregates.add(row(HORIZON, 'food', 5.0))
+    assert aggregates.version == 0
+    assert aggregates.summary()['180'] == {}
+
+    aggregates.add(row(-2, 'food', 5.0))
+    assert aggregates.summary()['7']['food']['count'] == 1
+
+
+def test_advance_expires_days_out_of_each_window():
+    aggregates = build()
+
+    aggregates.advance(TODAY.toordinal() + 5)
+    summary = aggregates.summary()
+    # The row from 3 days ago is now 8 days old; the one from 179 days ago has rolled off
+    assert summary['7'] == {'food': {'sum': 10.0, 'count': 1, 'mean': 10.0, 'std': None}}
+    assert summary['180']['rent']['count'] == 1
+
+    # Expired cells are reused for new days without carrying old totals
+    aggregates.add(row(-5, 'rent', 700.0))
+    assert aggregates.summary()['7']['rent'] == {'sum': 700.0, 'count': 1, 'mean': 700.0, 'std': None}
+
+    aggregates.advance(TODAY.toordinal() + 5 + HORIZON)
+    assert aggregates.summary() == {'7': {}, '30': {}, '180': {}}
+
+
+def test_advance_backwards_is_a_no_op():
+    aggregates = build()
+    version = aggregates.version
+    aggregates.advance(TODAY.toordinal() - 1)
+    assert aggregates.day == TODAY.toordinal()
+    assert aggregates.version == version
+
+
+def test_stats_merge_like_running_statistics():
+    stats = build().stats(30)
+    food = stats.get('food')
+    assert food.count == 3
+    assert food.mean == pytest.approx(30.0)
+    assert food.std == pytest.approx(np.std([10, 30, 50], ddof=1))
+    assert math.isnan(stats.get('rent').std)
+
+
+def test_cache_shares_concurrent_loads_and_evicts_least_recent():
+    loads = []
+
+    async def loader(user_id):
+        loads.append(user_id)
+        await asyncio.sleep(0.01)
+        return CategoryAggregates()
+
+    async def run():
+        cache = AggregateCache(loader, max_users=2)
+        first, second = await asyncio.gather(cache.get('u1'), cache.get('u1'))
+        assert first is second
+        await cache.get('u2')
+        await cache.get('u1')
+        await cache.get('u3')
+        await cache.get('u2')
+        return cache.stats()
+
+    stats = asyncio.run(run())
+    assert loads == ['u1', 'u2', 'u3', 'u2']
+    assert stats['users'] == 2
+    assert stats['hits'] == 1
+
+
+def test_cache_is_bounded_by_bytes():
+    async def loader(user_id):
+        return CategoryAggregates.from_rows(
+            [row(0, f'{user_id}-{i}', 1.0) for i in range(2)], today=TODAY.toordinal()
+        )
+
+    user_bytes = asyncio.run(loader('u0')).nbytes
+
+    async def run():
+        cache = AggregateCache(loader, max_users=100, max_bytes=user_bytes * 2)
+        for user_id in ('u1', 'u2', 'u3'):
+            await cache.get(user_id)
+        # A new category grows u3's arrays, which is noticed on the next lookup
+        aggregates = await cache.get('u3')
+        aggregates.add(row(0, 'new', 1.0))
+        await cache.get('u3')
+        return cache.stats()
+
+    stats = asyncio.run(run())
+    assert stats['users'] == 1
+    assert stats['evictions'] == 2
+    assert stats['bytes'] == user_bytes * 3 // 2
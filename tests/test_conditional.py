@@ -0,0 +1,36 @@
+from app.conditional import coded_etag, etag_matches, not_modified, strong_etag
+
+
+def test_strong_etag_depends_on_every_part():
+    etag = strong_etag('v1', 50, None)
+    assert etag.startswith('"') and etag.endswith('"')
+    assert etag == strong_etag('v1', 50, None)
+    assert etag != strong_etag('v2', 50, None)
+    assert etag != strong_etag('v1', 50, 'cursor')
+
+
+def test_coded_etag_marks_strong_tags_only():
+    assert coded_etag('"abc"', 'gzip') == '"abc-gzip"'
+    assert coded_etag('W/"abc"', 'gzip') == 'W/"abc"'
+
+
+def test_etag_matches():
+    etag = '"abc"'
+    assert not etag_matches(None, etag)
+    assert not etag_matches('', etag)
+    assert etag_matches('*', etag)
+    assert etag_matches('"abc"', etag)
+    assert etag_matches('"other", "abc"', etag)
+    assert not etag_matches('"other"', etag)
+    # Weak comparison, and a compressed representation revalidates the same body
+    assert etag_matches('W/"abc"', etag)
+    assert etag_matches('"abc-gzip"', etag)
+    assert etag_matches('"abc-br"', coded_etag(etag, 'gzip'))
+    assert not etag_matches('"abc-zstd"', etag)
+
+
+def test_not_modified():
+    assert not_modified('"other"', '"abc"', 'history') is None
+    response = not_modified('"abc"', '"abc"', 'history')
+    assert response.status_code == 304
+    assert response.headers['etag'] == '"abc"'
@@ -0,0 +1,22 @@
+from app.database import Database
+
+
+def test_training_falls_back_to_threads_without_process_pool(monkeypatch):
+    database = Database(lambda: None, max_workers=2, cpu_workers=1)
+
+    def unavailable(max_workers):
+        raise OSError(38, 'Function not implemented')
+
+    monkeypatch.setattr(database, 'process_pool', unavailable)
+    try:
+        assert database.cpu_executor is database.io_executor
+    finally:
+        database.close()
+
+
+def test_zero_training_processes_use_the_thread_pool():
+    database = Database(lambda: None, max_workers=2, cpu_workers=0)
+    try:
+        assert database.cpu_executor is database.io_executor
+    finally:
+        database.close()
@@ -0,0 +1,65 @@
+import os
+
+import pytest
+
+from app.history import (
+    HistoryVersions, SharedHistoryVersions, build_select, decode_cursor, encode_cursor
+)
+
+
+def test_cursor_round_trip():
+    row = {'created_at': '2026-06-01T12:00:00.123+00:00', 'id': 42, 'amount': 10}
+    cursor = encode_cursor(row)
+    assert '=' not in cursor
+    assert decode_cursor(cursor) == ('2026-06-01T12:00:00.123+00:00', 42)
+
+
+@pytest.mark.parametrize('cursor', ['', 'not base64!', 'bm90IGpzb24', 'WzFd'])
+def test_malformed_cursor_is_rejected(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+
+def test_build_select_defaults_to_everything():
+    assert build_select(None, False) == '*, anomaly_results(*)'
+    assert build_select(None, True) == '*, anomaly_results!inner(*)'
+
+
+def test_build_select_projects_fields_and_keeps_cursor_columns():
+    assert build_select('amount, category', False) == 'id, amount, category, created_at'
+    assert build_select('amount,anomaly_results', False) == 'id, amount, created_at, anomaly_results(*)'
+    # Filtering on anomalies needs the inner join even when they are not requested
+    assert build_select('amount', True) == 'id, amount, created_at, anomaly_results!inner(is_anomaly)'
+
+
+def test_build_select_rejects_unknown_fields():
+    with pytest.raises(ValueError, match='password'):
+        build_select('amount,password', False)
+
+
+def test_local_versions_change_on_bump():
+    versions = HistoryVersions(ttl=0, max_users=10)
+    first = versions.current('u1')
+    assert versions.current('u1') == first
+    versions.bump('u1')
+    assert versions.current('u1') != first
+
+
+def test_shared_versions_see_other_workers_bumps(tmp_path):
+    directory = str(tmp_path / 'versions')
+    reader, writer = SharedHistoryVersions(directory), SharedHistoryVersions(directory)
+
+    first = reader.current('u1')
+    assert first is not None
+    assert writer.current('u1') == first
+    assert reader.current('u2') != first
+
+    writer.bump('u1')
+    assert reader.current('u1') not in (None, first)
+    assert not [name for name in os.listdir(directory) if name.endswith('.tmp')]
+
+
+def test_shared_versions_without_directory_send_no_etag():
+    versions = SharedHistoryVersions(None)
+    versions.bump('u1')
+    assert versions.current('u1') is None
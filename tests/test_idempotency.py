@@ -0,0 +1,135 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import app.idempotency as idempotency
+from app.idempotency import IdempotencyCache, IdempotencyConflict, request_fingerprint, request_key
+
+TRANSACTION = {
+    'user_id': 'u1',
+    'amount': 25.0,
+    'date': '2026-06-01',
+    'category': 'food',
+    'description': 'lunch'
+}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Controllable monotonic clock for the cache's expiry checks"""
+    now = SimpleNamespace(value=1000.0)
+    monkeypatch.setattr(idempotency, 'time', SimpleNamespace(monotonic=lambda: now.value))
+    return now
+
+
+def counted(result):
+    calls = []
+
+    async def fn():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return result
+
+    return fn, calls
+
+
+def test_keys_are_scoped_to_the_user():
+    other_user = {**TRANSACTION, 'user_id': 'u2'}
+    assert request_key(TRANSACTION, 'abc') != request_key(other_user, 'abc')
+    assert request_key(TRANSACTION) == request_fingerprint(TRANSACTION)
+    # An integer and a float amount are the same transaction
+    assert request_fingerprint({**TRANSACTION, 'amount': 25}) == request_fingerprint(TRANSACTION)
+    assert request_fingerprint({**TRANSACTION, 'amount': 26.0}) != request_fingerprint(TRANSACTION)
+
+
+def test_repeat_is_replayed_until_ttl(clock):
+    cache = IdempotencyCache(ttl=60, max_entries=10)
+    fn, calls = counted({'id': 1})
+
+    async def run():
+        assert await cache.run('k', fn) == ({'id': 1}, False)
+        assert await cache.run('k', fn) == ({'id': 1}, True)
+        clock.value += 61
+        assert await cache.run('k', fn) == ({'id': 1}, False)
+
+    asyncio.run(run())
+    assert len(calls) == 2
+    assert cache.stats()['replayed'] == 1
+
+
+def test_concurrent_repeats_share_one_run(clock):
+    cache = IdempotencyCache(ttl=60, max_entries=10)
+    fn, calls = counted({'id': 1})
+
+    async def run():
+        return await asyncio.gather(*(cache.run('k', fn) for _ in range(5)))
+
+    results = asyncio.run(run())
+    assert len(calls) == 1
+    assert sorted(replayed for _, replayed in results) == [False, True, True, True, True]
+
+
+def test_failures_are_not_cached(clock):
+    cache = IdempotencyCache(ttl=60, max_entries=10)
+    attempts = []
+
+    async def flaky():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise ConnectionError('database unavailable')
+        return {'id': 1}
+
+    async def run():
+        with pytest.raises(ConnectionError):
+            await cache.run('k', flaky)
+        return await cache.run('k', flaky)
+
+    assert asyncio.run(run()) == ({'id': 1}, False)
+    assert cache.stats()['running'] == 0
+
+
+def test_key_reused_for_another_request_conflicts(clock):
+    cache = IdempotencyCache(ttl=60, max_entries=10)
+    fn, calls = counted({'id': 1})
+    other = request_fingerprint({**TRANSACTION, 'amount': 99.0})
+
+    async def run():
+        await cache.run('k', fn, request_fingerprint(TRANSACTION))
+        with pytest.raises(IdempotencyConflict):
+            await cache.run('k', fn, other)
+        # The original request still replays
+        return await cache.run('k', fn, request_fingerprint(TRANSACTION))
+
+    assert asyncio.run(run()) == ({'id': 1}, True)
+    assert len(calls) == 1
+    assert cache.stats()['conflicts'] == 1
+
+
+def test_key_reused_while_running_conflicts(clock):
+    cache = IdempotencyCache(ttl=60, max_entries=10)
+    fn, calls = counted({'id': 1})
+
+    async def run():
+        first = asyncio.ensure_future(cache.run('k', fn, 'a'))
+        await asyncio.sleep(0)
+        with pytest.raises(IdempotencyConflict):
+            await cache.run('k', fn, 'b')
+        return await first
+
+    assert asyncio.run(run()) == ({'id': 1}, False)
+
+
+def test_oldest_entries_are_dropped_past_max_entries(clock):
+    cache = IdempotencyCache(ttl=60, max_entries=2)
+
+    async def run():
+        for key in ('a', 'b', 'c'):
+            fn, _ = counted(key)
+            await cache.run(key, fn)
+        fn, calls = counted('a')
+        await cache.run('a', fn)
+        return calls
+
+    assert len(asyncio.run(run())) == 1
+    assert cache.stats()['entries'] == 2
@@ -0,0 +1,27 @@
+import os
+
+from app.model_store import ModelStore
+
+
+def test_recent_users_skips_the_baseline(tmp_path):
+    store = ModelStore(str(tmp_path))
+    for i, user_id in enumerate(('u1', 'u2', 'u3')):
+        store.save(user_id, {'rows': i})
+        meta_path = store._paths(user_id)[1]
+        os.utime(meta_path, (1000 + i, 1000 + i))
+    # The newest snapshot of all
+    store.save_baseline({'rows': 0})
+
+    assert store.recent_users(2) == ['u3', 'u2']
+    assert store.recent_users(10) == ['u3', 'u2', 'u1']
+
+
+def test_recent_users_skips_unreadable_metadata_without_losing_a_slot(tmp_path):
+    store = ModelStore(str(tmp_path))
+    store.save('u1', {'rows': 1})
+    os.utime(store._paths('u1')[1], (1000, 1000))
+    store.save('u2', {'rows': 2})
+    with open(store._paths('u2')[1], 'w') as f:
+        f.write('{torn')
+
+    assert store.recent_users(1) == ['u1']
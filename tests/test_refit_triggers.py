@@ -0,0 +1,104 @@
+from datetime import date, timedelta
+
+import pytest
+
+from app.anomaly_service import AnomalyDetector
+from app.category_aggregates import CategoryAggregates
+from app.config import settings
+
+TODAY = date(2026, 6, 1)
+
+
+@pytest.fixture(autouse=True)
+def thresholds(monkeypatch):
+    monkeypatch.setattr(settings, 'REFIT_ROW_THRESHOLD', 5)
+    monkeypatch.setattr(settings, 'REFIT_DRIFT_THRESHOLD', 0.5)
+
+
+def transaction(amount, category='food', days_ago=0):
+    return {'amount': amount, 'category': category, 'date': (TODAY - timedelta(days=days_ago)).isoformat()}
+
+
+def fitted_detector(rows):
+    """A detector as left by a fit on ``rows``, and the user's aggregates"""
+    aggregates = CategoryAggregates.from_rows(rows, today=TODAY.toordinal())
+    detector = AnomalyDetector()
+    detector.trained = True
+    detector.sync_statistics(aggregates)
+    detector._fit_averages = dict(detector.category_averages)
+    detector._fit_std = dict(detector.category_std)
+    return detector, aggregates
+
+
+def food_detector():
+    """Fitted on food amounts around 20 (std 10)"""
+    return fitted_detector([transaction(amount) for amount in (10.0, 20.0, 30.0)])
+
+
+def observe(detector, aggregates, row):
+    """What the detect routes do once a transaction is stored"""
+    aggregates.add(row)
+    detector.observe(row, aggregates)
+
+
+def test_stale_after_row_threshold():
+    detector, aggregates = food_detector()
+    for _ in range(4):
+        observe(detector, aggregates, transaction(20.0))
+        assert not detector.stale
+    observe(detector, aggregates, transaction(20.0))
+    assert detector.stale
+    assert detector.rows_since_fit == 5
+    assert len(detector._pending_rows) == 5
+
+
+def test_small_moves_do_not_trigger_a_refit():
+    detector, aggregates = food_detector()
+    observe(detector, aggregates, transaction(25.0))
+    assert detector.category_averages['food'] == pytest.approx(21.25)
+    assert not detector.stale
+
+
+def test_stale_when_category_mean_drifts():
+    detector, aggregates = food_detector()
+    # Mean moves from 20 to 40, two fitted standard deviations
+    observe(detector, aggregates, transaction(100.0))
+    assert detector.category_averages['food'] == pytest.approx(40.0)
+    assert detector.stale
+
+
+def test_unseen_category_counts_as_drift():
+    detector, aggregates = food_detector()
+    observe(detector, aggregates, transaction(50.0, category='travel'))
+    assert detector.stale
+
+
+def test_category_rolled_out_of_the_window_is_not_drift():
+    detector, aggregates = fitted_detector(
+        [transaction(100.0, 'rent', days_ago=179), transaction(120.0, 'rent', days_ago=179)]
+        + [transaction(amount) for amount in (10.0, 20.0, 30.0)]
+    )
+    aggregates.advance(TODAY.toordinal() + 1)
+    observe(detector, aggregates, transaction(20.0, days_ago=-1))
+    assert 'rent' not in detector.category_averages
+    assert not detector._drifted('rent')
+    assert not detector.stale
+
+
+def test_statistics_are_only_recomputed_when_aggregates_change():
+    detector, aggregates = food_detector()
+    averages = detector.category_averages
+    detector.sync_statistics(aggregates)
+    assert detector.category_averages is averages
+    aggregates.add(transaction(40.0))
+    detector.sync_statistics(aggregates)
+    assert detector.category_averages['food'] == pytest.approx(25.0)
+
+
+def test_shared_detectors_are_never_updated():
+    detector, aggregates = food_detector()
+    detector.shared = True
+    for _ in range(10):
+        observe(detector, aggregates, transaction(1000.0))
+    assert detector.rows_since_fit == 0
+    assert not detector.stale
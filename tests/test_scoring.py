@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+from sklearn.ensemble import IsolationForest
+
+from app.scoring import FlatForest
+
+
+def fitted_forest(X, **params):
+    return IsolationForest(n_estimators=50, random_state=42, **params).fit(X)
+
+
+@pytest.mark.parametrize('rows', [2, 3, 50, 256, 1000])
+def test_flat_forest_matches_score_samples(rows):
+    rng = np.random.default_rng(rows)
+    X = np.column_stack([rng.normal(size=rows), rng.lognormal(size=rows), rng.integers(0, 12, rows)])
+    forest = fitted_forest(X)
+    # Unseen rows, including outliers far past every threshold
+    queries = np.vstack([X, rng.normal(scale=5, size=(200, 3))])
+
+    np.testing.assert_allclose(FlatForest(forest).score_samples(queries), forest.score_samples(queries), rtol=1e-12)
+
+
+def test_flat_forest_matches_subsampled_forest():
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(500, 3))
+    forest = fitted_forest(X, max_samples=64, max_features=2)
+    queries = rng.normal(scale=3, size=(300, 3))
+
+    np.testing.assert_allclose(FlatForest(forest).score_samples(queries), forest.score_samples(queries), rtol=1e-12)
+
+
+def test_single_sample_fit_scores_like_scikit_learn():
+    forest = fitted_forest(np.array([[1.0, 2.0, 3.0]]))
+    queries = np.random.default_rng(1).normal(size=(10, 3))
+
+    expected = forest.score_samples(queries)
+    np.testing.assert_array_equal(expected, -0.5)
+    np.testing.assert_array_equal(FlatForest(forest).score_samples(queries), expected)
@@ -0,0 +1,122 @@
+import asyncio
+import os
+
+import orjson
+import pytest
+
+import app.write_behind as write_behind
+from app.write_behind import WriteBehindBuffer
+
+
+class FakeDatabase:
+    """Records upserted transaction ids; fails while ``down`` is set"""
+
+    def __init__(self):
+        self.stored = []
+        self.down = False
+
+    async def upsert(self, table, rows, on_conflict=None):
+        if self.down:
+            raise ConnectionError('database unavailable')
+        if table == 'transactions':
+            self.stored.extend(row['id'] for row in rows)
+
+
+@pytest.fixture
+def database(monkeypatch):
+    fake = FakeDatabase()
+    monkeypatch.setattr(write_behind, 'db', fake)
+    return fake
+
+
+def entry(i):
+    return {'id': i, 'user_id': 'u1'}, {'id': f'a{i}', 'transaction_id': i}
+
+
+def write_spill(path, records):
+    with open(path, 'wb') as f:
+        for record in records:
+            f.write(orjson.dumps(record) + b'\n')
+
+
+def spilled(seq, i):
+    transaction, anomaly = entry(i)
+    return {'seq': seq, 'transaction': transaction, 'anomaly': anomaly}
+
+
+def new_buffer(path):
+    return WriteBehindBuffer(max_size=100, batch_size=10, flush_interval=0.01, spill_path=path)
+
+
+async def drain(database, expected):
+    for _ in range(200):
+        if len(database.stored) >= expected:
+            return
+        await asyncio.sleep(0.01)
+
+
+def test_replay_skips_acknowledged_and_torn_lines(tmp_path):
+    path = str(tmp_path / 'spill')
+    write_spill(path, [spilled(1, 1), spilled(2, 2), {'ack': 2}, spilled(3, 3)])
+    with open(path, 'ab') as f:
+        f.write(b'{"seq": 4, "transac')
+
+    assert [e[1]['id'] for e in new_buffer(path)._replay(path)] == [3]
+
+
+def test_restart_after_crash_replays_unflushed_rows(tmp_path, database):
+    path = str(tmp_path / 'spill')
+
+    async def crash():
+        database.down = True
+        buffer = new_buffer(path)
+        await buffer.start()
+        for i in range(3):
+            await buffer.enqueue(*entry(i))
+        await asyncio.sleep(0.05)
+        # Die without stop(): the flusher is gone, the rows only in the spill file
+        buffer._task.cancel()
+        await asyncio.gather(buffer._task, return_exceptions=True)
+        buffer._spill.close()
+
+    async def restart():
+        database.down = False
+        buffer = new_buffer(path)
+        await buffer.start()
+        assert [e[1]['id'] for e in buffer._items] == [0, 1, 2]
+        await drain(database, 3)
+        await buffer.stop()
+
+    asyncio.run(crash())
+    assert database.stored == []
+    asyncio.run(restart())
+    assert database.stored == [0, 1, 2]
+    # Everything stored: the drained spill file is removed
+    assert os.listdir(tmp_path) == []
+
+
+def test_start_claims_orphans_but_not_live_workers_files(tmp_path, database):
+    fcntl = pytest.importorskip('fcntl')
+    path = str(tmp_path / 'spill')
+    write_spill(f'{path}.999999', [spilled(1, 1), {'ack': 1}, spilled(2, 2)])
+    write_spill(f'{path}.888888', [spilled(1, 9)])
+    write_spill(path, [spilled(1, 5)])
+
+    # Another worker is alive and holds its file
+    live = open(f'{path}.888888', 'rb')
+    fcntl.flock(live.fileno(), fcntl.LOCK_EX)
+
+    async def run():
+        buffer = new_buffer(path)
+        await buffer.start()
+        assert sorted(e[1]['id'] for e in buffer._items) == [2, 5]
+        await drain(database, 2)
+        await buffer.stop()
+
+    try:
+        asyncio.run(run())
+    finally:
+        live.close()
+
+    assert sorted(database.stored) == [2, 5]
+    assert os.listdir(tmp_path) == ['spill.888888']